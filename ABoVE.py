@@ -7,85 +7,38 @@ ABoVE data from CMR
 ##############################################################################
 """
 
-import json
-import requests
+from functools import partial
+import numpy as np
 import pandas as pd
 
-from shapely.geometry import shape, mapping, box
-from shapely.ops import cascaded_union
+from shapely.geometry import shape
+from shapely.ops import unary_union
 
-try:
-    import _pickle as pickle
-except ModuleNotFoundError:
-    import pickle
+# the tables load from data/ the first time a search needs them; see
+#   catalog.py for the tables and searches, without any of the widgets
+from catalog import catalog
+from cache import ResultCache
+from timing import timings
+from lod import round_coordinates
+from coverage import get_colors
+from linkage import get_center, split_bounds
 
 # path to above-stm
 #repo = "/home/jack/Desktop/git/above-stm/"
 repo = "./"
 
-"""
-------------------------------------------------------------------------------
-Data required by ABoVE Collections/Granules notebook
-------------------------------------------------------------------------------
-"""
-
-# Open a pickled data frame with all ABoVE datasets info required by notebook
-with open(repo+'data/above_dataset_table.pkl', 'rb') as input:
-    dataset_table = pickle.load(input)
-
-# Make a smaller version of the table that is referenced after interactions
-dataset_locator_table = dataset_table[[
-    "title",
-    "conceptid",
-    "short_name",
-    "bounds_shapely",
-    "start_time",
-    "end_time",
-    "minlon",
-    "maxlon",
-    "minlat",
-    "maxlat",
-    "url_sdat",
-    "url_thredds",
-    "science_keywords"
-]]
-
-# Open the same type of pickled data frame for with all ABoVE granules
-with open(repo+'data/above_granules_table.pkl', 'rb') as input:
-    above_granules_table = pickle.load(input)
-
-# And make a smaller version of it too
-granule_locator_table = above_granules_table[[
-    "collection_short_name",
-    "conceptid",
-    "granuleid",   
-    "bounds_shapely",
-    "start_time",
-    "end_time",
-    "minlon",
-    "maxlon",
-    "minlat",
-    "maxlat",
-    "granule_params",
-    "url_datapool"
-]]
-
-# Open a VERY IMPORTANT TABLE that links datasets and granules to ABoVE grid
-#   This table takes quite some time to produce so don't delete by mistake
-with open(repo+'data/above_grid_table_ab.pkl', 'rb') as input:
-    above_grid_table = pickle.load(input)
-
 
 """
 ##############################################################################
 
-App data  
+App data
 
 ##############################################################################
 """
 
 import qgrid
-from ipywidgets import HTML, Layout, HBox, VBox, Textarea, Output, Accordion
+from ipywidgets import HTML, Layout, HBox, VBox, Output, Accordion,\
+    DatePicker, Button, Dropdown, ToggleButton, Text
 from ipyleaflet import Map,\
     LayerGroup,\
     DrawControl,\
@@ -101,10 +54,6 @@ UI elements
 ------------------------------------------------------------------------------
 """
 
-#load a basemap from ESRI #basemaps.NASAGIBS.ModisTerraTrueColorCR
-#esri = basemap_to_tiles(basemaps.Esri.DeLorme)
-esri = basemap_to_tiles(basemaps.Esri.WorldImagery)
-
 # map draw poly styling
 draw_style = {"shapeOptions": {
     "fillColor": "white",
@@ -112,80 +61,62 @@ draw_style = {"shapeOptions": {
     "opacity": 0.5,
     "fillOpacity": 0.5}}
 
-geojson_label = HTML("<h4><b> or paste your GeoJSON: </b>0</h4>")
-
-geojson_text = Textarea(
-    placeholder='Paste GeoJSON string here.',
-    disabled=False,
-    layout=Layout(width="50%", height="200px"))
-
-
-# the above grid; make layers later
-gridf = "data/ABoVE_240m_30m_5m_grid_tiles/ABoVE_240m_30m_5m_grid_tiles.json"
-with open(repo+gridf, 'r') as file:
-    above_grid = json.load(file)
-
 
 def get_results_header(text):
     """ """
     return(HTML("<p style='line-height: 1.2;'>"+text+"</b></p>"))
 
 
-dataset_results_header = get_results_header((
+dataset_results_text = (
     "The following datasets have bounding boxes that intersect "
     "the selected ABoVE Grid cell(s). Note: Several datasets' "
     "metadata extents span the grid's full coverage area and "
     "will be returned no matter which cells are selected. <br>"
-    "<br><b>Click a dataset's row to browse its granules:"))
+    "<br><b>Click a dataset's row to browse its granules:")
 
-granules_results_header = get_results_header((
+granules_results_text = (
     "The granules in the table below have bounding boxes that "
     "intersect the selected ABoVE Grid cell(s). An empty table "
     "indicates that the publication process is likely in progress. "
     "<br><br><b>Select a granule (or a list of granules with "
     "Ctrl+Click or Ctrl+Shift) to display spatial coverages on "
-    "the map:</b>"))
+    "the map:</b>")
+
+instructions_text = (
+    "<p><b>Select one or more grid cells by clicking the cell on the map"
+    ", or by drawing a polygon with one of the tools on the left.</b></p>")
 
 
 """
 ------------------------------------------------------------------------------
 Cell class is part of the link between the map's ABoVE grid polygons and the
 dataset and granule locator tables. This class stores some information about
-each ABoVE grid cell that is useful for current and future search 
+each ABoVE grid cell that is useful for current and future search
 functionality.
 ------------------------------------------------------------------------------
 """
 
 
 class Cell(object):
-    """ """
+    """
+    A record for one grid cell. The map draws all of the cells of a level
+    as one GeoJSON layer (see get_cells_layer), so there's no widget here.
+    """
+
+    __slots__ = ("feat", "shape", "prop", "id", "level", "on")
 
     offstyle = {"fill_opacity": 0, "color": "white", "weight": 0.75}
     onstyle = {"fill_opacity": 0.4, "color": "lightgreen", "weight": 1}
 
     def __init__(self, feat):
-        """Inits with id,lat,lon; makes request string, map point."""
+        """Inits with the cell's GeoJSON feature."""
 
         self.feat = feat
         self.shape = shape(feat["geometry"])
 
         self.prop = feat["properties"]
-        self.feat["properties"]["style"] = {
-            "fill_opacity": 0.1,
-            "opacity": 0.1, 
-            "color": "white", 
-            "weight": 0.75}
         self.id = self.prop["grid_id"]
         self.level = self.prop["grid_level"]
-        
-        self.layer = GeoJSON(
-            data=self.feat,
-            hover_style = {
-                "weight": 1, 
-                "color": "white",
-                "fillColor": "white",
-                "fillOpacity": 0.3})
-        self.layer.on_click(self.toggle)
         self.on = False
 
     def toggle(self, **kwargs):
@@ -193,68 +124,149 @@ class Cell(object):
         self.on = False if self.on else True
 
 
+# grid cell styling
+cell_style = {
+    "fillOpacity": 0.1,
+    "opacity": 0.1,
+    "color": "white",
+    "weight": 0.75}
+
+cell_hover_style = {
+    "weight": 1,
+    "color": "white",
+    "fillColor": "white",
+    "fillOpacity": 0.3}
+
+# cell corners are sent to the map to about a metre, at most; the A and B
+#   cells come from catalog.grid_lod at the map's zoom when there is one
+cell_decimals = 5
+
+# cells colored by their granules (see coverage.py) are cell_style with a
+#   fillColor and this
+coverage_style = {"fillOpacity": 0.5}
+
+# study domain styling
+domain_style = {
+    "weight": 0.75,
+    "color": "#FFFFFF",
+    "fillColor": "#FFFFFF",
+    "fillOpacity": 0.}
+
+
+def get_grid_index(grid_lod, zoom):
+    """
+    {grid_id: GeoJSON geometry} of the cells drawn at zoom (see lod.py);
+    empty if there are no levels of detail.
+    """
+    if grid_lod is None:
+        return({})
+    return(grid_lod.get_index(zoom, "grid_id"))
+
+
+def get_cell_geometry(cell, index):
+    """A cell's geometry from index, or its own with rounded corners."""
+    if cell.id in index:
+        return(index[cell.id])
+    return({"type": cell.feat["geometry"]["type"],
+            "coordinates": round_coordinates(
+                cell.feat["geometry"]["coordinates"], cell_decimals)})
+
+
+def get_cells_layer(cells, on_click, index=None):
+    """
+    Takes Cells; returns one GeoJSON layer that draws them all, with the
+    geometries of index (see get_grid_index) where it has them. on_click
+    gets the clicked cell's grid_id and grid_level, the only properties
+    that are sent to the map besides their style, as the properties keyword.
+
+    The style is each feature's, not the layer's, which would win over it
+    (see get_colored_geojson).
+    """
+    index = index or {}
+    layer = GeoJSON(
+        data={"type": "FeatureCollection", "features": [{
+            "type": "Feature",
+            "geometry": get_cell_geometry(cell, index),
+            "properties": {"grid_id": cell.id, "grid_level": cell.level,
+                           "style": cell_style}
+        } for cell in cells]},
+        hover_style=cell_hover_style)
+    layer.on_click(on_click)
+    return(layer)
+
+
+def get_relevelled_geojson(data, index):
+    """
+    Returns a copy of the cells layer's data with the geometries of index
+    (see get_grid_index); the properties, so the colors, are shared.
+    """
+    return({"type": "FeatureCollection", "features": [
+        {**feature, "geometry": index.get(
+            feature["properties"]["grid_id"], feature["geometry"])}
+        for feature in data["features"]]})
+
+
+def get_colored_geojson(data, colors):
+    """
+    Returns a copy of the cells layer's data (see get_cells_layer) with each
+    cell filled in its color; None leaves a cell in cell_style. Only the
+    properties are new; the geometries are shared.
+    """
+    features = []
+    for feature, color in zip(data["features"], colors):
+        style = cell_style if color is None else {
+            **cell_style, **coverage_style, "fillColor": color}
+        features.append({**feature, "properties": {
+            **feature["properties"], "style": style}})
+    return({"type": "FeatureCollection", "features": features})
+
+
+def get_domain_geojson(domain, zoom):
+    """The study domain drawn at zoom (see lod.py); empty if there's none."""
+    if domain is None:
+        return({"type": "FeatureCollection", "features": []})
+    return(domain.get_geojson(zoom))
+
+
 """
 ------------------------------------------------------------------------------
 Functions for selecting from the dataset and granule *_locator_table(s)
 ------------------------------------------------------------------------------
 """
 
-dfsel = lambda df, sel, val: df.loc[df[sel]==val]
-dflistsel = lambda df, sel, lst: df.loc[df[sel].isin(lst)]
 
 def get_by_tiles(tile_list, search):
-    """ """
-    
-    ix_with_duplicates = []        
-    shapelies = []
-    
-    if search=="datasets":
-        locator_table = dataset_locator_table
-        ixcolumn = "dataset_locator_ix"
-
-    if search=="granules":
-        locator_table = granule_locator_table
-        ixcolumn = "granule_locator_ix" #indices
-
-    for tile in tile_list:
-        tilerow = dfsel(above_grid_table, "grid_id", tile)
-        rowix = tilerow[ixcolumn].tolist()
-        try:
-            ix_with_duplicates.extend(rowix[0])
-            shapelies.append(tilerow["bounds_shapely"].item())
-        except:
-            pass
-
-    ix = list(set(ix_with_duplicates))
-    table = locator_table.iloc[ix]
-
-    return((table, shapelies))
+    """See Catalog.get_by_tiles."""
+    return(catalog.get_by_tiles(tile_list, search))
 
 
 """
 ------------------------------------------------------------------------------
-Functions for generating qgrid tables and reacting to table clicks
+Functions for generating qgrid tables and map layers
 ------------------------------------------------------------------------------
 """
 
 dataset_column_definitions = {
     "title": {"width": 600},
-    "start_time": {"width": 150}, 
+    "start_time": {"width": 150},
     "end_time": {"width": 150}}
 
 granule_column_definitions = {
     "granuleid": {"width": 700}}
 
+dataset_columns = ["title", "start_time", "end_time"]
+
+granule_columns = ["granuleid", "start_time", "end_time", "url_datapool"]
+
 
 def get_qgrid(df, index, column_definitions, grid_options):
-    """ 
+    """
     Generates a qgrid table with some customization for either
     datasets or granules.
     """
-    
-    df.set_index(index, inplace=True)
+
     table = qgrid.show_grid(
-        df,
+        df.set_index(index),
         column_definitions=column_definitions,
         grid_options=grid_options,
         show_toolbar=False)
@@ -262,353 +274,588 @@ def get_qgrid(df, index, column_definitions, grid_options):
     return(table)
 
 
-# ---------------------------------------------------------------------------
+class ResultsTable(object):
+    """
+    A results table that pages through rows ix of a locator table. Only the
+    page on screen is given to qgrid, and so sent to the browser; sorting
+    and filtering happen here, on the index array, so a selection of tens
+    of thousands of granules costs no more to show than a page of them.
+
+    With facets (an indexes.FacetIndex over the table's rows), a dropdown
+    lists the values in the selection with their counts, from the facet
+    bitmaps, and filters the rows to one of them.
+    """
+
+    def __init__(self, table, ix, columns, column_definitions, grid_options,
+                 on_select, page_size=100, facets=None):
+        self.table = table
+        self.ix = np.asarray(ix)
+        self.columns = columns
+        self.index = columns[0]
+        self.page_size = page_size
+        self.facets = facets
+
+        # the rows left by the filter, in the sort order; and the page shown
+        self.view = self.ix
+        self.page = 0
+
+        # qgrid's own sorting and filtering would only see the one page
+        self.grid = get_qgrid(self.get_page(), self.index, column_definitions, {
+            **grid_options, "sortable": False, "filterable": False})
+        # on_select gets this table, which knows the rows on the page
+        self.grid.on("selection_changed",
+                     lambda event, widget: on_select(event, self))
+
+        self.previous = Button(icon="chevron-left", layout=Layout(width="40px"))
+        self.next = Button(icon="chevron-right", layout=Layout(width="40px"))
+        self.label = HTML()
+        self.sort_by = Dropdown(
+            options=[("Sort by", None)]+[(c, c) for c in columns],
+            layout=Layout(width="150px"))
+        self.descending = ToggleButton(
+            description="Descending", layout=Layout(width="100px"))
+        self.search = Text(
+            placeholder="Filter by "+self.index, continuous_update=False)
+        self.facet = Dropdown(options=[("All parameters", None)]+[
+            ("%s (%s)" % (name, "{:,}".format(count)), name) for name, count
+            in ([] if facets is None else facets.get_counts(self.ix).items())],
+            layout=Layout(width="250px"))
+
+        self.previous.on_click(lambda button: self.show(self.page-1))
+        self.next.on_click(lambda button: self.show(self.page+1))
+        for widget in [self.sort_by, self.descending, self.search, self.facet]:
+            widget.observe(self.update_view, "value")
+
+        controls = [self.previous, self.label, self.next,
+                    self.sort_by, self.descending, self.search]
+        if facets is not None:
+            controls.append(self.facet)
+        self.ui = VBox([HBox(controls), self.grid])
+        self.update_label()
+
+    @property
+    def pages(self):
+        """ """
+        return(max(1, -(-len(self.view)//self.page_size)))
+
+    def get_view(self, text=None, column=None, descending=False, facet=None):
+        """
+        Returns the rows of ix whose index column contains text (ignoring
+        case) and that have the facet value, sorted by column; missing
+        values sort last.
+        """
+        ix = self.ix
+
+        if facet is not None:
+            ix = ix[self.facets.get_mask(ix, [facet])]
+
+        if text:
+            values = pd.Series(self.table[self.index].values[ix])
+            ix = ix[values.str.contains(
+                text, case=False, regex=False).fillna(False).values]
+
+        if column is not None:
+            values = pd.Series(self.table[column].values[ix], index=ix)
+            ix = values.sort_values(
+                ascending=not descending, kind="stable").index.values
+
+        return(ix)
+
+    def get_page(self):
+        """Returns the page of the locator table that's shown."""
+        start = self.page*self.page_size
+        rows = self.view[start:start+self.page_size]
+        return(self.table.iloc[rows][self.columns])
+
+    def get_selected_ix(self):
+        """The rows of the locator table selected on the page shown."""
+        start = self.page*self.page_size
+        rows = self.view[start:start+self.page_size]
+        return(rows[np.asarray(self.grid.get_selected_rows(), dtype=np.int64)])
+
+    def get_selected_df(self):
+        """ """
+        return(self.grid.get_selected_df())
+
+    def show(self, page):
+        """Shows a page of the view, if there is one."""
+        if 0 <= page < self.pages and page!=self.page:
+            self.page = page
+            self.grid.df = self.get_page().set_index(self.index)
+            self.update_label()
+
+    def update_view(self, *args):
+        """Filters and sorts again, from the controls; shows the first page."""
+        self.view = self.get_view(
+            self.search.value, self.sort_by.value, self.descending.value,
+            self.facet.value)
+        self.page = 0
+        self.grid.df = self.get_page().set_index(self.index)
+        self.update_label()
+
+    def update_label(self):
+        """ """
+        start = min(self.page*self.page_size, len(self.view))
+        end = min(start+self.page_size, len(self.view))
+        self.label.value = "%s-%s of %s" % (
+            "{:,}".format(start+(end>start)), "{:,}".format(end),
+            "{:,}".format(len(self.view)))
+
 
 # granule selections box styling
 granules_box_style = {
     "fill_opacity": 0.1,
     "fill_color": "orange",
-    "opacity": 1, 
-    "color": "white", 
+    "opacity": 1,
+    "color": "white",
     "weight": 1}
 
-
-def get_map_poly_from_shapely(shapely_poly, style):
-    """Takes an input shapely geometry; returns ipyleaflet poly layer."""
-    x,y = shapely_poly.exterior.coords.xy
-    return(Polygon(locations=list(zip(y,x)), **style))
-
-
-# def get_sum_txt():
-#     """ """
-
-
-
-def handle_granule_table_select(event, qgrid_widget):
-    """
-    Handles interactions with the granules table.
-    """
-    selected_grans.clear_layers()
-
-    # get the short name of the dataset from the dataset_locator_table
-    rowdf = qgrid_widget.get_selected_df()
-    ixlist = rowdf.index.tolist()
-    granules = dflistsel(granule_locator_table, "granuleid", ixlist)
-
-    shapes = []
-    for index, granule in granules.iterrows():
-        shapely_box = granule["bounds_shapely"]
-        gran = get_map_poly_from_shapely(shapely_box, granules_box_style)
-        selected_grans.add_layer(gran)
-        shapes.append(shapely_box)
-    
-    union = cascaded_union(shapes)
-    centroid = union.centroid
-    mapw.center = (centroid.y, centroid.x)
-    
-    # get the bounding box that contains all selected granules
-    allbnds = {"minx": granules["minlon"].min(),
-               "miny": granules["minlat"].min(),
-               "maxx": granules["maxlon"].max(),
-               "maxy": granules["maxlat"].max()}
-
-# ---------------------------------------------------------------------------
+# the same, for GeoJSON layers (Leaflet's path options)
+granules_geojson_style = {
+    "fillOpacity": 0.1,
+    "fillColor": "orange",
+    "opacity": 1,
+    "color": "white",
+    "weight": 1}
 
 # dataset selections grid styling
 datasets_grid_style = {
     "fill_opacity": 0.1,
-    "opacity": 1, 
-    "color": "white", 
+    "opacity": 1,
+    "color": "white",
     "fill_color": "purple",
     "weight": 1}
 
 
-def handle_dataset_table_select(event, qgrid_widget):
-    """
-    Selects granules for the selected dataset; then, calls
-    function to generate qgrid table for granules when
-    a dataset is selected in the datasets table.
-    """
-
-    output_containers.selected_index = 1
-
-    # get the short name of the dataset from the dataset_locator_table
-    rowdf = qgrid_widget.get_selected_df()
-    dataset = dfsel(dataset_locator_table, "title", rowdf.index[0])
-    short_name = dataset["short_name"].item()
-
-    # get the dataset's granules by indexing with the short_name
-    granules = dfsel(
-        granule_locator_table, 
-        "collection_short_name", 
-        short_name)
-    granules1 = granules[[
-        "granuleid", 
-        "start_time",
-        "end_time",
-        "url_datapool"]]
-    
-    granules_qgrid = get_qgrid(
-        granules1, 
-        "granuleid", 
-        granule_column_definitions,
-        {'forceFitColumns': False, "maxVisibleRows": 15})
-    granules_qgrid.on("selection_changed", handle_granule_table_select)
-
-    output_granules.clear_output()
-    with output_granules:
-        display(granules_results_header)
-        display(granules_qgrid)    
-
-
-def update_rendered_dataset_table(dataset_selection_table):
-    """ """
-
-    # make new qgrids
-    datasets_qgrid = get_qgrid(
-        dataset_selection_table, 
-        "title", 
-        dataset_column_definitions,
-        {"forceFitColumns": False, "maxVisibleRows": 8})
-    datasets_qgrid.on("selection_changed", handle_dataset_table_select)
-
-    output_containers.selected_index = 0    
-    output_datasets.clear_output()
-    with output_datasets:
-        display(dataset_results_header)
-        display(datasets_qgrid)
-
-
-def update_rendered_granule_table(granule_selection_table):
-    """ """
-
-    # make new qgrids
-    granules_qgrid = get_qgrid(
-        granule_selection_table, 
-        "granuleid", 
-        granule_column_definitions,
-        {"forceFitColumns": False, "maxVisibleRows": 15})
-    granules_qgrid.on("selection_changed", handle_granule_table_select)
-
-    output_granules.clear_output()
-    with output_granules:
-        display(granules_results_header)
-        display(granules_qgrid)
-
-
-"""
-------------------------------------------------------------------------------
-Functions for handing the "cell-clicked" and "poly-drawn" map interactions.
-------------------------------------------------------------------------------
-"""
+def get_map_poly_from_shapely(shapely_poly, style):
+    """Takes an input shapely geometry; returns ipyleaflet poly layer."""
+    x,y = shapely_poly.exterior.coords.xy
+    return(Polygon(locations=list(zip(y,x)), **style))
 
 
-def get_selection_polygon(locations, style):
-    """ """
-    return(Polygon(locations=list(zip(y,x)), **style))
+def get_boxes_geojson(bounds):
+    """
+    Takes an (N, 4) array of minlon, minlat, maxlon, maxlat; returns a
+    GeoJSON FeatureCollection of the boxes, made in one pass over the array.
+    Boxes across the antimeridian are MultiPolygons (see split_bounds).
+    """
+    parts, owner = split_bounds(bounds)
+    w, s, e, n = parts.T
+    rings = np.stack([w, s, e, s, e, n, w, n, w, s], axis=1).reshape(-1, 5, 2)
 
+    polygons = [[[ring]] for ring in rings[:len(bounds)].tolist()]
+    for row, ring in zip(owner[len(bounds):], rings[len(bounds):].tolist()):
+        polygons[row].append([ring])
 
-def update_cell_clicked(*args, **kwargs):
-    """ """
-    draw_control.clear()
-    selected_grans.clear_layers()
-
-    if "properties" in kwargs.keys():
-        on = kwargs["properties"]["grid_id"]
-
-        if output_containers.selected_index==0:
-
-            # get datasets with bboxes that intersect cell
-            selections, shapelies = get_by_tiles([on], "datasets")
-            selections1 = selections[["title", "start_time", "end_time"]]
-            style1 = datasets_grid_style
-            function1 = update_rendered_dataset_table
-
-        if output_containers.selected_index==1:
-
-            # get granules with bboxes that intersect cell
-            selections, shapelies = get_by_tiles([on], "granules")
-            selections1 = selections[[
-                "granuleid", 
-                "start_time",
-                "end_time",
-                "url_datapool"]]
-            style1 = granules_box_style
-            function1 = update_rendered_granule_table
-
-        # make layer that represents selected cell, add to selected_layer
-        selected_layer.clear_layers()
-        poly = get_map_poly_from_shapely(shapelies[0], style1)
-
-        selected_layer.add_layer(poly)
-        # x,y = shapelies[0].exterior.coords.xy
-        # selected_layer.add_layer(Polygon(
-        #     locations=list(zip(y,x)), 
-        #     **datasets_grid_style))
-        centroid = shapelies[0].centroid
-        mapw.center = (centroid.y, centroid.x)
-        mapw.zoom = 6
-
-        # render new results tables
-        function1(selections1)
-
-
-def update_poly_drawn(*args, **kwargs):
-    """ """
-  
-    draw_control.clear()                       # clear draw, selection layers
-    selected_grans.clear_layers()
-
-    if "geo_json" in kwargs.keys():
-       
-        drawn_json = kwargs["geo_json"]        # make shapely from geojson 
-        shapely_geom = shape(drawn_json["geometry"])
-        cells = grid_dict
-
-        # iterate over cells and collect intersecting cells
-        on, shapes = [], []
-        for id, cell in cells.items():
-            if shapely_geom.intersects(cell.shape):
-                on.append(id)
-                shapes.append(cell.shape)
-    
-        # get the union of all of the cells that are toggled on
-        union = cascaded_union(shapes)
-        centroid = union.centroid
-
-        # make layer that represents selected cells and add to selected_layer
-        selected_layer.clear_layers()
-        poly = get_map_poly_from_shapely(union, datasets_grid_style)
-        selected_layer.add_layer(poly)
-        # x,y = union.exterior.coords.xy
-        # selected_layer.add_layer(Polygon(
-        #     locations=list(zip(y,x)), 
-        #     **datasets_grid_style))
-        mapw.center = (centroid.y, centroid.x)
-        mapw.zoom = 4
-
-        # --------------------------------------------------------------------
-        if output_containers.selected_index==0:
-
-            # get datasets with bboxes that intersect cell
-            selections, shapelies = get_by_tiles(on, "datasets")
-            selections1 = selections[["title", "start_time", "end_time"]]
-            style1 = datasets_grid_style
-            function1 = update_rendered_dataset_table
-
-        if output_containers.selected_index==1:
-
-            # get granules with bboxes that intersect cell
-            selections, shapelies = get_by_tiles(on, "granules")
-            selections1 = selections[[
-                "granuleid", 
-                "start_time",
-                "end_time",
-                "url_datapool"]]
-            style1 = granules_box_style
-            function1 = update_rendered_granule_table
-
-        # render new results tables
-        function1(selections1)
-
-        # --------------------------------------------------------------------
-
-        # get datasets and display table(s)
-        #datasets, shapelies = get_by_tiles(on, "datasets")
-        #datasets1 = datasets[["title", "start_time", "end_time"]]
-
-        # render new results tables
-        #update_rendered_dataset_table(datasets1)
-
-    else:
-        
-        pass
+    return({"type": "FeatureCollection", "features": [{
+        "type": "Feature",
+        "properties": {},
+        "geometry": {"type": "Polygon", "coordinates": p[0]} if len(p)==1
+            else {"type": "MultiPolygon", "coordinates": p}
+    } for p in polygons]})
 
 
 """
 ##############################################################################
 
-App initialize
+App
 
 ##############################################################################
 """
 
-# generate map grid polygon layers
-grid_layers = LayerGroup()
-grid_dict = {}
-
-for feat in above_grid["features"]:
-    level = feat["properties"]["grid_level"]
-    if level=="B":
-        Cell_object = Cell(feat) 
-        Cell_object.layer.on_click(update_cell_clicked)
-        grid_id = Cell_object.id
-        grid_dict[grid_id] = Cell_object
-        grid_layers.add_layer(grid_dict[grid_id].layer)
-
-# make an attribute that will hold selected layer
-selected_layer = LayerGroup()
-selected_grans = LayerGroup()
-
-mapw = Map(
-    layers=(esri, grid_layers, selected_layer, selected_grans, ),
-    center=(65, -100), 
-    zoom=3, 
-    width="auto", 
-    height="auto",
-    scroll_wheel_zoom=True)
-
-# map draw controls
-draw_control = DrawControl()
-draw_control.polyline =  {}
-draw_control.circle = {}
-draw_control.circlemarker = {}
-draw_control.remove = False
-draw_control.edit = False
-draw_control.polygon = {**draw_style}
-draw_control.rectangle = {**draw_style}
-draw_control.on_draw(update_poly_drawn)
-mapw.add_control(draw_control)
-
-
-# output displays
-output_datasets = Output(layout=Layout(width="auto", height="auto"))
-output_granules = Output(layout=Layout(width="auto", height="auto"))
-output_containers = Accordion(children=[output_datasets, output_granules])
-output_containers.set_title(0, 'CMR Datasets')
-output_containers.set_title(1, 'CMR Granules')
-output_containers.selected_index = 0
-with output_datasets:
-    display(HTML(
-        "<p><b>Select one or more grid cells by clicking the cell on the map"
-        ", or by drawing a polygon with one of the tools on the left.</b></p>"
-    ))
-with output_granules:
-    display(HTML(
-        "<p><b>Select one or more grid cells by clicking the cell on the map"
-        ", or by drawing a polygon with one of the tools on the left.</b></p>"
-    ))
-
-def update_container(*args, **kwargs):
-    """ 
-    This makes sure granule layers are removed when dataset tab is reopened.
+
+class App(object):
+    """
+    The ABoVE grid map and the dataset/granule results tables. Nothing is
+    built until an App is made; see launch.
     """
-    if output_containers.selected_index==0:
-        selected_grans.clear_layers()
-    elif output_containers.selected_index==1:
-        pass                                       # placeholder
-    else:
-        pass
-output_containers.observe(update_container)
 
-# make the widget layout
-ui = VBox([
-    #map_header, 
-    mapw,
-    output_containers,
-], layout=Layout(width="auto"))
+    def __init__(self, catalog=catalog):
+
+        self.catalog = catalog
+
+        # results tables already made, by query; clicking back to a cell
+        #   shows its table again instead of making a new one
+        self.tables = ResultCache(self.catalog.get_version, max_items=16)
+
+        #load a basemap from ESRI #basemaps.NASAGIBS.ModisTerraTrueColorCR
+        #esri = basemap_to_tiles(basemaps.Esri.DeLorme)
+        esri = basemap_to_tiles(basemaps.Esri.WorldImagery)
+
+        self.dataset_results_header = get_results_header(dataset_results_text)
+        self.granules_results_header = get_results_header(granules_results_text)
+
+        # generate the map grid layer; clicks come back with the cell's
+        #   properties, so its grid_id, from the feature
+        self.grid_dict = {}
+        for feat in self.catalog.get_grid_features("B"):
+            Cell_object = Cell(feat)
+            self.grid_dict[Cell_object.id] = Cell_object
+
+        self.grid_level = None if self.catalog.grid_lod is None else \
+            self.catalog.grid_lod.get_level(3)
+        self.cells_layer = get_cells_layer(
+            self.grid_dict.values(), self.update_cell_clicked,
+            get_grid_index(self.catalog.grid_lod, 3))
+        self.grid_layers = LayerGroup(layers=(self.cells_layer, ))
+
+        # the C cells of the last B cell clicked, if the grid table has C
+        self.child_layers = LayerGroup()
+
+        # the study domain, simplified for the zoom; see update_zoom
+        self.domain_layer = GeoJSON(
+            data=get_domain_geojson(self.catalog.domain, 3), style=domain_style)
+
+        # make an attribute that will hold selected layer
+        self.selected_layer = LayerGroup()
+        self.selected_grans = LayerGroup()
+
+        self.mapw = Map(
+            layers=(esri, self.domain_layer, self.grid_layers,
+                    self.child_layers, self.selected_layer,
+                    self.selected_grans, ),
+            center=(65, -100),
+            zoom=3,
+            width="auto",
+            height="auto",
+            scroll_wheel_zoom=True)
+        self.mapw.observe(self.update_zoom, "zoom")
+
+        # map draw controls
+        self.draw_control = DrawControl()
+        self.draw_control.polyline =  {}
+        self.draw_control.circle = {}
+        self.draw_control.circlemarker = {}
+        self.draw_control.remove = False
+        self.draw_control.edit = False
+        self.draw_control.polygon = {**draw_style}
+        self.draw_control.rectangle = {**draw_style}
+        self.draw_control.on_draw(self.update_poly_drawn)
+        self.mapw.add_control(self.draw_control)
+
+        # time window for searches; a blank date leaves that end open
+        self.start_picker = DatePicker(description="From:")
+        self.end_picker = DatePicker(description="To:")
+
+        # words to find in the datasets' titles, short names and keywords
+        self.keywords = Text(
+            description="Keywords:", placeholder="e.g. permafrost",
+            continuous_update=False)
+
+        # the cells are colored by their granules of a collection, or of
+        #   all of them, in the time window (see update_coverage)
+        coverage = self.catalog.coverage
+        self.coverage = Dropdown(
+            description="Coverage:", options=[("All collections", None)]+[
+                ("%s (%s)" % (name, "{:,}".format(count)), name) for name, count
+                in ([] if coverage is None else coverage.get_totals().sort_index(
+                    ).items()) if count>0],
+            layout=Layout(width="350px"))
+        self.coverage_label = HTML()
+        for widget in [self.start_picker, self.end_picker, self.coverage]:
+            widget.observe(self.update_coverage, "value")
+
+        self.time_window = HBox(
+            [self.start_picker, self.end_picker, self.keywords,
+             self.coverage, self.coverage_label])
+
+        # output displays
+        self.output_datasets = Output(layout=Layout(width="auto", height="auto"))
+        self.output_granules = Output(layout=Layout(width="auto", height="auto"))
+        self.output_containers = Accordion(children=[
+            self.output_datasets,
+            self.output_granules])
+        self.output_containers.set_title(0, 'CMR Datasets')
+        self.output_containers.set_title(1, 'CMR Granules')
+        self.output_containers.selected_index = 0
+        with self.output_datasets:
+            display(HTML(instructions_text))
+        with self.output_granules:
+            display(HTML(instructions_text))
+        self.output_containers.observe(self.update_container)
+
+        self.update_coverage()
+
+        # make the widget layout
+        self.ui = VBox([
+            #map_header,
+            self.mapw,
+            self.time_window,
+            self.output_containers,
+        ], layout=Layout(width="auto"))
+
+    # ------------------------------------------------------------------------
+    # reacting to table clicks
+
+    @timings.timed()
+    def handle_granule_table_select(self, event, results):
+        """
+        Handles interactions with the granules table (a ResultsTable).
+        """
+        self.selected_grans.clear_layers()
+
+        # the selected rows of the granule locator table, from the page
+        rows = results.get_selected_ix()
+        timings.stage("select", len(rows))
+
+        # one layer for all of the boxes, straight from the bbox columns
+        bounds = self.catalog.granules.get_bounds(rows)
+        bounds = bounds[np.isfinite(bounds).all(axis=1)]
+        if len(bounds)==0:
+            return
+
+        self.selected_grans.add_layer(GeoJSON(
+            data=get_boxes_geojson(bounds),
+            style=granules_geojson_style))
+        timings.stage("map", len(bounds))
+
+        # center on the box that holds all of the selected granules
+        self.mapw.center = get_center(bounds)
+
+    @timings.timed()
+    def handle_dataset_table_select(self, event, results):
+        """
+        Selects granules for the selected dataset; then, calls
+        function to generate qgrid table for granules when
+        a dataset is selected in the datasets table.
+        """
+
+        self.output_containers.selected_index = 1
+
+        # get the short name of the dataset from the dataset_locator_table
+        rowdf = results.get_selected_df()
+        if len(rowdf)==0:
+            return
+        dataset = self.catalog.get_dataset(rowdf.index[0], "title")
+        short_name = dataset["short_name"].item()
+
+        # get the dataset's granules in the time window: a slice of the
+        #   granule rows grouped by collection, not a scan
+        window = self.get_time_window()
+        ix = self.catalog.get_query_ix(
+            "granules", short_name=short_name, **window)
+        timings.stage("search", len(ix))
+
+        self.update_rendered_granule_table(
+            ix, key=(short_name, tuple(window.values())))
+        timings.stage("table", len(ix))
+
+    def get_table(self, key, make):
+        """Returns the results table made for key before, or else make()."""
+        if key is None:
+            return(make())
+        return(self.tables.get(key, make))
+
+    def update_rendered_dataset_table(self, ix, key=None):
+        """Shows the rows ix of the dataset locator table."""
+
+        def make():
+            return(ResultsTable(
+                self.catalog.dataset_locator_table,
+                ix,
+                dataset_columns,
+                dataset_column_definitions,
+                {"forceFitColumns": False, "maxVisibleRows": 8},
+                self.handle_dataset_table_select))
+
+        # make new qgrids, unless they're made for this query already
+        datasets_qgrid = self.get_table(("datasets", key), make)
+
+        self.output_containers.selected_index = 0
+        self.output_datasets.clear_output()
+        with self.output_datasets:
+            display(self.dataset_results_header)
+            display(datasets_qgrid.ui)
+
+    def update_rendered_granule_table(self, ix, key=None):
+        """Shows the rows ix of the granule locator table."""
+
+        def make():
+            return(ResultsTable(
+                self.catalog.granule_locator_table,
+                ix,
+                granule_columns,
+                granule_column_definitions,
+                {"forceFitColumns": False, "maxVisibleRows": 15},
+                self.handle_granule_table_select,
+                facets=self.catalog.facet_index))
+
+        # make new qgrids, unless they're made for this query already
+        granules_qgrid = self.get_table(("granules", key), make)
+
+        self.output_granules.clear_output()
+        with self.output_granules:
+            display(self.granules_results_header)
+            display(granules_qgrid.ui)
+
+    # ------------------------------------------------------------------------
+    # handing the "cell-clicked" and "poly-drawn" map interactions
+
+    def get_time_window(self):
+        """Returns the start and end picked for searches (None if blank)."""
+        start, end = self.start_picker.value, self.end_picker.value
+        return({
+            "start": None if start is None else start.isoformat(),
+            "end": None if end is None else end.isoformat()+"T23:59:59.999Z"})
+
+    def get_selections(self, on):
+        """
+        Searches the tab that is open (datasets or granules) for the cells in
+        on; returns the locator table rows, the cells' geometries, a style for
+        them and the function that renders the results table.
+        """
+
+        window = self.get_time_window()
+        text = self.keywords.value.strip() or None
+        key = (tuple(sorted(set(on))), tuple(window.values()), text)
+
+        if self.output_containers.selected_index==1:
+
+            # get granules with bboxes that intersect cell, of the datasets
+            #   with the keywords
+            rows, ix = self.catalog.get_tiles_ix(on, "granules", **window)
+            ix = self.catalog.get_text_ix(ix, "granules", text)
+            shapelies = [
+                self.catalog.grid.get_shape("geometry", r) for r in rows]
+            return((ix, shapelies, granules_box_style,
+                    partial(self.update_rendered_granule_table, key=key)))
+
+        # get datasets with bboxes that intersect cell and have the keywords
+        rows, ix = self.catalog.get_tiles_ix(on, "datasets", **window)
+        ix = self.catalog.get_text_ix(ix, "datasets", text)
+        shapelies = [self.catalog.grid.get_shape("geometry", r) for r in rows]
+        return((ix, shapelies, datasets_grid_style,
+                partial(self.update_rendered_dataset_table, key=key)))
+
+    def update_child_cells(self, grid_id):
+        """Swaps the C cells on the map for those of the B cell grid_id."""
+        self.child_layers.clear_layers()
+        cells = [Cell(feat) for feat in self.catalog.get_child_features(grid_id)]
+        if cells:
+            self.child_layers.add_layer(
+                get_cells_layer(cells, self.update_cell_clicked))
+
+    @timings.timed()
+    def update_cell_clicked(self, *args, **kwargs):
+        """ """
+        self.draw_control.clear()
+        self.selected_grans.clear_layers()
+
+        if "properties" in kwargs.keys():
+            on = kwargs["properties"]["grid_id"]
+            if kwargs["properties"]["grid_level"]=="B":
+                self.update_child_cells(on)
+                timings.stage("children")
+            ix, shapelies, style1, function1 = self.get_selections([on])
+            timings.stage("search", len(ix))
+
+            # make layer that represents selected cell, add to selected_layer
+            self.selected_layer.clear_layers()
+            poly = get_map_poly_from_shapely(shapelies[0], style1)
+            self.selected_layer.add_layer(poly)
+
+            centroid = shapelies[0].centroid
+            self.mapw.center = (centroid.y, centroid.x)
+            self.mapw.zoom = 6
+            timings.stage("map")
+
+            # render new results tables
+            function1(ix)
+            timings.stage("table", len(ix))
+
+    @timings.timed()
+    def update_poly_drawn(self, *args, **kwargs):
+        """ """
+
+        self.draw_control.clear()              # clear draw, selection layers
+        self.selected_grans.clear_layers()
+
+        if "geo_json" in kwargs.keys():
+
+            drawn_json = kwargs["geo_json"]    # make shapely from geojson
+            shapely_geom = shape(drawn_json["geometry"])
+
+            # collect intersecting cells from the catalog's STR-tree
+            on = self.catalog.get_tiles_in(shapely_geom, "B")
+            shapes = [self.grid_dict[id].shape for id in on]
+            timings.stage("cells", len(on))
+
+            # get the union of all of the cells that are toggled on
+            union = unary_union(shapes)
+            centroid = union.centroid
+            timings.stage("union")
+
+            # make layer that represents selected cells; add to selected_layer
+            self.selected_layer.clear_layers()
+            poly = get_map_poly_from_shapely(union, datasets_grid_style)
+            self.selected_layer.add_layer(poly)
+            self.mapw.center = (centroid.y, centroid.x)
+            self.mapw.zoom = 4
+            timings.stage("map")
+
+            # render new results tables
+            ix, shapelies, style1, function1 = self.get_selections(on)
+            timings.stage("search", len(ix))
+            function1(ix)
+            timings.stage("table", len(ix))
+
+    @timings.timed()
+    def update_coverage(self, *args):
+        """
+        Colors the B cells by their granules of the collection picked for
+        coverage in the time window; the counts come from catalog.coverage,
+        a sum over the cells, not from the granule table. Only a GeoJSON
+        cells layer (get_cells_layer) can be colored; others are left as is.
+        """
+        if self.catalog.coverage is None or not isinstance(self.cells_layer, GeoJSON):
+            return
+        grid_ids = [f["properties"]["grid_id"]
+                    for f in self.cells_layer.data["features"]]
+        counts = self.catalog.get_coverage(
+            grid_ids, self.coverage.value, **self.get_time_window())
+        timings.stage("counts", len(counts))
+        self.cells_layer.data = get_colored_geojson(
+            self.cells_layer.data, get_colors(counts))
+        timings.stage("map")
+        self.coverage_label.value = "%s cells with granules, at most %s in one" % (
+            "{:,}".format(int((counts>0).sum())),
+            "{:,}".format(int(counts.max(initial=0))))
+
+    def update_zoom(self, change):
+        """
+        Swaps the study domain and the grid cells for their levels of
+        detail at the new zoom.
+        """
+        data = get_domain_geojson(self.catalog.domain, change["new"])
+        if data is not self.domain_layer.data:
+            self.domain_layer.data = data
+
+        grid_lod = self.catalog.grid_lod
+        if grid_lod is None or not isinstance(self.cells_layer, GeoJSON):
+            return
+        level = grid_lod.get_level(change["new"])
+        if level!=self.grid_level:
+            self.grid_level = level
+            self.cells_layer.data = get_relevelled_geojson(
+                self.cells_layer.data, get_grid_index(grid_lod, change["new"]))
+
+    def update_container(self, *args, **kwargs):
+        """
+        This makes sure granule layers are removed when dataset tab is reopened.
+        """
+        if self.output_containers.selected_index==0:
+            self.selected_grans.clear_layers()
+        elif self.output_containers.selected_index==1:
+            pass                                   # placeholder
+        else:
+            pass
+
 
-display(ui)
+def launch(catalog=catalog):
+    """Builds the app, displays it and returns it."""
+    app = App(catalog)
+    display(app.ui)
+    return(app)
 
 
 """
@@ -616,4 +863,4 @@ datasets for special above grid tab:
 
 - ABoVE: Landsat-derived Burn Scar dNBR across Alaska
 
-"""
\ No newline at end of file
+"""
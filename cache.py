@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+A bounded LRU cache for search results (arrays of table rows)
+
+##############################################################################
+"""
+
+from collections import OrderedDict
+
+
+def freeze(value):
+    """Makes the numpy arrays in a result read-only, since it's shared."""
+    if isinstance(value, (tuple, list)):
+        for v in value:
+            freeze(v)
+    elif hasattr(value, "flags"):
+        value.flags.writeable = False
+
+
+def get_nbytes(value):
+    """The bytes held by the numpy arrays in a result (a tuple of them)."""
+    if isinstance(value, (tuple, list)):
+        return(sum(get_nbytes(v) for v in value))
+    return(getattr(value, "nbytes", 0))
+
+
+class ResultCache(object):
+    """
+    Keeps the most recently used results, up to max_items of them and
+    max_bytes of arrays, evicting the least recently used first. Results
+    are tied to a version (get_version()); when it changes, everything
+    that's cached is dropped before the next lookup.
+    """
+
+    def __init__(self, get_version, max_items=256, max_bytes=64*2**20):
+        self.get_version = get_version
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.version = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return(len(self.entries))
+
+    def clear(self):
+        """Drops every result; the counters are kept."""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def get(self, key, compute):
+        """Returns the result for key, from the cache or else from compute()."""
+
+        version = self.get_version()
+        if version!=self.version:
+            self.clear()
+            self.version = version
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return(self.entries[key][0])
+
+        self.misses += 1
+        value = compute()
+        freeze(value)
+        nbytes = get_nbytes(value)
+        if nbytes <= self.max_bytes:
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self.evict()
+        return(value)
+
+    def evict(self):
+        """Drops the least recently used results until the cache fits."""
+        while len(self.entries)>self.max_items or self.nbytes>self.max_bytes:
+            key, (value, nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+
+    def stats(self):
+        """ """
+        return({
+            "items": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions})
@@ -0,0 +1,631 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+ABoVE catalog: the dataset, granule and grid tables, and searches over them
+
+##############################################################################
+"""
+
+import os
+
+from cache import ResultCache
+from timing import timings
+
+# path to above-stm
+repo = os.path.dirname(os.path.abspath(__file__))+os.sep
+
+
+"""
+------------------------------------------------------------------------------
+Functions for selecting from the dataset and granule *_locator_table(s)
+------------------------------------------------------------------------------
+"""
+
+dfsel = lambda df, sel, val: df.loc[df[sel]==val]
+dflistsel = lambda df, sel, lst: df.loc[df[sel].isin(lst)]
+
+dataset_locator_columns = [
+    "title",
+    "conceptid",
+    "short_name",
+    "start_time",
+    "end_time",
+    "minlon",
+    "maxlon",
+    "minlat",
+    "maxlat",
+    "url_sdat",
+    "url_thredds"
+]
+
+granule_locator_columns = [
+    "collection_short_name",
+    "conceptid",
+    "granuleid",
+    "start_time",
+    "end_time",
+    "minlon",
+    "maxlon",
+    "minlat",
+    "maxlat",
+    "url_datapool"
+]
+
+grid_property_columns = [
+    "grid_level",
+    "grid_id",
+    "spatial_re",
+    "ah",
+    "av",
+    "bh",
+    "bv",
+    "ch",
+    "cv"
+]
+
+
+def cached(method):
+    """A read-only property that's computed on first access, then kept."""
+    name = method.__name__
+
+    def get(self):
+        if name not in self.cache:
+            self.cache[name] = method(self)
+        return(self.cache[name])
+
+    get.__doc__ = method.__doc__
+    return(property(get))
+
+
+"""
+------------------------------------------------------------------------------
+Catalog
+------------------------------------------------------------------------------
+"""
+
+
+class Catalog(object):
+    """
+    The ABoVE tables in a data folder. Nothing is read until a table is
+    first used; after that it's kept, so all searches share one copy.
+
+    Tile and polygon searches keep their results (rows of the tables) in a
+    bounded LRU cache, results, which is emptied when the version changes.
+    """
+
+    def __init__(self, data=repo+"data/", max_results=256,
+                 max_result_bytes=64*2**20):
+        self.data = data
+        self.cache = {}
+        self.files = {}
+        self.generation = 0
+        self.results = ResultCache(
+            self.get_version, max_results, max_result_bytes)
+
+    def clear(self):
+        """Forgets the loaded tables, e.g. after they're rewritten."""
+        self.cache.clear()
+        self.files.clear()
+        self.generation += 1
+
+    def get_stat(self, name):
+        """ """
+        stat = os.stat(self.data+name)
+        return((stat.st_mtime_ns, stat.st_size))
+
+    def get_version(self):
+        """
+        Returns a number that changes whenever the tables are cleared. If a
+        table file has been rewritten since it was read, the tables are
+        cleared first, so they're read again when next used.
+        """
+        for name, stat in list(self.files.items()):
+            try:
+                changed = self.get_stat(name)!=stat
+            except OSError:
+                changed = True
+            if changed:
+                self.clear()
+                break
+        return(self.generation)
+
+    @timings.timed()
+    def load(self, name):
+        """Reads a table from the data folder (see store.py)."""
+        # numpy, pandas and shapely are imported with the first table, so
+        #   importing this module stays cheap
+        from store import load_columns
+        self.files[name] = self.get_stat(name)
+        return(load_columns(self.data+name))
+
+    # ------------------------------------------------------------------------
+    # tables
+
+    @cached
+    def datasets(self):
+        """All ABoVE datasets (store.Columns)."""
+        return(self.load("above_dataset_table.npz"))
+
+    @cached
+    def granules(self):
+        """All ABoVE granules (store.Columns)."""
+        return(self.load("above_granules_table.npz"))
+
+    @cached
+    def grid(self):
+        """
+        The table that links datasets and granules to the ABoVE grid: the
+        one with level C if it's been built, otherwise levels A and B.
+        """
+        if os.path.exists(self.data+"above_grid_table_abc.npz"):
+            return(self.load("above_grid_table_abc.npz"))
+        return(self.load("above_grid_table_ab.npz"))
+
+    @cached
+    def dataset_table(self):
+        """ """
+        return(self.datasets.frame)
+
+    @cached
+    def dataset_locator_table(self):
+        """A smaller dataset table that is referenced after interactions."""
+        return(self.dataset_table[dataset_locator_columns])
+
+    @cached
+    def granule_table(self):
+        """ """
+        return(self.granules.frame)
+
+    @cached
+    def granule_locator_table(self):
+        """A smaller granule table that is referenced after interactions."""
+        return(self.granule_table[granule_locator_columns])
+
+    @cached
+    def grid_table(self):
+        """ """
+        return(self.grid.frame)
+
+    @cached
+    def domain(self):
+        """The ABoVE study domain at levels of detail (see lod.py), or None."""
+        from lod import LevelsOfDetail
+        path = self.data+"above_domain_lod.npz"
+        return(LevelsOfDetail(path) if os.path.exists(path) else None)
+
+    @cached
+    def grid_lod(self):
+        """The A and B grid cells at levels of detail (see lod.py), or None."""
+        from lod import LevelsOfDetail
+        path = self.data+"above_grid_lod.npz"
+        return(LevelsOfDetail(path) if os.path.exists(path) else None)
+
+    @cached
+    def coverage(self):
+        """
+        The granule counts of the grid cells by collection and month (see
+        coverage.py), or None if they haven't been counted.
+        """
+        from coverage import Coverage
+        name = "above_coverage.npz"
+        if not os.path.exists(self.data+name):
+            return(None)
+        self.files[name] = self.get_stat(name)
+        return(Coverage(self.data+name))
+
+    @timings.timed()
+    def get_coverage(self, grid_ids, short_names=None, start=None, end=None):
+        """
+        Returns the number of granules in each of the cells grid_ids of the
+        collection(s) short_names (all if None) in the time window, from
+        the coverage counts; cells without counts get 0.
+        """
+        import numpy as np
+
+        coverage = self.coverage
+        if coverage is None:
+            return(np.zeros(len(grid_ids), dtype=np.int64))
+        counts = coverage.get_counts(short_names, start, end)
+        rows = coverage.get_rows(grid_ids)
+        return(np.where(rows >= 0, counts[rows], 0))
+
+    def get_grid_features(self, level="B", rows=None):
+        """
+        Returns the GeoJSON features of the grid cells in a level, or of the
+        grid table rows in rows.
+        """
+        from shapely.geometry import mapping
+
+        if rows is None:
+            rows = self.grid_table.index[self.grid_table["grid_level"]==level]
+        properties = self.grid_table.loc[rows, grid_property_columns]
+        geometries = [self.grid.get_shape("geometry", row) for row in rows]
+
+        return([{
+            "type": "Feature",
+            "geometry": mapping(geometry),
+            "properties": prop
+        } for geometry, prop in zip(geometries, properties.to_dict("records"))])
+
+    def get_child_features(self, grid_id):
+        """Returns the GeoJSON features of a cell's children (C cells of a B)."""
+        rows = self.grid_tree.children.take(self.tile_index.get_rows([grid_id]))
+        return(self.get_grid_features(rows=rows))
+
+    # ------------------------------------------------------------------------
+    # searches
+
+    @cached
+    def tile_index(self):
+        """grid_id -> grid table row, and the grid's locator index arrays."""
+        from indexes import TileIndex
+        return(TileIndex(self.grid, self.get_locator_tree))
+
+    @cached
+    def grid_tree(self):
+        """The grid's A > B > C hierarchy, for searches by geometry."""
+        from indexes import GridTree
+        return(GridTree(self.grid))
+
+    def get_locator_tree(self, search):
+        """
+        An STR-tree over the boxes of the datasets or granules (search), with
+        those across the antimeridian split in two (see linkage.BoxTree).
+        """
+        name = search+"_tree"
+        if name not in self.cache:
+            from linkage import BoxTree
+            self.cache[name] = BoxTree(getattr(self, search).get_bounds())
+        return(self.cache[name])
+
+    def get_cell_index(self, level="B"):
+        """An STR-tree over the cells of one grid level (A, B or C)."""
+        name = "cell_index_"+level
+        if name not in self.cache:
+            from indexes import CellIndex
+            self.cache[name] = CellIndex(self.grid, level)
+        return(self.cache[name])
+
+    @timings.timed()
+    def get_tiles_in(self, geometry, level="B"):
+        """
+        Returns the grid_ids of the cells in level that intersect geometry,
+        descending from A through the levels above (see indexes.GridTree).
+        """
+        import shapely
+
+        key = ("cells", level, shapely.to_wkb(shapely.normalize(geometry)))
+        rows = self.results.get(
+            key, lambda: self.grid_tree.query(geometry, level))
+        return(self.grid_table["grid_id"].values[rows].tolist())
+
+    def get_tile_ix(self, tile_list, search):
+        """
+        Returns the locator table indices of the datasets or granules
+        (search) whose boxes intersect any of the grid cells in tile_list.
+        """
+        rows = self.tile_index.get_rows(tile_list)
+        return(self.tile_index.get_ix(rows, search))
+
+    @timings.timed()
+    def get_shape_ix(self, shape, search):
+        """
+        Returns the sorted locator table indices of the datasets or granules
+        (search) whose boxes intersect a Shapely geometry. Results are cached
+        by the geometry's normalized WKB.
+        """
+        import numpy as np
+        import shapely
+
+        key = ("shape", search, shapely.to_wkb(shapely.normalize(shape)))
+        return(self.results.get(key, lambda: np.sort(
+            self.get_locator_tree(search).query(shape, predicate="intersects"))))
+
+    def get_locator_table(self, search):
+        """Returns the dataset or granule (search) locator table."""
+        if search=="datasets":
+            return(self.dataset_locator_table)
+        if search=="granules":
+            return(self.granule_locator_table)
+        raise ValueError("search is 'datasets' or 'granules', not %r" % search)
+
+    def get_time_index(self, search):
+        """The time ranges of the datasets or granules (search), parsed once."""
+        name = search+"_times"
+        if name not in self.cache:
+            from indexes import TimeIndex
+            self.cache[name] = TimeIndex(self.get_locator_table(search))
+        return(self.cache[name])
+
+    def get_window_ix(self, ix, search, start=None, end=None):
+        """
+        Keeps the locator table rows in ix whose time ranges overlap
+        [start, end]; either end can be None for no limit.
+        """
+        if start is None and end is None:
+            return(ix)
+        return(ix[self.get_time_index(search).get_mask(ix, start, end)])
+
+    @cached
+    def collection_index(self):
+        """Dataset keys -> dataset row, and each collection's granule rows."""
+        from indexes import CollectionIndex
+        return(CollectionIndex(self.dataset_table, self.granule_table))
+
+    @timings.timed()
+    def get_collection_ix(self, ix, search, short_name):
+        """
+        Keeps the locator table rows in ix of the named collection(s); ix
+        None means all of the rows, which comes straight from the index.
+        """
+        import numpy as np
+
+        if short_name is None:
+            return(ix)
+        names = [short_name] if isinstance(short_name, str) else list(short_name)
+
+        if search=="datasets":
+            rows = np.sort(self.collection_index.get_dataset_rows(names))
+            return(rows if ix is None else ix[np.isin(ix, rows)])
+
+        if ix is None:
+            return(self.collection_index.get_rows(names))
+        return(ix[self.collection_index.get_mask(ix, names)])
+
+    @cached
+    def text_index(self):
+        """The words of the datasets' titles, short names and keywords."""
+        from indexes import TextIndex, get_dataset_documents
+        return(TextIndex(get_dataset_documents(self.datasets)))
+
+    @timings.timed()
+    def get_text_ix(self, ix, search, text):
+        """
+        Keeps the locator table rows in ix of the datasets whose title,
+        short name or science keywords have every word of text (as the start
+        of a word), or of their granules; ix None means all of the rows.
+        """
+        import numpy as np
+
+        if not text:
+            return(ix)
+        rows = self.text_index.get_rows(text)
+
+        if search=="datasets":
+            return(rows if ix is None else np.intersect1d(
+                ix, rows, assume_unique=True))
+
+        short_names = self.dataset_table["short_name"].values[rows]
+        return(self.get_collection_ix(ix, search, list(short_names)))
+
+    @cached
+    def facet_index(self):
+        """A bitmap of the granules with each parameter (see FacetIndex)."""
+        from indexes import FacetIndex
+        return(FacetIndex(self.granules.ragged["granule_params"],
+                          self.granules.vocab["granule_params"]))
+
+    @timings.timed()
+    def get_param_ix(self, ix, search, params):
+        """
+        Keeps the locator table rows in ix of the granules with any of the
+        parameters params, or of the datasets with such granules; ix None
+        means all of the rows.
+        """
+        import numpy as np
+
+        if params is None:
+            return(ix)
+        names = [params] if isinstance(params, str) else list(params)
+
+        if search=="datasets":
+            granules = self.facet_index.get_rows(names)
+            short_names = np.unique(self.granule_table[
+                "collection_short_name"].values[granules].astype(object))
+            rows = np.sort(self.collection_index.get_dataset_rows(short_names))
+            return(rows if ix is None else np.intersect1d(
+                ix, rows, assume_unique=True))
+
+        if ix is None:
+            return(self.facet_index.get_rows(names))
+        return(ix[self.facet_index.get_mask(ix, names)])
+
+    @timings.timed()
+    def get_facet_counts(self, ix):
+        """
+        The number of the granules (rows of the granule locator table) in ix
+        with each parameter, most common first; from bitmap popcounts.
+        """
+        return(self.facet_index.get_counts(ix))
+
+    @timings.timed()
+    def get_dataset(self, key, column="title"):
+        """
+        Returns the dataset locator table row (as a one-row table) whose
+        title, short_name or conceptid (column) is key.
+        """
+        rows = self.collection_index.get_dataset_rows([key], column)
+        return(self.dataset_locator_table.iloc[rows])
+
+    @timings.timed()
+    def get_tiles_ix(self, tile_list, search, start=None, end=None):
+        """
+        Returns the sorted grid table rows of the tiles, and the locator
+        table rows for them (see get_by_tiles). Results are cached by the
+        set of tiles, search and time window.
+        """
+        from indexes import get_time_ms
+
+        window = (get_time_ms(start, None), get_time_ms(end, None))
+        tiles = tuple(sorted(set(tile_list)))
+
+        def compute():
+            rows = self.tile_index.get_rows(tiles)
+            ix = self.get_window_ix(
+                self.tile_index.get_ix(rows, search), search, start, end)
+            return((rows, ix))
+
+        return(self.results.get(("tiles", search, tiles, window), compute))
+
+    @timings.timed()
+    def get_by_tiles(self, tile_list, search, start=None, end=None):
+        """
+        Returns the datasets or granules (search) whose boxes intersect any
+        of the grid cells in tile_list, and the cells' Shapely geometries.
+        start and end limit them to a time window.
+        """
+
+        locator_table = self.get_locator_table(search)
+        rows, ix = self.get_tiles_ix(tile_list, search, start, end)
+        shapelies = [self.grid.get_shape("geometry", row) for row in rows]
+        table = locator_table.iloc[ix]
+
+        return((table, shapelies))
+
+    # ------------------------------------------------------------------------
+    # queries without the app
+
+    def get_filter(self, search="granules", tiles=None, start=None, end=None,
+                   short_name=None, text=None, params=None):
+        """
+        Returns a boolean mask over the locator table's rows for the filters
+        that aren't geometries (see query). None when there are none.
+        """
+        import numpy as np
+
+        if all(f is None for f in [tiles, start, end, short_name, text, params]):
+            return(None)
+
+        ix = self.get_query_ix(search, tiles=tiles, start=start, end=end,
+                               short_name=short_name, text=text, params=params)
+        keep = np.zeros(len(self.get_locator_table(search)), dtype=bool)
+        keep[ix] = True
+        return(keep)
+
+    @timings.timed()
+    def get_query_ix(self, search="granules", geometry=None, bbox=None,
+                     tiles=None, start=None, end=None, short_name=None,
+                     text=None, params=None):
+        """
+        Returns the locator table rows that match a query (see query). The
+        spatial filters make a set of candidate rows, and the time window,
+        collections, text and parameters are masks or intersections with
+        those. Without a spatial filter, the collection, text or facet index
+        (the first of those filters given) or else the time index finds the
+        candidates.
+        """
+        import numpy as np
+
+        ix = None
+        if tiles is not None:
+            ix = self.get_tiles_ix(tiles, search)[1]
+
+        for shape in [get_geometry(geometry), get_geometry(bbox)]:
+            if shape is not None:
+                hits = self.get_shape_ix(shape, search)
+                ix = hits if ix is None else np.intersect1d(
+                    ix, hits, assume_unique=True)
+
+        filters = [(self.get_collection_ix, short_name),
+                   (self.get_text_ix, text or None),
+                   (self.get_param_ix, params)]
+        filters = [(get_ix, value) for get_ix, value in filters
+                   if value is not None]
+
+        if ix is None and filters:
+            get_ix, value = filters.pop(0)
+            ix = self.get_window_ix(
+                get_ix(None, search, value), search, start, end)
+        elif ix is None and (start is not None or end is not None):
+            ix = self.get_time_index(search).get_rows(start, end)
+        elif ix is None:
+            ix = np.arange(len(self.get_locator_table(search)))
+        else:
+            ix = self.get_window_ix(ix, search, start, end)
+
+        for get_ix, value in filters:
+            ix = get_ix(ix, search, value)
+        return(ix)
+
+    @timings.timed()
+    def query(self, search="granules", geometry=None, bbox=None, tiles=None,
+              start=None, end=None, short_name=None, text=None, params=None):
+        """
+        Returns the rows of the dataset or granule locator table (search)
+        that match all of the filters given:
+
+          geometry:   the box intersects a Shapely geometry or GeoJSON
+                      geometry, feature or WKT string
+          bbox:       the box intersects (minlon, minlat, maxlon, maxlat)
+          tiles:      the box intersects any of these grid_ids, as when
+                      the cells are clicked in the app
+          start, end: the time range overlaps [start, end], ISO 8601
+          short_name: the dataset's short name, or any of a list of them
+          text:       words in the dataset's title, short name or science
+                      keywords, each as the start of a word (see
+                      indexes.TextIndex); for granules, their dataset's
+          params:     a granule parameter (e.g. "PERMAFROST"), or any of a
+                      list of them; for datasets, any of their granules'
+        """
+        ix = self.get_query_ix(search, geometry, bbox, tiles, start, end,
+                               short_name, text, params)
+        return(self.get_locator_table(search).iloc[ix])
+
+    def query_many_ix(self, aois, search="granules", chunk=1024, **filters):
+        """
+        Runs a query (see query) for each of many areas of interest, which
+        are (aoi_id, geometry) pairs. Yields (aoi_id, locator table rows).
+
+        The other filters are worked out once, and each chunk of AOIs goes
+        through the locator table's STR-tree in one call.
+        """
+        import numpy as np
+        from itertools import islice
+
+        keep = self.get_filter(search, **filters)
+        tree = self.get_locator_tree(search)
+
+        aois = iter(aois)
+        while True:
+            batch = list(islice(aois, chunk))
+            if not batch:
+                break
+
+            shapes = np.array([get_geometry(g) for i, g in batch], dtype=object)
+            aoi_ix, ix = tree.query(shapes, predicate="intersects")
+            order = np.lexsort((ix, aoi_ix))
+            aoi_ix, ix = aoi_ix[order], ix[order]
+            if keep is not None:
+                aoi_ix, ix = aoi_ix[keep[ix]], ix[keep[ix]]
+
+            splits = np.searchsorted(aoi_ix, np.arange(len(batch)+1))
+            for k, (aoi_id, g) in enumerate(batch):
+                yield((aoi_id, ix[splits[k]:splits[k+1]]))
+
+    def query_many(self, aois, search="granules", chunk=1024, **filters):
+        """Like query_many_ix, but yields (aoi_id, locator table) pairs."""
+        table = self.get_locator_table(search)
+        for aoi_id, ix in self.query_many_ix(aois, search, chunk, **filters):
+            yield((aoi_id, table.iloc[ix]))
+
+
+def get_geometry(geometry):
+    """
+    Makes a Shapely geometry from a GeoJSON geometry or feature (a dict),
+    WKT, or a (minlon, minlat, maxlon, maxlat) box. None stays None.
+    """
+    import shapely
+    from shapely.geometry import shape
+
+    if geometry is None or isinstance(geometry, shapely.Geometry):
+        return(geometry)
+    if isinstance(geometry, dict):
+        return(shape(geometry.get("geometry", geometry)))
+    if isinstance(geometry, str):
+        return(shapely.from_wkt(geometry))
+    return(shapely.box(*geometry))
+
+
+# the catalog shared by the app and headless searches; loads on first use
+catalog = Catalog()
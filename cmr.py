@@ -0,0 +1,597 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Requesting and parsing ABoVE metadata from CMR
+
+##############################################################################
+"""
+
+import gc
+import json
+import queue
+import threading
+import requests
+import numpy as np
+import pandas as pd
+
+from array import array
+from math import nan
+
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from shapely.geometry import box, MultiPolygon
+
+# orjson parses CMR's pages several times faster, if it's installed
+try:
+    from orjson import loads
+except ModuleNotFoundError:
+    from json import loads
+
+cmr_url = "https://cmr.earthdata.nasa.gov/search/"
+
+
+"""
+------------------------------------------------------------------------------
+CMR Requests
+------------------------------------------------------------------------------
+"""
+
+
+@contextmanager
+def paused_gc():
+    """
+    Pauses the cyclic garbage collector. A page of UMM-JSON is hundreds of
+    thousands of new dicts, lists and strings, which would set it off over
+    and over; none of them can be in a cycle, so it has nothing to find.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def decode(body, loads=loads):
+    """Parses a JSON response body (bytes or str); see paused_gc."""
+    with paused_gc():
+        return(loads(body))
+
+
+def cmr_search(endpoint, parameters, update=None, session=None):
+    """ """
+
+    cmr_collections = cmr_url
+    get = requests.get if session is None else session.get
+
+    # join query parameters and there values
+    query = "&".join([param+"="+value for param, value in parameters.items()])
+
+    # combine with the cmr search endpoint and submit get request
+    response = get(cmr_collections+endpoint+query)
+
+    # parse json response to dictionary
+    data = json.loads(response.text)
+
+    # if a path is given, update local copy
+    if update:
+        try:
+            with open(update, "w") as f:
+                f.write(json.dumps(data, indent=4))
+        except:
+            print("Could not write response to json. Skipping.")
+
+    return(data)
+
+
+def get_session(pool_size=8, retries=5, backoff=0.5):
+    """
+    Returns a requests.Session with a connection pool of pool_size and
+    retries (with exponential backoff) for throttled or failed requests.
+    """
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return(session)
+
+
+def cmr_pages(endpoint, parameters, session, cmr=cmr_url):
+    """
+    Yields every page of a CMR search. Pages after the first are requested
+    with the CMR-Search-After header from the previous response, so the
+    search isn't cut off at page_size items.
+    """
+
+    headers = {}
+    while True:
+        response = session.get(cmr+endpoint, params=parameters, headers=headers)
+        response.raise_for_status()
+        page = decode(response.content)
+        items = page.get("items", [])
+
+        if items:
+            yield(page)
+
+        search_after = response.headers.get("CMR-Search-After")
+        if not items or search_after is None:
+            break
+
+        headers["CMR-Search-After"] = search_after
+
+
+def get_deleted_granules(revision_date, providers, session=None, cmr=cmr_url,
+                         page_size=2000):
+    """
+    Returns the concept-ids of the granules of providers deleted since
+    revision_date (ISO 8601), from CMR's deleted-granules search, which
+    only goes back a year; further back, rebuild the tables instead.
+    """
+    session = session or get_session()
+
+    conceptids = []
+    for provider in dict.fromkeys(providers):
+        params = dict(revision_date=revision_date, provider=provider,
+                      page_size=str(page_size))
+        headers = {}
+        while True:
+            response = session.get(cmr+"deleted-granules.json", params=params,
+                                   headers=headers)
+            response.raise_for_status()
+            page = decode(response.content)
+            # a list of entries, or an atom-style feed of them
+            if isinstance(page, dict):
+                page = (page.get("feed") or {}).get("entry") or page.get("items") or []
+            conceptids.extend(filter(None, [
+                e.get("concept-id") or e.get("id") for e in page]))
+
+            search_after = response.headers.get("CMR-Search-After")
+            if not page or search_after is None:
+                break
+            headers["CMR-Search-After"] = search_after
+
+    return(conceptids)
+
+
+def harvest_granules(conceptids, workers=4, page_size=2000, session=None,
+                     cmr=cmr_url):
+    """
+    Harvests the granules of each collection concept-id, with up to workers
+    collections requested at once over one pooled session. Yields tuples of
+    (position of the conceptid, page number, get_granules_table(page)) as
+    the pages arrive, so results stream in order of completion.
+    """
+
+    conceptids = list(conceptids)
+    session = get_session(workers) if session is None else session
+    pages = queue.Queue(maxsize=2*workers)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return(True)
+            except queue.Full:
+                pass
+        return(False)
+
+    def harvest(position, conceptid):
+        # each collection ends with (position, None, error), put by the
+        #   worker itself, so only the consumer ever waits on the queue
+        error = None
+        try:
+            params = dict(collection_concept_id=conceptid,
+                          page_size=str(page_size))
+            for number, page in enumerate(cmr_pages(
+                    "granules.umm_json_v1_4", params, session, cmr)):
+                if not put((position, number, get_granules_table(page))):
+                    return
+        except BaseException as e:
+            error = e
+        finally:
+            put((position, None, error))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(harvest, i, c) for i, c in enumerate(conceptids)]
+
+        try:
+            remaining = len(futures)
+            while remaining:
+                item = pages.get()
+                if item[1] is None:
+                    remaining -= 1
+                    if item[2] is not None:
+                        raise item[2]          # a failed harvest
+                else:
+                    yield(item)
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+
+def harvest_granules_table(conceptids, **kwargs):
+    """
+    Harvests the granules of each collection concept-id into one table in
+    the order of conceptids, like concatenating get_granules_table results
+    for every collection. Keyword arguments go to harvest_granules.
+    """
+
+    pages = sorted(harvest_granules(conceptids, **kwargs), key=lambda p: p[:2])
+    tables = [table for position, number, table in pages]
+    if not tables:
+        return(get_granules_table({"items": []}))
+
+    granules_table = pd.concat(tables)
+    granules_table.reset_index(drop=True, inplace=True)
+
+    return(granules_table)
+
+
+"""
+------------------------------------------------------------------------------
+Parsing CMR Data
+------------------------------------------------------------------------------
+"""
+
+
+def get_bounds(umm):
+
+    umm_extent = umm["SpatialExtent"]
+    umm_geometry = umm_extent["HorizontalSpatialDomain"]["Geometry"]
+    umm_bounds = umm_geometry["BoundingRectangles"][0]
+
+    minx = umm_bounds["WestBoundingCoordinate"]
+    maxy = umm_bounds["NorthBoundingCoordinate"]
+    maxx = umm_bounds["EastBoundingCoordinate"]
+    miny = umm_bounds["SouthBoundingCoordinate"]
+
+    return([minx, miny, maxx, maxy])
+
+
+def get_bounds_shapely(bounds):
+    """
+    A box from get_bounds; in two parts if it crosses the antimeridian (its
+    west bound is more than 180 degrees east of its east bound).
+    """
+
+    minx, miny, maxx, maxy = [float(b) for b in bounds]
+    if minx-maxx > 180:
+        return(MultiPolygon([
+            box(minx, miny, 180., maxy),
+            box(-180., miny, maxx, maxy)]))
+
+    return(box(minx, miny, maxx, maxy))
+
+
+def get_science_keywords(umm):
+    """ """
+
+    science_keywords = umm["ScienceKeywords"]
+    keywords = []
+
+    for keyset in science_keywords:
+        for keyword, value in keyset.items():
+            if value not in keywords:
+                keywords.append(value)
+
+    return(keywords)
+
+
+def get_urls(umm, search):
+    """ """
+
+    if search=="datasets":
+
+        url_landingpage = None
+        url_documentation = None
+        url_datapool = None
+        url_sdat = None
+        url_thredds = None
+
+        for RelatedUrls in umm["RelatedUrls"]:
+
+            try:
+
+                if RelatedUrls["Relation"][0]=="DATA SET LANDING PAGE":
+                    url_landingpage = RelatedUrls["URLs"][0]
+
+                elif RelatedUrls["Description"]=="ORNL DAAC Data Set Documentation":
+                    url_documentation = RelatedUrls["URLs"][0]
+
+                elif RelatedUrls["Relation"][0]=="GET DATA":
+                    url_datapool = RelatedUrls["URLs"][0]
+
+                else:
+
+                    for url in RelatedUrls["URLs"]:
+
+                        if "webmap" in url:
+                            url_sdat = url
+
+                        elif "thredds" in url:
+                            url_thredds = url
+
+                        else:
+                            pass
+            except:
+
+                pass
+
+        return((url_landingpage,
+                url_documentation,
+                url_datapool,
+                url_sdat,
+                url_thredds))
+
+    elif search=="granules":
+
+        url_datapool = None
+
+        for RelatedUrls in umm["RelatedUrls"]:
+            try:
+                if RelatedUrls["Type"]=="GET DATA":
+                    url_datapool = RelatedUrls["URL"]
+            except:
+                pass
+
+        return(url_datapool)
+
+    else:
+
+        return(None)
+
+
+def get_granule_parameters(umm):
+    """ """
+
+    granule_parameters = []
+    for param in umm["MeasuredParameters"]:
+        for name, value in param.items():
+            if value not in granule_parameters:
+                granule_parameters.append(value)
+
+    return(granule_parameters)
+
+
+"""
+------------------------------------------------------------------------------
+Tables from pages of UMM-JSON
+
+Items are parsed straight into one buffer per column (array("d") for the
+numbers, lists for the rest) and the DataFrame is made once at the end.
+Missing fields are None (NaN for numbers); an item without a bounding
+rectangle is skipped. Boxes aren't made here: the bbox columns are enough
+for the tables, and linkage.BoxTree makes them all at once when needed.
+------------------------------------------------------------------------------
+"""
+
+dataset_columns = [
+    ("title", "str"),
+    ("archive", "str"),
+    ("conceptid", "str"),
+    ("short_name", "str"),
+    ("start_time", "str"),
+    ("end_time", "str"),
+    ("minlon", "float"),
+    ("minlat", "float"),
+    ("maxlon", "float"),
+    ("maxlat", "float"),
+    ("progress", "str"),
+    ("science_keywords", "list"),
+    ("url_landingpage", "str"),
+    ("url_documentation", "str"),
+    ("url_datapool", "str"),
+    ("url_sdat", "str"),
+    ("url_thredds", "str"),
+]
+
+# granule_size is in MB (2**20 bytes), whatever the SizeUnit of the files;
+#   granule_files is how many files it's the size of
+size_unit = 2**20
+size_units = {"KB": 2**10, "MB": 2**20, "GB": 2**30, "TB": 2**40, "PB": 2**50}
+
+granule_columns = [
+    ("archive", "str"),
+    ("collection_short_name", "str"),
+    ("conceptid", "str"),
+    ("granuleid", "str"),
+    ("granule_size", "float"),
+    ("granule_files", "float"),
+    ("granule_params", "list"),
+    ("start_time", "str"),
+    ("end_time", "str"),
+    ("minlon", "float"),
+    ("minlat", "float"),
+    ("maxlon", "float"),
+    ("maxlat", "float"),
+    ("url_datapool", "str"),
+]
+
+
+class Columns(object):
+    """Typed buffers for the columns of a table, filled a row at a time."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.buffers = [array("d") if kind=="float" else []
+                        for name, kind in columns]
+
+    def __len__(self):
+        return(len(self.buffers[0]))
+
+    def frame(self):
+        """ """
+        return(pd.DataFrame({
+            name: np.frombuffer(buffer) if kind=="float" else
+            pd.Series(buffer, dtype=object)
+            for (name, kind), buffer in zip(self.columns, self.buffers)}))
+
+
+def get_rectangle(umm):
+    """The first bounding rectangle of a UMM item, or None."""
+    extent = umm.get("SpatialExtent") or {}
+    domain = extent.get("HorizontalSpatialDomain") or {}
+    geometry = domain.get("Geometry") or {}
+    rectangles = geometry.get("BoundingRectangles")
+    return(rectangles[0] if rectangles else None)
+
+
+def get_float(value):
+    """ """
+    return(nan if value is None else float(value))
+
+
+def get_files(umm):
+    """The ArchiveAndDistributionInformation (files) of a granule, a list."""
+    information = (umm.get("DataGranule") or {}).get(
+        "ArchiveAndDistributionInformation")
+    if isinstance(information, dict):
+        information = [information]
+    return(information or [])
+
+
+def get_size(umm):
+    """
+    The total size of a granule's files in size_unit (MB), from each file's
+    SizeInBytes, or its Size in its SizeUnit. None if there are no sizes, or
+    if one is in a unit that isn't in size_units (e.g. "NA").
+    """
+    total, sized = 0, False
+    for f in get_files(umm):
+        if f.get("SizeInBytes") is not None:
+            total += f["SizeInBytes"]
+        elif f.get("Size") is not None:
+            unit = size_units.get(str(f.get("SizeUnit")).upper())
+            if unit is None:
+                return(None)
+            total += f["Size"]*unit
+        else:
+            continue
+        sized = True
+    return(total/size_unit if sized else None)
+
+
+def get_values(dicts):
+    """The values of a list of dicts, each once, in order; None if no list."""
+    if dicts is None:
+        return(None)
+    return(list(dict.fromkeys(v for d in dicts for v in d.values())))
+
+
+def add_datasets(columns, items):
+    """Parses UMM-JSON collection items into columns (Columns)."""
+    append = [buffer.append for buffer in columns.buffers]
+
+    for item in items:
+        umm, meta = item["umm"], item["meta"]
+
+        if len(umm.get("Projects") or [])!=1:
+            continue
+        rectangle = get_rectangle(umm)
+        if rectangle is None:
+            continue
+
+        ranges = (umm.get("TemporalExtents") or [{}])[0].get(
+            "RangeDateTimes") or [{}]
+        urls = get_urls(umm, "datasets")
+
+        for add, value in zip(append, (
+                umm.get("EntryTitle"),
+                meta.get("provider-id"),
+                meta.get("concept-id"),
+                umm.get("ShortName"),
+                ranges[0].get("BeginningDateTime"),
+                ranges[0].get("EndingDateTime"),
+                get_float(rectangle.get("WestBoundingCoordinate")),
+                get_float(rectangle.get("SouthBoundingCoordinate")),
+                get_float(rectangle.get("EastBoundingCoordinate")),
+                get_float(rectangle.get("NorthBoundingCoordinate")),
+                umm.get("CollectionProgress"),
+                get_values(umm.get("ScienceKeywords")))+urls):
+            add(value)
+
+
+def add_granules(columns, items):
+    """Parses UMM-JSON granule items into columns (Columns)."""
+    append = [buffer.append for buffer in columns.buffers]
+
+    for item in items:
+        umm, meta = item["umm"], item["meta"]
+
+        granuleid = meta.get("native-id")
+        if granuleid is None or len(umm.get("Projects") or [])!=1:
+            continue
+        rectangle = get_rectangle(umm)
+        if rectangle is None:
+            continue
+
+        reference = umm.get("CollectionReference") or {}
+        times = (umm.get("TemporalExtent") or {}).get("RangeDateTime") or {}
+        url_datapool = None
+        for url in umm.get("RelatedUrls") or []:
+            if url.get("Type")=="GET DATA":
+                url_datapool = url.get("URL")
+
+        for add, value in zip(append, (
+                meta.get("provider-id"),
+                reference.get("ShortName"),
+                meta.get("concept-id"),
+                granuleid,
+                get_float(get_size(umm)),
+                float(len(get_files(umm))),
+                get_values(umm.get("MeasuredParameters")),
+                times.get("BeginningDateTime"),
+                times.get("EndingDateTime"),
+                get_float(rectangle.get("WestBoundingCoordinate")),
+                get_float(rectangle.get("SouthBoundingCoordinate")),
+                get_float(rectangle.get("EastBoundingCoordinate")),
+                get_float(rectangle.get("NorthBoundingCoordinate")),
+                url_datapool)):
+            add(value)
+
+
+def ingest(pages, search="granules"):
+    """
+    Makes the datasets or granules (search) table from pages of a CMR
+    UMM-JSON search, as they come: each page is a response body (bytes or
+    str) or a parsed dictionary.
+    """
+    if search=="datasets":
+        columns, add = Columns(dataset_columns), add_datasets
+    else:
+        columns, add = Columns(granule_columns), add_granules
+
+    for page in pages:
+        if isinstance(page, (bytes, str)):
+            page = decode(page)
+        with paused_gc():
+            add(columns, page["items"])
+
+    return(columns.frame())
+
+
+def get_datasets_table(cmr_collections_response_dictionary):
+    """ """
+    return(ingest([cmr_collections_response_dictionary], "datasets"))
+
+
+def get_granules_table(cmr_granules_response_dictionary):
+    """ """
+    return(ingest([cmr_granules_response_dictionary], "granules"))
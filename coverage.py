@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Granule counts per grid cell, by collection and month, for the map
+
+##############################################################################
+
+The grid table has a granule_count per cell, but coloring the map by the
+granules of one collection, or of a time window, would mean going through
+the cells' granule rows again each time. This counts them once and keeps
+the counts in an .npz file next to the grid table:
+
+    python coverage.py    # data/above_grid_table_*.npz -> data/above_coverage.npz
+
+There are two arrays of counts for the linked (A and B) cells:
+
+  - counts: cell x collection -> number of granules, for a collection
+    filter without a time window, which is a sum over a few columns
+  - the cube: (collection, cell, first month, last month) -> number of
+    granules, one entry for each combination that has any granules, sorted
+    by collection. A granule is in a window of months [a, b] if first<=b
+    and last>=a, so a time window is a mask over the collections' entries
+    and a bincount by cell
+
+Months are counted from January 1970, so a time window is only as precise
+as its months: a granule that ends on May 3 is in a window from May 20.
+"""
+
+import json
+import numpy as np
+
+# fill colors for the cells, from the fewest granules to the most (the
+#   viridis colormap at eight steps); cells without any aren't filled
+palette = ["#440154", "#46327e", "#365c8d", "#277f8e",
+           "#1fa187", "#4ac16d", "#a0da39", "#fde725"]
+
+
+def get_months(ms):
+    """Epoch milliseconds (see indexes.get_epoch_ms) -> months since 1970."""
+    return(ms.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64))
+
+
+def get_month(time, default):
+    """One time (ISO 8601, see indexes.get_time_ms) in months; None is default."""
+    from indexes import get_time_ms
+
+    if time is None:
+        return(default)
+    return(int(get_months(np.array([get_time_ms(time, None)]))[0]))
+
+
+def get_colors(counts, palette=palette):
+    """
+    A fill color for each count: the palette is stretched over the log of
+    counts up to the largest. Zeros get None.
+    """
+    counts = np.asarray(counts)
+    top = np.log1p(counts.max(initial=0))
+    if top==0:
+        return([None]*len(counts))
+    steps = np.log1p(counts)/top*len(palette)
+    steps = np.clip(np.ceil(steps).astype(np.int64)-1, 0, len(palette)-1)
+    colors = np.array(palette, dtype=object)[steps]
+    colors[counts==0] = None
+    return(colors.tolist())
+
+
+def save_coverage(path, grid, granules):
+    """
+    Counts the granules of each linked cell of grid (store.Columns) by
+    collection, and by collection and months, from the cells' granule rows
+    in the granules table (a DataFrame); writes them to an .npz at path.
+    """
+    import pandas as pd
+    from store import replace_file
+    from indexes import get_epoch_ms
+
+    linked = np.flatnonzero(grid.frame["grid_level"].values!="C")
+    csr = grid.ragged["granule_locator_ix"]
+    lengths = csr.offsets[linked+1]-csr.offsets[linked]
+    cells = np.repeat(np.arange(len(linked)), lengths)
+    rows = csr.take(linked)
+
+    codes, names = pd.factorize(granules["collection_short_name"])
+    start, start_missing = get_epoch_ms(granules["start_time"].values)
+    end, end_missing = get_epoch_ms(granules["end_time"].values)
+    first = np.where(start_missing, np.iinfo(np.int32).min, get_months(start))
+    last = np.where(end_missing, np.iinfo(np.int32).max, get_months(end))
+
+    counts = np.zeros((len(linked), len(names)), dtype=np.int32)
+    np.add.at(counts, (cells, codes[rows]), 1)
+
+    # one entry per (collection, cell, first month, last month), so each
+    #   collection's entries are a range
+    keys = np.column_stack([codes[rows], cells, first[rows], last[rows]])
+    keys, cube_counts = np.unique(keys, axis=0, return_counts=True)
+    offsets = np.searchsorted(keys[:, 0], np.arange(len(names)+1))
+
+    meta = json.dumps({"collections": names.tolist()}).encode()
+    arrays = {
+        "grid_id": np.asarray(grid.frame["grid_id"].values[linked], dtype=str),
+        "counts": counts,
+        "cube.offsets": offsets.astype(np.int64),
+        "cube.cell": keys[:, 1].astype(np.int32),
+        "cube.first": keys[:, 2].astype(np.int32),
+        "cube.last": keys[:, 3].astype(np.int32),
+        "cube.count": cube_counts.astype(np.int32),
+        "__meta__": np.frombuffer(meta, dtype=np.uint8)}
+
+    replace_file(path, lambda output: np.savez_compressed(output, **arrays), False)
+
+
+class Coverage(object):
+    """
+    The granule counts of the grid cells, read from a file written by
+    save_coverage. get_counts(short_names, start, end) returns the counts
+    for a collection filter and time window, from the counts without
+    touching the granule table.
+    """
+
+    def __init__(self, path):
+        import pandas as pd
+
+        with np.load(path) as npz:
+            meta = json.loads(npz["__meta__"].tobytes().decode())
+            self.grid_ids = npz["grid_id"].astype(object)
+            self.counts = npz["counts"]
+            self.cube = {key: npz["cube."+key] for key in
+                         ["cell", "first", "last", "count"]}
+            self.offsets = npz["cube.offsets"]
+        self.collections = meta["collections"]
+        self.codes = {name: i for i, name in enumerate(self.collections)}
+        self.rows = pd.Index(self.grid_ids)
+
+    def __len__(self):
+        return(len(self.grid_ids))
+
+    def get_codes(self, short_names):
+        """The collection codes of short_names; unknown ones are skipped."""
+        if isinstance(short_names, str):
+            short_names = [short_names]
+        return(np.array([self.codes[name] for name in short_names
+                         if name in self.codes], dtype=np.int64))
+
+    def get_rows(self, grid_ids):
+        """The rows of the counts of the cells grid_ids; -1 for unknown ids."""
+        return(self.rows.get_indexer(list(grid_ids)))
+
+    def get_counts(self, short_names=None, start=None, end=None):
+        """
+        Returns the number of granules in each cell (in the order of
+        grid_ids) of the collection(s) short_names, or of all of them if
+        None, whose months overlap [start, end]; either end can be None.
+        """
+        codes = None if short_names is None else self.get_codes(short_names)
+
+        if start is None and end is None:
+            if codes is None:
+                return(self.counts.sum(axis=1, dtype=np.int64))
+            return(self.counts[:, codes].sum(axis=1, dtype=np.int64))
+
+        a = get_month(start, np.iinfo(np.int32).min)
+        b = get_month(end, np.iinfo(np.int32).max)
+        # a collection's entries are a slice of the cube
+        spans = [(0, self.offsets[-1])] if codes is None else [
+            (self.offsets[code], self.offsets[code+1]) for code in codes]
+        counts = np.zeros(len(self), dtype=np.int64)
+        for lo, hi in spans:
+            cube = {key: values[lo:hi] for key, values in self.cube.items()}
+            keep = (cube["first"] <= b) & (cube["last"] >= a)
+            counts += np.bincount(cube["cell"][keep], weights=cube["count"][keep],
+                                  minlength=len(self)).astype(np.int64)
+        return(counts)
+
+    def get_totals(self):
+        """Each collection's (short name's) granules, summed over the cells."""
+        import pandas as pd
+        return(pd.Series(self.counts.sum(axis=0), index=self.collections))
+
+
+def convert_grid(data):
+    """Makes above_coverage.npz from the grid and granule tables."""
+    from catalog import Catalog
+
+    catalog = Catalog(data)
+    save_coverage(data+"above_coverage.npz", catalog.grid,
+                  catalog.granule_table)
+
+
+if __name__=="__main__":
+    convert_grid("data/")
@@ -1,15 +1,19 @@
 import json
 import requests
+import numpy as np
 import pandas as pd
+import shapely
 
+from shapely import STRtree, prepare
 from shapely.geometry import shape, mapping
-from shapely.ops import cascaded_union
+from shapely.ops import unary_union
 
 import qgrid
 from ipyleaflet import Map,LayerGroup,DrawControl,GeoJSON,basemaps,basemap_to_tiles,Polygon
 from ipywidgets import HTML,Layout,HBox,VBox,Textarea,Output
 
 from QueryCMR import *
+from lod import LevelsOfDetail
 
 # ---------------------------------------------------------------------------- 
 # statics
@@ -19,10 +23,10 @@ gridf = "data/ABoVE_240m_30m_5m_grid_tiles/ABoVE_240m_30m_5m_grid_tiles.json"
 with open(gridf, 'r') as file:
     above_grid = json.load(file)
 
-# the above domain; make layer now
-domainf = 'data/ABoVE_Study_Domain/ABoVE_Study_Domain.json'  
-with open(domainf, 'r') as file:
-    above_domain = json.load(file)
+# the above grid and domain simplified for each zoom (python lod.py makes
+#   them); the map gets the level for its zoom, not the full geometry
+above_grid_lod = LevelsOfDetail("data/above_grid_lod.npz")
+above_domain = LevelsOfDetail("data/above_domain_lod.npz")
 
 # get some info about ABoVE collection in CMR for ORNL
 above_search = collections.keyword("*Boreal Vulnerability Experiment*").get_all()
@@ -32,6 +36,10 @@ above_results = [r for r in above_search if any([
 ]
 above_results_df = pd.DataFrame(above_results)
 
+# parse the collections' CMR box strings once; a collection can have several
+above_boxes, above_box_owner = CMR_boxes_to_array(
+    above_results_df["boxes"] if "boxes" in above_results_df else [])
+
 # load a basemap from ESRI #basemaps.NASAGIBS.ModisTerraTrueColorCR
 esri = basemap_to_tiles(basemaps.Esri.WorldImagery)
 
@@ -52,13 +60,13 @@ geojson_text = Textarea(
     disabled=False,
     layout=Layout(width="50%", height="200px"))
     
-above_domain["features"][0]["properties"]["style"] = {
+domain_style = {
     "weight": 0.75,
     "color": "#FFFFFF",
     "fillColor": "#FFFFFF",
     "fillOpacity": 0.}
 
-domain_layer = GeoJSON(data=above_domain)
+domain_layer = GeoJSON(data=above_domain.get_geojson(3), style=domain_style)
 
 header = HTML(
     "<h4><b>Draw a polygon on the map or paste your GeoJSON: </b></h4>")
@@ -88,8 +96,8 @@ class Cell(object):
     offstyle = {"fill_opacity": 0, "color": "white", "weight": 0.75}
     onstyle = {"fill_opacity": 0.4, "color": "lightgreen", "weight": 1}
 
-    def __init__(self, feat):
-        """Inits with id,lat,lon; makes request string, map point."""
+    def __init__(self, feat, index=None):
+        """Inits with the feature; the map gets its geometry from index."""
 
         self.feat = feat
         self.shape = shape(feat["geometry"])
@@ -104,7 +112,7 @@ class Cell(object):
         self.level = self.prop["grid_level"]
         
         self.layer = GeoJSON(
-            data=self.feat,
+            data=self.get_data(index),
             hover_style = {
                 "weight": 1, 
                 "color": "white",
@@ -113,6 +121,11 @@ class Cell(object):
         self.layer.on_click(self.toggle)
         self.on = False
 
+    def get_data(self, index):
+        """The feature with its geometry from index (see lod.py), if there."""
+        geometry = (index or {}).get(self.id, self.feat["geometry"])
+        return({**self.feat, "geometry": geometry})
+
     def toggle(self, **kwargs):
         """Routine for when a cell is toggled on."""
         self.on = False if self.on else True
@@ -129,30 +142,37 @@ class App():
         self.session = session
         self.use_grid = self.settings["enabled_grid"]
 
-        # generate map grid polygon layers
+        # generate map grid polygon layers, at the level of detail for zoom 3
         self.grid_layers = LayerGroup()
         self.grid_dict = {}
+        self.grid_level = above_grid_lod.get_level(3)
+        index = above_grid_lod.get_index(3, "grid_id")
         
         for feat in above_grid["features"]:
             level = feat["properties"]["grid_level"]
             if level==self.use_grid:
-                Cell_object = Cell(feat) 
+                Cell_object = Cell(feat, index) 
                 #Cell_object.layer.on_click()
 
                 grid_id = Cell_object.id
                 self.grid_dict[grid_id] = Cell_object
                 self.grid_layers.add_layer(self.grid_dict[grid_id].layer)
+
+        # spatial index over the cells; reused by every draw event
+        self.grid_ids = list(self.grid_dict)
+        self.grid_tree = STRtree([c.shape for c in self.grid_dict.values()])
         
         # make an attribute that will hold selected layer
         self.selected_layer = LayerGroup()
 
         self.map = Map(
-            layers=(esri, self.grid_layers, self.selected_layer, ),
+            layers=(esri, domain_layer, self.grid_layers, self.selected_layer, ),
             center=(65, -100), 
             zoom=3, 
             width="auto", 
             height="auto",
             scroll_wheel_zoom=True)
+        self.map.observe(self.update_zoom, "zoom")
 
         # map draw controls
         self.draw_control = DrawControl()
@@ -181,6 +201,16 @@ class App():
         display(self.ui)
 
 
+    def update_zoom(self, change):
+        """Swaps the domain and the cells for their level at the new zoom."""
+        domain_layer.data = above_domain.get_geojson(change["new"])
+        level = above_grid_lod.get_level(change["new"])
+        if level!=self.grid_level:
+            self.grid_level = level
+            index = above_grid_lod.get_index(change["new"], "grid_id")
+            for cell in self.grid_dict.values():
+                cell.layer.data = cell.get_data(index)
+
     def update_selected_cells(self, *args, **kwargs):
         """ """
         # clear all draw and selection layers
@@ -192,18 +222,16 @@ class App():
         # make shapely geom from geojson 
         drawn_json = kwargs["geo_json"]
         shapely_geom = shape(drawn_json["geometry"])
-        cells = self.grid_dict
+        prepare(shapely_geom)
         
-        # iterate over cells and collect intersecting cells
-        on = [] 
-        for id, cell in cells.items():
-            if shapely_geom.intersects(cell.shape):
-                on.append(cell.shape)
+        # query the cell index and collect intersecting cells
+        hits = sorted(self.grid_tree.query(shapely_geom, predicate="intersects"))
+        on = [self.grid_dict[self.grid_ids[i]].shape for i in hits]
         
         # this is blatant abuse of try/except; fix it 
         try:
             # get the union of all of the cells that are toggled on
-            union = cascaded_union(on)
+            union = unary_union(on)
             centroid = union.centroid
 
             # make layer that represents selected cells and add to selected_layer
@@ -215,15 +243,18 @@ class App():
             # --------------------------------------------------------------
             # find all CMR collections that intersect with merged cells geom
 
-            selected = []
-            for index, collection in above_results_df.iterrows():
-                box = collection.boxes
-                shapely_box = CMR_box_to_Shapely_box(box[0])
-
-                # intersect: use shapely_geom if strictly using drawn poly
-                intersect_bool = shapely_box.intersects(union) 
-                if intersect_bool:
-                    selected.append(index)
+            # boxes that overlap the bounds of the union (all at once), then
+            # the exact test for those only; use shapely_geom if strictly
+            # using drawn poly
+            minx, miny, maxx, maxy = union.bounds
+            near = np.flatnonzero(
+                (above_boxes[:, 0]<=maxx) & (above_boxes[:, 2]>=minx) &
+                (above_boxes[:, 1]<=maxy) & (above_boxes[:, 3]>=miny))
+            hit = shapely.intersects(
+                shapely.box(*above_boxes[near].T), union)
+
+            # a collection is selected if any of its boxes intersect
+            selected = np.unique(above_box_owner[near[hit]])
 
             self.coll = above_results_df.iloc[selected]
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Time-to-first-map and memory of the grid layer: one GeoJSON widget per
+level-B Cell (as ABoVE.py used to build it) against the one GeoJSON layer
+the App draws now. Each is measured in a fresh process, with display
+stubbed out since there's no frontend. Run from the repo root:
+
+    python dev/bench_app.py
+
+Widgets counts the widget models made, each of which would open a comm to
+the frontend and send it its state.
+"""
+
+import os
+import sys
+import json
+import time
+import builtins
+import subprocess
+import tracemalloc
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+
+def get_cells_layer_per_cell(cells, on_click, index=None):
+    """The grid layers as App.__init__ used to build them: a widget per cell."""
+    from ipyleaflet import GeoJSON, LayerGroup
+    from ABoVE import cell_hover_style
+
+    layers = LayerGroup()
+    for cell in cells:
+        cell.feat["properties"]["style"] = {
+            "fill_opacity": 0.1, "opacity": 0.1, "color": "white", "weight": 0.75}
+        layer = GeoJSON(data=cell.feat, hover_style=cell_hover_style)
+        layer.on_click(on_click)
+        layers.add_layer(layer)
+    return(layers)
+
+
+def run(mode, trace):
+    """
+    Builds the map one way; prints a JSON line of measurements. Memory is
+    traced in a separate run, since tracing slows everything down.
+    """
+    builtins.display = lambda *args: None
+
+    import ABoVE
+    from ipywidgets import Widget
+
+    ABoVE.catalog.grid_table                            # load before timing
+    if mode=="per-cell":
+        ABoVE.get_cells_layer = get_cells_layer_per_cell
+    widgets = len(Widget.widgets)
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+
+    app = ABoVE.App()
+
+    seconds = time.perf_counter()-t0
+    current, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({
+        "seconds": seconds,
+        "widgets": len(Widget.widgets)-widgets,
+        "memory_mb": current/1e6,
+        "peak_mb": peak/1e6}))
+
+
+def main():
+    """ """
+    if len(sys.argv)>3 and sys.argv[1]=="--run":
+        return(run(sys.argv[2], sys.argv[3]=="trace"))
+
+    def measure(mode, trace):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", mode, trace],
+            check=True, capture_output=True, text=True, cwd=repo).stdout
+        return(json.loads(output.strip().splitlines()[-1]))
+
+    print("%-9s %9s %8s %12s %10s" % (
+        "layer", "time (s)", "widgets", "memory (MB)", "peak (MB)"))
+    for mode in ["per-cell", "single"]:
+        timed, traced = measure(mode, "time"), measure(mode, "trace")
+        print("%-9s %9.3f %8d %12.1f %10.1f" % (
+            mode, timed["seconds"], timed["widgets"],
+            traced["memory_mb"], traced["peak_mb"]))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Repeated searches with the Catalog's result cache: the same cell clicks and
+polygons searched again, as a user clicking back and forth in the App does.
+Run from the repo root:
+
+    python dev/bench_cache.py --clicks 200
+
+"first" is a search's first run (a miss) and "repeat" its later runs (hits).
+The last lines show eviction with a small cache and the cache being emptied
+when a table file is rewritten.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from shapely.geometry import box
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+
+
+def get_clicks(catalog, n, seed=0):
+    """n clicks on sets of 1 to 4 B cells, drawn from 20 sets."""
+    rng = np.random.default_rng(seed)
+    grid = catalog.grid_table
+    cells = grid.loc[grid["grid_level"]=="B", "grid_id"].values
+    sets = [rng.choice(cells, rng.integers(1, 5), replace=False).tolist()
+            for i in range(20)]
+    return([sets[i] for i in rng.integers(0, len(sets), n)])
+
+
+def timed(function, *args, **kwargs):
+    """ """
+    t0 = time.perf_counter()
+    result = function(*args, **kwargs)
+    return(result, time.perf_counter()-t0)
+
+
+def run(catalog, name, searches):
+    """Runs each search; prints the mean time of misses and of hits."""
+    first, repeat = [], []
+    for search in searches:
+        misses = catalog.results.misses
+        result, seconds = timed(search)
+        (first if catalog.results.misses>misses else repeat).append(seconds)
+    print("%-22s %6d %12.3f %6d %12.3f" % (
+        name, len(first), np.mean(first)*1e3 if first else np.nan,
+        len(repeat), np.mean(repeat)*1e3 if repeat else np.nan))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clicks", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    catalog.get_locator_tree("granules")                # load up front
+    catalog.get_locator_tree("datasets")
+    catalog.grid_tree
+    clicks = get_clicks(catalog, args.clicks)
+    window = dict(start="2017-06-01", end="2017-08-31T23:59:59.999Z")
+    polygons = [box(x, 60, x+1.5, 61.5) for x in range(-160, -110, 5)]*10
+
+    print("%-22s %6s %12s %6s %12s" % (
+        "search", "first", "(ms)", "repeat", "(ms)"))
+    run(catalog, "cells: granules", [
+        lambda on=on: catalog.get_by_tiles(on, "granules") for on in clicks])
+    run(catalog, "cells: datasets", [
+        lambda on=on: catalog.get_by_tiles(on, "datasets") for on in clicks])
+    run(catalog, "cells: granules, time", [
+        lambda on=on: catalog.get_by_tiles(on, "granules", **window)
+        for on in clicks])
+    run(catalog, "polygon: granules", [
+        lambda g=g: catalog.query(geometry=g) for g in polygons])
+    run(catalog, "polygon: cells", [
+        lambda g=g: catalog.get_tiles_in(g) for g in polygons])
+    print("\n", catalog.results.stats())
+
+    # a cache too small for every click's results evicts the oldest
+    small = Catalog(max_results=8)
+    for on in clicks:
+        small.get_by_tiles(on, "granules")
+    print("max 8 results: ", small.results.stats())
+
+    # rewriting a table file empties the cache at the next search
+    with tempfile.TemporaryDirectory() as data:
+        for name in os.listdir(catalog.data):
+            if name.endswith(".npz"):
+                shutil.copy(os.path.join(catalog.data, name), data)
+        copy = Catalog(data+os.sep)
+        copy.get_by_tiles(clicks[0], "granules")
+        copy.get_by_tiles(clicks[0], "granules")
+        before = copy.results.stats()
+        name = next(iter(copy.files))
+        os.utime(os.path.join(data, name))
+        copy.get_by_tiles(clicks[0], "granules")
+        print("rewritten file: hits %d -> %d, misses %d -> %d" % (
+            before["hits"], copy.results.hits, before["misses"],
+            copy.results.misses))
+
+
+if __name__=="__main__":
+    main()
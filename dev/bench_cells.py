@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Latency of polygon -> grid cell selection: the loop over every cell from
+update_poly_drawn, a flat STR-tree over the level's cells (CellIndex) and
+the Catalog's A > B > C descent (GridTree), for drawn polygons with more and
+more vertices. Run from the repo root:
+
+    python dev/bench_cells.py --repeat 5 [--data path/to/data/]
+
+Levels are skipped if the grid table doesn't have them; C needs a grid
+table built with enabled_levels including "C" (above_grid_table_abc.npz).
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import shapely
+
+from shapely.geometry import Polygon
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+
+
+def get_drawn_polygon(vertices, center=(-147.5, 64.8), radius=6.0, seed=0):
+    """A jagged polygon around center, like a detailed AOI pasted as GeoJSON."""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2*np.pi, vertices, endpoint=False)
+    r = radius*(0.7+0.3*rng.random(vertices))
+    x = center[0]+r*np.cos(angles)*2
+    y = center[1]+r*np.sin(angles)
+    return(Polygon(zip(x, y)))
+
+
+def best(function, repeat, *args):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data", default=None)
+    args = parser.parse_args()
+
+    catalog = Catalog() if args.data is None else Catalog(args.data)
+    levels = sorted(set(catalog.grid_table["grid_level"]))
+
+    t0 = time.perf_counter()
+    catalog.grid_tree
+    print("A > B > C hierarchy built once in %.1f ms" % (
+        (time.perf_counter()-t0)*1e3))
+
+    print("%-5s %6s %9s %6s %11s %11s %13s %9s" % (
+        "level", "cells", "vertices", "hits", "loop (ms)", "tree (ms)",
+        "descent (ms)", "speedup"))
+    for level in levels:
+        t0 = time.perf_counter()
+        index = catalog.get_cell_index(level)
+        build = time.perf_counter()-t0
+        shapes = list(index.shapes)
+        ids = catalog.grid_table["grid_id"].values[index.rows]
+
+        # both start from the drawn GeoJSON's geometry, fresh each event
+        def loop(wkb):
+            geometry = shapely.from_wkb(wkb)
+            return([i for i, cell in zip(ids, shapes) if geometry.intersects(cell)])
+
+        def tree(wkb):
+            return(ids[np.searchsorted(index.rows, index.query(
+                shapely.from_wkb(wkb)))].tolist())
+
+        def descent(wkb):
+            return(catalog.get_tiles_in(shapely.from_wkb(wkb), level))
+
+        # the loop gets too slow to repeat over the C cells
+        loop_repeat = args.repeat if len(index)<10000 else 1
+        for vertices in [4, 32, 256, 2048, 16384]:
+            polygon = shapely.to_wkb(get_drawn_polygon(vertices))
+            old, t_old = best(loop, loop_repeat, polygon)
+            flat, t_flat = best(tree, args.repeat, polygon)
+            new, t_new = best(descent, args.repeat, polygon)
+            assert old==flat==new
+            print("%-5s %6d %9d %6d %11.3f %11.3f %13.3f %8.1fx" % (
+                level, len(index), vertices, len(new), t_old*1e3,
+                t_flat*1e3, t_new*1e3, t_old/t_new))
+        print("%-5s index built once in %.1f ms" % (level, build*1e3))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+A dataset click's lookups: the dfsel scans of handle_dataset_table_select
+(title over the datasets, then collection_short_name over every granule)
+against the Catalog's CollectionIndex (a hash lookup, then a slice of the
+granule rows sorted by collection). Run from the repo root:
+
+    python dev/bench_collections.py --scale 1 10 100
+
+--scale copies the tables that many times, each copy with its own titles
+and short names, to stand in for a catalog the size of all of ORNL's.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog, dfsel
+from indexes import CollectionIndex
+
+
+def get_scaled(table, columns, scale):
+    """Copies of table, with "-i" on the columns in every copy but the first."""
+    copies = [table]
+    for i in range(1, scale):
+        copies.append(table.assign(**{c: table[c]+"-%d" % i for c in columns}))
+    return(pd.concat(copies, ignore_index=True))
+
+
+def best(function, repeat, *args):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    rng = np.random.default_rng(0)
+
+    print("%6s %9s %10s %11s %12s %9s" % (
+        "scale", "granules", "build (ms)", "scan (ms)", "index (ms)", "speedup"))
+    for scale in args.scale:
+        datasets = get_scaled(
+            catalog.dataset_table, ["title", "short_name", "conceptid"], scale)
+        granules = get_scaled(catalog.granule_table,
+                              ["collection_short_name", "conceptid"], scale)
+
+        t0 = time.perf_counter()
+        index = CollectionIndex(datasets, granules)
+        build = time.perf_counter()-t0
+
+        titles = rng.choice(datasets["title"].values, 20)
+
+        def scan(title):
+            dataset = dfsel(datasets, "title", title)
+            short_name = dataset["short_name"].item()
+            return(dfsel(granules, "collection_short_name", short_name).index.values)
+
+        def lookup(title):
+            row = index.get_dataset_rows([title], "title")
+            return(index.get_rows(datasets["short_name"].values[row]))
+
+        t_old = t_new = 0
+        for title in titles:
+            old, t = best(scan, max(1, args.repeat//scale), title)
+            t_old += t
+            new, t = best(lookup, args.repeat, title)
+            t_new += t
+            assert old.tolist()==new.tolist()
+
+        print("%6d %9d %10.1f %11.3f %12.3f %8.0fx" % (
+            scale, len(granules), build*1e3, t_old/len(titles)*1e3,
+            t_new/len(titles)*1e3, t_old/t_new))
+
+
+if __name__=="__main__":
+    main()
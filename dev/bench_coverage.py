@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Granule counts per cell for the map's coverage colors: from the cube in
+data/above_coverage.npz (coverage.Coverage) against from the granule rows
+linked to the cells, one cell at a time as the app's searches would, and
+all at once over the grid's CSR. Run from the repo root, after coverage.py:
+
+    python dev/bench_coverage.py
+
+The windows start and end on month boundaries, so all three agree.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+
+windows = [(None, None), ("2015-01-01", None), ("2008-01-01", "2010-12-31")]
+
+
+def timed(function, *args, repeat=5):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def count_cells(catalog, grid_ids, short_names, start, end):
+    """Each cell's granules, from get_query_ix for that cell."""
+    return(np.array([len(catalog.get_query_ix(
+        "granules", tiles=[grid_id], start=start, end=end,
+        short_name=short_names)) for grid_id in grid_ids]))
+
+
+def count_links(catalog, rows, short_names, start, end):
+    """Each cell's granules, from a mask over all of the cells' links."""
+    csr = catalog.grid.ragged["granule_locator_ix"]
+    cells = np.repeat(np.arange(len(rows)), csr.offsets[rows+1]-csr.offsets[rows])
+    ix = csr.take(rows)
+    keep = catalog.get_time_index("granules").get_mask(ix, start, end)
+    if short_names is not None:
+        keep &= catalog.collection_index.get_mask(ix, short_names)
+    return(np.bincount(cells[keep], minlength=len(rows)))
+
+
+def main():
+    """ """
+    catalog = Catalog()
+    coverage = catalog.coverage
+    if coverage is None:
+        sys.exit("no data/above_coverage.npz; run python coverage.py first")
+
+    grid_ids = coverage.grid_ids.tolist()
+    rows = catalog.tile_index.get_rows(grid_ids)
+    totals = coverage.get_totals().sort_values(ascending=False)
+    filters = [None, [totals.index[0]], list(totals.index[:10])]
+    print("%d cells, %d collections, %d cube entries\n" % (
+        len(coverage), len(coverage.collections), len(coverage.cube["count"])))
+
+    print("%-16s %-24s %12s %12s %12s" % (
+        "collections", "window", "per cell", "all links", "cube"))
+    for short_names in filters:
+        for start, end in windows:
+            counted, t_cells = timed(count_cells, catalog, grid_ids,
+                                     short_names, start, end, repeat=1)
+            linked, t_links = timed(count_links, catalog, rows,
+                                    short_names, start, end)
+            counts, t_cube = timed(coverage.get_counts, short_names, start, end)
+            assert np.array_equal(counted, counts)
+            assert np.array_equal(linked, counts)
+            print("%-16s %-24s %12.2f %12.2f %12.2f" % (
+                "all" if short_names is None else len(short_names),
+                "%s - %s" % (start or "", end or ""),
+                t_cells*1e3, t_links*1e3, t_cube*1e3))
+    print("(ms)")
+
+
+if __name__=="__main__":
+    main()
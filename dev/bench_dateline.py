@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Cell -> granule fan-out with boxes across the antimeridian taken as they
+are (shapely.box, which spans the globe the long way) against split in two
+(linkage.BoxTree), for the A and B cells. Run from the repo root:
+
+    python dev/bench_dateline.py --bering 200
+
+First for the catalog as it is, then with --bering granules added: boxes 2
+to 20 degrees wide over the Bering Strait, most of them across 180 (the
+grid reaches -177 degrees there). Then the Bering Strait granules again as
+rows with only a bounds_shapely (cmr.get_bounds_shapely), whose Shapely
+bounds are -180 to 180: linkage.get_bounds has to get their west and east
+back before they are split.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import shapely
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from cmr import get_bounds_shapely
+from catalog import Catalog
+from linkage import BoxTree, get_bounds, split_bounds
+
+
+def get_bering(n, seed=0):
+    """n boxes (minlon, minlat, maxlon, maxlat) from 165 to -160 degrees."""
+    rng = np.random.default_rng(seed)
+    west = rng.uniform(165, 180, n)
+    east = west+rng.uniform(2, 20, n)
+    south = rng.uniform(58, 68, n)
+    north = south+rng.uniform(0.5, 4, n)
+    wrap = lambda x: np.where(x>180, x-360, x)
+    return(np.column_stack([wrap(west), south, wrap(east), north]))
+
+
+def fan_out(shapes, tree):
+    """Links per cell, and the time to make them."""
+    t0 = time.perf_counter()
+    cell_ix, row_ix = tree.query(shapes, predicate="intersects")
+    seconds = time.perf_counter()-t0
+    return(np.bincount(cell_ix, minlength=len(shapes)), seconds)
+
+
+def report(name, shapes, bounds):
+    """ """
+    parts, owner = split_bounds(bounds)
+    crossing = len(parts)-len(bounds)
+    whole = shapely.STRtree(shapely.box(*bounds.T))
+    split = BoxTree(bounds)
+    print("%s: %d granules, %d across the antimeridian" % (
+        name, len(bounds), crossing))
+    print("%-8s %10s %10s %8s %10s" % ("boxes", "links", "per cell", "max", "(ms)"))
+    for label, tree in [("whole", whole), ("split", split)]:
+        counts, seconds = fan_out(shapes, tree)
+        print("%-8s %10d %10.1f %8d %10.1f" % (
+            label, counts.sum(), counts.mean(), counts.max(), seconds*1e3))
+    print()
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--bering", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    rows = np.flatnonzero(catalog.grid.frame["grid_level"].values!="C")
+    shapes = catalog.grid.get_shapes("geometry", rows)
+    bounds = catalog.granules.get_bounds()
+    bounds = bounds[np.isfinite(bounds).all(axis=1)]
+
+    report("catalog", shapes, bounds)
+    bering = get_bering(args.bering)
+    report("catalog + Bering Strait", shapes, np.concatenate([bounds, bering]))
+
+    table = pd.DataFrame({
+        "minlon": np.nan, "minlat": np.nan, "maxlon": np.nan, "maxlat": np.nan,
+        "bounds_shapely": [get_bounds_shapely(b) for b in bering]})
+    assert np.allclose(get_bounds(table), bering)
+    whole = shapely.bounds(table["bounds_shapely"].values.astype(object))
+    report("Bering Strait, Shapely bounds", shapes, whole)
+    report("Bering Strait, linkage.get_bounds", shapes, get_bounds(table))
+
+
+if __name__=="__main__":
+    main()
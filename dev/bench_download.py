@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+download.py against the stand-in data pool (dev/stub_files.py): throughput
+with 1 to 8 workers from a server limited to --rate MB/s per file, then a
+run with failures and cut-off responses, a rerun that resumes .part files,
+and bad checksums and sizes. Run from the repo root:
+
+    python dev/bench_download.py --files 24 --size 4
+
+The files are random bytes at the url paths of the first --files granules,
+with granule_size parsed by cmr.get_size from their sizes in KB or MB,
+rounded like the DAAC's.
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cmr
+import download
+import stub_files
+
+from catalog import Catalog
+from urllib.parse import urlparse
+
+
+def make_files(pool, granules, size, seed=0):
+    """
+    Writes a file of about size MB under pool for each granule; returns the
+    granules pointing at the stub, with their granule_size, and the md5s.
+    """
+    rng = np.random.default_rng(seed)
+    paths, sizes, checksums = [], [], {}
+    for url in granules["url_datapool"]:
+        path = urlparse(url).path
+        nbytes = int(size*cmr.size_unit*rng.uniform(0.5, 1.5))
+        data = rng.bytes(nbytes)
+        os.makedirs(os.path.dirname(pool+path), exist_ok=True)
+        with open(pool+path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+        unit = ["KB", "MB"][len(paths) % 2]
+        sizes.append(cmr.get_size({"DataGranule": {
+            "ArchiveAndDistributionInformation": [{
+                "Size": round(nbytes/cmr.size_units[unit], 2),
+                "SizeUnit": unit}]}}))
+        checksums[download.get_file_name(url)] = hashlib.md5(data).hexdigest()
+    return(granules.assign(granule_size=sizes, granule_files=1.,
+                           url_datapool=paths), checksums)
+
+
+def run(granules, port, folder, **kwargs):
+    """ """
+    table = granules.assign(url_datapool="http://localhost:%d" % port+
+                            granules["url_datapool"])
+    t0 = time.perf_counter()
+    results = download.download(table, folder, progress=None, **kwargs)
+    return(results, time.perf_counter()-t0)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--size", type=float, default=4, help="MB per file")
+    parser.add_argument("--rate", type=float, default=8, help="MB/s per file")
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    granules = catalog.granule_table.drop_duplicates("url_datapool")
+    granules = granules.iloc[:args.files]
+
+    with tempfile.TemporaryDirectory() as pool:
+        granules, checksums = make_files(pool, granules, args.size)
+        total = granules["granule_size"].sum()*cmr.size_unit
+        slow = stub_files.serve(pool, 8091, rate=args.rate*1e6)
+        faulty = stub_files.serve(pool, 8092, fail_every=5, cut_every=3)
+
+        print("%d files, %.1f MB, at most %.1f MB/s per file\n" % (
+            len(granules), total/1e6, args.rate))
+        print("%8s %10s %10s" % ("workers", "time (s)", "MB/s"))
+        for workers in [1, 2, 4, 8]:
+            with tempfile.TemporaryDirectory() as folder:
+                results, seconds = run(granules, 8091, folder, workers=workers,
+                                       checksums=checksums)
+                assert (results["status"]=="done").all()
+            print("%8d %10.2f %10.1f" % (workers, seconds, total/1e6/seconds))
+
+        with tempfile.TemporaryDirectory() as folder:
+            plan = download.estimate(download.get_transfers(granules, folder))
+            print("\ndry run: %d files, %.1f MB" % (plan["files"], plan["bytes"]/1e6))
+
+            # a 503 every 5th request and every 3rd response cut off
+            results, seconds = run(granules, 8092, folder, workers=4,
+                                   checksums=checksums, backoff=0.01)
+            print("503s and cut-off responses: %s, %.1f MB fetched for %.1f MB" % (
+                results["status"].value_counts().to_dict(),
+                results["fetched"].sum()/1e6, total/1e6))
+            assert (results["status"]=="done").all()
+            assert (results["digest"]==[checksums[os.path.basename(p)]
+                                        for p in results["path"]]).all()
+
+            # the next run finds the files there, and resumes a .part file
+            path = results["path"].iloc[0]
+            with open(path, "rb") as f:
+                head = f.read(os.path.getsize(path)//3)
+            os.remove(path)
+            with open(path+".part", "wb") as f:
+                f.write(head)
+            plan = download.estimate(download.get_transfers(granules, folder))
+            print("dry run again: %d files, %.1f MB to resume" % (
+                plan["files"], plan["resumed_bytes"]/1e6))
+            results, seconds = run(granules, 8091, folder, checksums=checksums)
+            print("rerun: %s, %.1f MB fetched" % (
+                results["status"].value_counts().to_dict(),
+                results["fetched"].sum()/1e6))
+            assert results["fetched"].sum()==os.path.getsize(path)-len(head)
+
+        with tempfile.TemporaryDirectory() as folder:
+            wrong = dict(checksums)
+            first = download.get_file_name(granules["url_datapool"].iloc[0])
+            wrong[first] = "0"*32
+            bad_size = granules.assign(granule_size=granules["granule_size"]*2)
+            results, seconds = run(granules.iloc[:1], 8091, folder,
+                                   checksums=wrong, attempts=2)
+            print("bad checksum: %s (%s)" % (results["status"][0], results["error"][0]))
+            results, seconds = run(bad_size.iloc[:1], 8091, folder)
+            print("bad granule_size: %s (%s)" % (results["status"][0], results["error"][0]))
+
+        # granule_size is the size of all of a granule's files, so a granule
+        #   of two isn't checked against it
+        with tempfile.TemporaryDirectory() as folder:
+            results, seconds = run(bad_size.iloc[:1].assign(granule_files=2.),
+                                   8091, folder)
+            assert (results["status"]=="done").all()
+            print("granule of two files: %s" % results["status"][0])
+
+        # the same file name in two collections gets a line each in the
+        #   manifest, and both are found there when they're checked again
+        with tempfile.TemporaryDirectory() as folder:
+            one = granules.iloc[:1]
+            path = one["url_datapool"].iloc[0]
+            os.makedirs(os.path.dirname(pool+"/copy"+path))
+            with open(pool+path, "rb") as f, open(pool+"/copy"+path, "wb") as g:
+                g.write(f.read())
+            twice = pd.concat([
+                one.assign(collection_short_name="A"),
+                one.assign(collection_short_name="B",
+                           url_datapool="/copy"+path)])
+            results, seconds = run(twice, 8091, folder)
+            manifest = download.read_checksums(os.path.join(folder, "checksums.md5"))
+            assert sorted(manifest)==sorted(os.path.relpath(p, folder)
+                                            for p in results["path"])
+            results, seconds = run(twice, 8091, folder, checksums=manifest)
+            assert (results["status"]=="exists").all()
+            print("one file name in two collections: %d lines in the manifest"
+                  % len(manifest))
+
+        slow.shutdown()
+        faulty.shutdown()
+
+
+if __name__=="__main__":
+    main()
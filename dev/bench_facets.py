@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Parameter facet counts and filters for granule selections: counting and
+testing the lists of parameters row by row (a Counter over the object
+column, or pandas explode) against indexes.FacetIndex's bitmaps. The
+granule table is repeated --scale times. Run from the repo root:
+
+    python dev/bench_facets.py --scale 16
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+from indexes import FacetIndex
+from store import CSR
+
+
+def timed(function, *args, repeat=5):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def count_rows(params, ix):
+    """Counts the parameters of the rows ix one row at a time."""
+    return(Counter(p for i in ix for p in set(params[i] or [])))
+
+
+def count_explode(params, ix):
+    """ """
+    return(params.iloc[ix].explode().dropna().groupby(level=0).unique(
+        ).explode().value_counts())
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", type=int, default=16)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    granules = catalog.granules
+    csr, vocab = granules.ragged["granule_params"], granules.vocab["granule_params"]
+
+    # the table repeated, as a CSR of codes and as the old object column
+    lengths = np.tile(csr.lengths(), args.scale)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    scaled = CSR(offsets, np.tile(csr.values, args.scale))
+    names = np.array(vocab, dtype=object)
+    params = pd.Series([names[scaled[i]].tolist() for i in range(len(scaled))])
+
+    index, seconds = timed(FacetIndex, scaled, vocab, repeat=1)
+    print("%d granules, %d parameters; bitmaps built in %.1f ms (%.1f MB)\n" % (
+        len(scaled), len(vocab), seconds*1e3, index.bitmaps.nbytes/1e6))
+
+    rng = np.random.default_rng(0)
+    print("%10s %14s %14s %14s %14s %14s" % (
+        "selected", "counts: rows", "explode", "bitmaps", "filter: rows",
+        "bitmaps"))
+    for share in [0.01, 0.1, 0.5, 1.0]:
+        ix = np.sort(rng.choice(len(scaled), int(share*len(scaled)), replace=False))
+
+        counted, t_rows = timed(count_rows, params, ix)
+        exploded, t_explode = timed(count_explode, params, ix)
+        counts, t_bits = timed(index.get_counts, ix)
+        assert counts.to_dict()==dict(counted)
+
+        wanted = {"PERMAFROST", "ACTIVE LAYER"}
+        kept, t_filter_rows = timed(lambda: ix[np.fromiter(
+            (bool(wanted.intersection(params[i])) for i in ix), bool, len(ix))])
+        masked, t_filter_bits = timed(lambda: ix[index.get_mask(ix, wanted)])
+        assert np.array_equal(kept, masked)
+
+        print("%10d %14.2f %14.2f %14.2f %14.2f %14.2f" % (
+            len(ix), t_rows*1e3, t_explode*1e3, t_bits*1e3,
+            t_filter_rows*1e3, t_filter_bits*1e3))
+    print("(ms)")
+
+
+if __name__=="__main__":
+    main()
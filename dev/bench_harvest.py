@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+cmr.harvest_granules against the stand-in CMR (dev/stub_cmr.py), with a
+corpus made from the shipped pickles. Run from the repo root:
+
+    python dev/bench_harvest.py --page-size 100 --workers 4 --latency 0.05
+
+The throughput table is against a stub that waits --latency seconds before
+each response, for the round trip and search time of a request to CMR; it
+is what the workers overlap. With --latency 0 the stub only serves pages
+from memory, and on one core the workers just take turns with it.
+
+Each run must give back every granule of every collection, in order, in
+pages of at most --page-size:
+
+  - paging with the CMR-Search-After header, 1 to --workers workers
+  - a 503 every 7th request, which the session retries
+  - a consumer slower than the workers, so the queue is full and most
+    collections are done before the consumer gets to them
+  - a collection with no granules, and one the stub doesn't know
+
+Then the generator is closed after its first page, which must return
+without waiting for the rest of the harvest.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cmr
+import stub_cmr
+
+
+def get_expected(corpus, conceptids):
+    """The granule concept-ids of each collection, from the corpus."""
+    expected = []
+    for conceptid in conceptids:
+        path = os.path.join(corpus, conceptid+".json")
+        items = json.load(open(path)) if os.path.exists(path) else []
+        expected.append([item["meta"]["concept-id"] for item in items])
+    return(expected)
+
+
+def check(pages, expected, page_size):
+    """ """
+    got = [[] for c in expected]
+    numbers = [[] for c in expected]
+    for position, number, table in pages:
+        assert len(table) <= page_size
+        got[position].extend(table["conceptid"].tolist())
+        numbers[position].append(number)
+    for position, conceptids in enumerate(expected):
+        assert sorted(numbers[position])==list(range(len(numbers[position])))
+    assert [sorted(g) for g in got]==[sorted(e) for e in expected]
+
+
+def harvest(conceptids, port, workers, page_size, backoff=0.5, delay=0):
+    """All of the pages, taking delay seconds over each."""
+    pages = []
+    for page in cmr.harvest_granules(
+            conceptids, workers=workers, page_size=page_size,
+            session=cmr.get_session(workers, backoff=backoff),
+            cmr="http://localhost:%d/search/" % port):
+        pages.append(page)
+        time.sleep(delay)
+    return(pages)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus:
+        stub_cmr.synthesize(corpus)
+        conceptids = sorted(f[:-5] for f in os.listdir(corpus))
+        with open(os.path.join(corpus, "C0-EMPTY.json"), "w") as f:
+            json.dump([], f)
+        conceptids += ["C0-EMPTY", "C0-UNKNOWN"]
+        expected = get_expected(corpus, conceptids)
+        n = sum(len(e) for e in expected)
+
+        clean = stub_cmr.serve(corpus, 8093)
+        faulty = stub_cmr.serve(corpus, 8094, fail_every=7)
+        remote = stub_cmr.serve(corpus, 8095, latency=args.latency)
+
+        print("\n%.2f s per request" % args.latency)
+        print("%8s %10s %10s %12s" % ("workers", "pages", "time (s)", "granules/s"))
+        workers = 1
+        while True:
+            t0 = time.perf_counter()
+            pages = harvest(conceptids, 8095, workers, args.page_size)
+            seconds = time.perf_counter()-t0
+            check(pages, expected, args.page_size)
+            print("%8d %10d %10.2f %12.0f" % (workers, len(pages), seconds, n/seconds))
+            if workers >= args.workers:
+                break
+            workers = min(2*workers, args.workers)
+
+        pages = harvest(conceptids, 8094, args.workers, args.page_size,
+                        backoff=0.01)
+        check(pages, expected, args.page_size)
+        print("\n503 every 7th request: every granule, %d pages" % len(pages))
+
+        # far more pages than the queue holds, and a consumer that waits
+        largest = sorted(range(len(expected)), key=lambda i: -len(expected[i]))
+        small = [conceptids[i] for i in largest[:2]]+["C0-EMPTY", "C0-UNKNOWN"]
+        pages = harvest(small, 8093, 2, 50, delay=0.002)
+        check(pages, get_expected(corpus, small), 50)
+        print("slow consumer: every granule, %d pages" % len(pages))
+
+        table = cmr.harvest_granules_table(
+            conceptids, workers=args.workers, page_size=args.page_size,
+            cmr="http://localhost:8093/search/")
+        assert table["conceptid"].tolist()==[c for e in expected for c in e]
+        assert table["granule_size"].notna().all()
+        print("harvest_granules_table: %d granules in collection order" % len(table))
+
+        # closing early stops the workers instead of harvesting the rest
+        before = threading.active_count()
+        t0 = time.perf_counter()
+        generator = cmr.harvest_granules(
+            conceptids, workers=args.workers, page_size=10,
+            cmr="http://localhost:8093/search/")
+        next(generator)
+        generator.close()
+        seconds = time.perf_counter()-t0
+        assert seconds < 5, seconds
+        assert threading.active_count() <= before, threading.enumerate()
+        print("closed after one page in %.2f s; no workers left" % seconds)
+
+        clean.shutdown()
+        faulty.shutdown()
+        remote.shutdown()
+
+
+if __name__=="__main__":
+    main()
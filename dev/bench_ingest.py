@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Items/sec parsing recorded pages of CMR UMM-JSON granules: json.loads and
+the per-item get_granules_table that cmr.py used to have, against
+cmr.decode and cmr.ingest with json and with orjson (if it's installed).
+Run from the repo root:
+
+    python dev/bench_ingest.py                 # pages made from the pickles
+    python dev/bench_ingest.py --corpus CORPUS # pages recorded by stub_cmr.py
+
+A corpus holds one JSON list of granule items per collection (see
+dev/stub_cmr.py); it's cut into pages of --page-size items, encoded as CMR
+sends them, before timing.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from shapely.geometry import box
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cmr
+
+from store import fix_granule_bounds
+
+
+def get_granules_table_items(cmr_granules_response_dictionary):
+    """get_granules_table as it was: per-item lookups in try/except."""
+
+    granule_rows = []
+
+    for granule in cmr_granules_response_dictionary["items"]:
+
+        umm = granule["umm"]
+        meta = granule["meta"]
+        archive = meta["provider-id"]
+        conceptid = meta["concept-id"]
+
+        try:
+            granuleid = meta["native-id"]
+        except:
+            granuleid = None
+
+        if (len(umm["Projects"])==1)&(granuleid is not None):
+
+            try:
+                collection_short_name = umm["CollectionReference"]["ShortName"]
+            except:
+                collection_short_name = None
+
+            try:
+                granule_size = umm["DataGranule"]["ArchiveAndDistributionInformation"]["Size"]
+            except:
+                granule_size = None
+
+            try:
+                granule_params = cmr.get_granule_parameters(umm)
+            except:
+                granule_params = None
+
+            range_time = umm["TemporalExtent"]["RangeDateTime"]
+            start_time = range_time["BeginningDateTime"]
+            end_time = range_time["EndingDateTime"]
+
+            url_datapool = cmr.get_urls(umm, "granules")
+
+            try:
+                bounds = cmr.get_bounds(umm)
+                bounds_shapely = box(*[float(b) for b in bounds])
+                minlon = bounds[0]
+                maxlon = bounds[1]
+                minlat = bounds[3]
+                maxlat = bounds[2]
+
+                granule_rows.append((
+                    archive, collection_short_name, conceptid, granuleid,
+                    granule_size, granule_params, start_time, end_time,
+                    minlon, maxlon, minlat, maxlat, url_datapool,
+                    bounds_shapely))
+            except:
+                pass
+
+    return(pd.DataFrame(granule_rows, columns=[
+        "archive", "collection_short_name", "conceptid", "granuleid",
+        "granule_size", "granule_params", "start_time", "end_time", "minlon",
+        "maxlon", "minlat", "maxlat", "url_datapool", "bounds_shapely"]))
+
+
+def get_pages(corpus, page_size):
+    """Cuts every collection in corpus into pages; returns their bodies."""
+    pages = []
+    for name in sorted(os.listdir(corpus)):
+        with open(os.path.join(corpus, name)) as f:
+            items = json.load(f)
+        for start in range(0, len(items), page_size):
+            page = items[start:start+page_size]
+            pages.append(json.dumps(
+                {"hits": len(items), "took": 1, "items": page}).encode())
+    return(pages)
+
+
+def best(function, repeat):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--corpus")
+    parser.add_argument("--page-size", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus:
+        if args.corpus is None:
+            import stub_cmr
+            stub_cmr.synthesize(corpus)
+        pages = get_pages(args.corpus or corpus, args.page_size)
+    items = sum(len(json.loads(page)["items"]) for page in pages)
+    print("%d pages, %d items, %.1f MB\n" % (
+        len(pages), items, sum(map(len, pages))/1e6))
+
+    decoders = [("json", json.loads)]
+    try:
+        import orjson
+        decoders.append(("orjson", orjson.loads))
+    except ModuleNotFoundError:
+        print("(orjson isn't installed)")
+
+    old, t_old = best(lambda: pd.concat([get_granules_table_items(
+        json.loads(page)) for page in pages], ignore_index=True), args.repeat)
+
+    decoded, t_decode = best(lambda: [json.loads(p) for p in pages], args.repeat)
+    print("%-30s %10s %10s %12s" % ("", "decode (s)", "total (s)", "items/s"))
+    print("%-30s %10.3f %10.3f %12.0f" % (
+        "json + per-item try/except", t_decode, t_old, items/t_old))
+
+    for name, loads in decoders:
+        decode = lambda page: cmr.decode(page, loads)
+        decoded, t_decode = best(lambda: [decode(p) for p in pages], args.repeat)
+        new, t_new = best(lambda: cmr.ingest(
+            [decode(p) for p in pages]), args.repeat)
+        print("%-30s %10.3f %10.3f %12.0f" % (
+            name+" + cmr.ingest", t_decode, t_new, items/t_new))
+
+    # the same rows, with the bbox columns the right way round
+    fixed = fix_granule_bounds(old)
+    for column in ["granuleid", "start_time", "url_datapool"]:
+        assert old[column].tolist()==new[column].tolist()
+    for column in ["minlon", "minlat", "maxlon", "maxlat"]:
+        assert np.allclose(fixed[column].astype(float), new[column])
+    assert (new["minlat"] <= new["maxlat"]).all()
+    print("\nsizes parsed: %d before, %d now (of %d)" % (
+        old["granule_size"].notna().sum(), new["granule_size"].notna().sum(),
+        len(new)))
+
+    # every size in MB, whatever its SizeUnit
+    items = [item for page in pages for item in json.loads(page)["items"]]
+    sizes = [sum(f["Size"]*cmr.size_units[f["SizeUnit"]] for f in item["umm"][
+        "DataGranule"]["ArchiveAndDistributionInformation"])/cmr.size_unit
+             for item in items]
+    units = {f["SizeUnit"] for item in items for f in item["umm"][
+        "DataGranule"]["ArchiveAndDistributionInformation"]}
+    assert np.allclose(new["granule_size"], sizes)
+    print("sizes in MB from SizeUnits %s" % ", ".join(sorted(units)))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Compare the STR-tree linkage builder (linkage.py) to the nested iterrows loop
+from build-cmr-tables.ipynb on the shipped pickles. Run from the repo root:
+
+    python dev/bench_linkage.py --cells 24
+
+The loop is slow, so it only runs on the first N grid cells; the builder
+runs on those cells and on the full grid. The two must agree exactly; the
+full build is also compared to the shipped above_grid_table, which can differ
+for degenerate (zero-area) boxes depending on the GEOS version.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from linkage import build_grid_table, get_grid_features
+
+
+def build_grid_table_loop(features, dataset_locator_table, granule_locator_table):
+    """The grid-table cell from build-cmr-tables.ipynb, minus unused columns."""
+
+    rows = []
+    for feature in features:
+        geom_grid = feature["bounds_shapely"]
+
+        dataset_locator_indices = []
+        for index, row in dataset_locator_table.iterrows():
+            if row["bounds_shapely"].intersects(geom_grid):
+                dataset_locator_indices.append(index)
+
+        granule_locator_indices = []
+        for index, row in granule_locator_table.iterrows():
+            if row["bounds_shapely"].intersects(geom_grid):
+                granule_locator_indices.append(index)
+
+        rows.append((dataset_locator_indices, granule_locator_indices))
+
+    return(pd.DataFrame(rows, columns=[
+        "dataset_locator_ix", "granule_locator_ix"]))
+
+
+def timed(function, *args, **kwargs):
+    """ """
+    t0 = time.perf_counter()
+    result = function(*args, **kwargs)
+    return(result, time.perf_counter()-t0)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cells", type=int, default=24,
+                        help="number of grid cells to run the loop on")
+    args = parser.parse_args()
+
+    data = os.path.join(repo, "data")
+    dataset_table = pd.read_pickle(os.path.join(data, "above_dataset_table.pkl"))
+    granules_table = pd.read_pickle(os.path.join(data, "above_granules_table.pkl"))
+    shipped = pd.read_pickle(os.path.join(data, "above_grid_table_ab.pkl"))
+
+    features = get_grid_features(shipped)
+    subset = features[:args.cells]
+    print("datasets: %d, granules: %d, cells: %d (loop on %d)" % (
+        len(dataset_table), len(granules_table), len(features), len(subset)))
+
+    loop, t_loop = timed(build_grid_table_loop, [
+        {"bounds_shapely": g} for g in shipped["bounds_shapely"][:len(subset)]],
+        dataset_table, granules_table)
+    tree, t_tree = timed(build_grid_table, subset, dataset_table, granules_table)
+    full, t_full = timed(build_grid_table, features, dataset_table, granules_table)
+
+    for column in ["dataset_locator_ix", "granule_locator_ix"]:
+        assert loop[column].tolist()==tree[column].tolist(), column
+
+    per_loop, per_tree = t_loop/len(subset), t_tree/len(subset)
+    print("loop:    %8.3f s  (%.4f s/cell)" % (t_loop, per_loop))
+    print("strtree: %8.3f s  (%.4f s/cell)" % (t_tree, per_tree))
+    print("speedup: %8.1fx" % (per_loop/per_tree))
+    print("strtree, all %d cells: %.3f s (loop estimate: %.1f s)" % (
+        len(features), t_full, per_loop*len(features)))
+    print("strtree output matches the loop")
+
+    for column in ["dataset_locator_ix", "granule_locator_ix"]:
+        differ = sum(a!=b for a, b in zip(full[column], shipped[column]))
+        print("%s: %d of %d cells differ from the shipped pickle" % (
+            column, differ, len(shipped)))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+What the map is sent at each zoom: the study domain as the GeoJSON file (the
+same at every zoom) against the level of detail lod.py made for the zoom,
+and the grid layer with and without rounded corners and trimmed properties,
+and at the level of detail for each zoom. Run from the repo root, after
+python lod.py:
+
+    python dev/bench_lod.py
+
+Payload is the JSON of the layer's data, as the widget comm sends it.
+Serialize is the time to make the layer and its JSON. There's no browser
+here to time Leaflet's drawing, which scales with the vertices drawn, so
+those are counted instead.
+"""
+
+import os
+import sys
+import json
+import time
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from ipyleaflet import GeoJSON
+from ipywidgets.widgets.widget import _remove_buffers
+
+import ABoVE
+
+from lod import LevelsOfDetail, get_tolerance
+
+
+def count_vertices(geojson):
+    """ """
+    def count(coordinates):
+        if isinstance(coordinates[0], (int, float)):
+            return(1)
+        return(sum(count(c) for c in coordinates))
+    return(sum(count(f["geometry"]["coordinates"]) for f in geojson["features"]))
+
+
+def measure(make, repeat=5):
+    """Makes a layer; returns its payload bytes and the best time taken."""
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        layer = make()
+        state, buffer_paths, buffers = _remove_buffers(layer.get_state())
+        payload = json.dumps(state["data"])
+        times.append(time.perf_counter()-t0)
+    return(len(payload), min(times))
+
+
+def main():
+    """ """
+    with open(os.path.join(
+            repo, "data/ABoVE_Study_Domain/ABoVE_Study_Domain.json")) as f:
+        original = json.load(f)
+    domain = LevelsOfDetail(os.path.join(repo, "data/above_domain_lod.npz"))
+
+    print("study domain")
+    print("%5s %11s %9s %14s %9s %14s %9s" % (
+        "zoom", "tolerance", "vertices", "payload (KB)", "(ms)",
+        "file (KB)", "(ms)"))
+    full_bytes, full_time = measure(lambda: GeoJSON(data=original))
+    full_vertices = count_vertices(original)
+    for zoom in range(2, 13):
+        geojson = domain.get_geojson(zoom)
+        level = domain.levels[domain.get_level(zoom)]
+        tolerance = "-" if level["zoom"] is None else \
+            "%.5f" % get_tolerance(level["zoom"])
+        payload, seconds = measure(lambda: GeoJSON(data=geojson))
+        print("%5d %11s %9d %14.1f %9.2f %14.1f %9.2f" % (
+            zoom, tolerance, count_vertices(geojson), payload/1e3,
+            seconds*1e3, full_bytes/1e3, full_time*1e3))
+    print("(the file has %d vertices)\n" % full_vertices)
+
+    cells = [ABoVE.Cell(feat) for feat in ABoVE.catalog.get_grid_features("B")]
+    before = {"type": "FeatureCollection",
+              "features": [cell.feat for cell in cells]}
+    print("grid, level B: %-26s %14s %9s" % ("", "payload (KB)", "(ms)"))
+    for name, make in [
+            ("full features", lambda: GeoJSON(data=before)),
+            ("rounded, grid_id/level only",
+             lambda: ABoVE.get_cells_layer(cells, lambda **kwargs: None))]:
+        payload, seconds = measure(make)
+        print("%-41s %14.1f %9.2f" % (name, payload/1e3, seconds*1e3))
+
+    grid = LevelsOfDetail(os.path.join(repo, "data/above_grid_lod.npz"))
+    print("\ngrid, level B, at the zoom's level of detail")
+    print("%5s %9s %14s %9s" % ("zoom", "decimals", "payload (KB)", "(ms)"))
+    for zoom in range(2, 13):
+        index = ABoVE.get_grid_index(grid, zoom)
+        payload, seconds = measure(lambda: ABoVE.get_cells_layer(
+            cells, lambda **kwargs: None, index))
+        print("%5d %9d %14.1f %9.2f" % (
+            zoom, grid.levels[grid.get_level(zoom)]["decimals"],
+            payload/1e3, seconds*1e3))
+
+
+if __name__=="__main__":
+    main()
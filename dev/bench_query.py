@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Throughput of headless searches for many areas of interest: Catalog.query
+once per AOI, Catalog.query_many(_ix) over all of them, and query.py writing
+NDJSON and CSV (to /dev/null) for a GeoJSON file of them. Run from the repo
+root:
+
+    python dev/bench_query.py --aois 5000
+
+The AOIs are random polygons of 4 to 64 vertices and 0.05 to 2 degrees
+across, inside the ABoVE domain.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from shapely.geometry import Polygon, mapping
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+import query
+
+from catalog import Catalog
+
+
+def get_aois(n, seed=0):
+    """ """
+    rng = np.random.default_rng(seed)
+    aois = []
+    for i in range(n):
+        x, y = rng.uniform(-165, -100), rng.uniform(50, 72)
+        vertices = rng.integers(4, 65)
+        radius = rng.uniform(0.025, 1)
+        angles = np.sort(rng.uniform(0, 2*np.pi, vertices))
+        aois.append(("aoi%d" % i, Polygon(zip(
+            x+radius*np.cos(angles)*2, y+radius*np.sin(angles)))))
+    return(aois)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--aois", type=int, default=5000)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    catalog.get_locator_tree("granules")                # load up front
+    aois = get_aois(args.aois)
+
+    t0 = time.perf_counter()
+    single = [(i, catalog.query(geometry=g)) for i, g in aois]
+    t_single = time.perf_counter()-t0
+
+    t0 = time.perf_counter()
+    many = list(catalog.query_many(aois))
+    t_many = time.perf_counter()-t0
+
+    t0 = time.perf_counter()
+    many_ix = list(catalog.query_many_ix(aois))
+    t_many_ix = time.perf_counter()-t0
+
+    assert all(a[0]==b[0]==c[0] and a[1].index.equals(b[1].index) and
+               (a[1].index.values==c[1]).all()
+               for a, b, c in zip(single, many, many_ix))
+    results = sum(len(table) for i, table in many)
+
+    print("%d AOIs, %d granule results" % (len(aois), results))
+    print("%-22s %10s %12s %14s" % ("", "time (s)", "AOIs/s", "results/s"))
+    for name, seconds in [("query per AOI", t_single),
+                          ("query_many", t_many),
+                          ("query_many_ix", t_many_ix)]:
+        print("%-22s %10.3f %12.0f %14.0f" % (
+            name, seconds, len(aois)/seconds, results/seconds))
+
+    with tempfile.NamedTemporaryFile("w", suffix=".geojson", delete=False) as f:
+        json.dump({"type": "FeatureCollection", "features": [{
+            "type": "Feature", "id": i, "properties": {},
+            "geometry": mapping(g)} for i, g in aois]}, f)
+
+    try:
+        for fmt in ["ndjson", "csv"]:
+            with open(os.devnull, "w") as output:
+                t0 = time.perf_counter()
+                lines = query.main(["--aoi", f.name, "--format", fmt], output)
+                seconds = time.perf_counter()-t0
+            assert lines==results
+            print("%-22s %10.3f %12.0f %14.0f" % (
+                "query.py --format "+fmt, seconds, len(aois)/seconds,
+                results/seconds))
+    finally:
+        os.remove(f.name)
+
+
+if __name__=="__main__":
+    main()
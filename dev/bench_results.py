@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Results tables for large granule selections: qgrid given every row (as the
+App used to show them) against ResultsTable, which gives qgrid one page.
+The granule table is repeated --scale times to stand in for a polygon
+across the domain. Run from the repo root:
+
+    python dev/bench_results.py --scale 8
+
+Times are in the kernel, with display stubbed out since there's no
+frontend. Payload is the table data in the widget's state (what's sent to
+the browser); memory is what the table holds on to, traced separately.
+"""
+
+import os
+import sys
+import time
+import argparse
+import builtins
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+builtins.display = lambda *args: None
+
+import ABoVE
+
+from ABoVE import ResultsTable, get_qgrid, granule_columns,\
+    granule_column_definitions
+
+grid_options = {"forceFitColumns": False, "maxVisibleRows": 15}
+
+
+class FullTable(object):
+    """qgrid with every row of the selection, sorted and scrolled by qgrid."""
+
+    def __init__(self, table, ix):
+        self.grid = get_qgrid(table.iloc[ix][granule_columns], "granuleid",
+                              granule_column_definitions, grid_options)
+
+    def sort(self, column):
+        self.grid._handle_qgrid_msg_helper({
+            "type": "change_sort", "sort_field": column,
+            "sort_ascending": True})
+
+    def scroll(self, row):
+        self.grid._handle_qgrid_msg_helper({
+            "type": "change_viewport", "top": row, "bottom": row+15})
+
+
+class PagedTable(object):
+    """ResultsTable over the same rows, sorted and paged in the kernel."""
+
+    def __init__(self, table, ix):
+        self.results = ResultsTable(table, ix, granule_columns,
+                                    granule_column_definitions, grid_options,
+                                    lambda *args: None)
+        self.grid = self.results.grid
+
+    def sort(self, column):
+        self.results.sort_by.value = column
+
+    def scroll(self, row):
+        self.results.show(row//self.results.page_size)
+
+
+def timed(function, *args):
+    """ """
+    t0 = time.perf_counter()
+    result = function(*args)
+    return(result, time.perf_counter()-t0)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", type=int, default=8)
+    args = parser.parse_args()
+
+    granules = ABoVE.catalog.granule_locator_table
+    table = pd.concat([granules]*args.scale, ignore_index=True)
+    table["granuleid"] = table["granuleid"]+"."+(
+        table.index//len(granules)).astype(str)
+    ix = np.arange(len(table))
+    print("%d granules selected\n" % len(ix))
+
+    print("%-6s %10s %10s %12s %14s %12s" % (
+        "table", "show (s)", "sort (s)", "scroll (s)", "payload (KB)",
+        "memory (MB)"))
+    for name, kind in [("qgrid", FullTable), ("paged", PagedTable)]:
+        shown, t_show = timed(kind, table, ix)
+        payload = len(shown.grid._df_json)
+        done, t_sort = timed(shown.sort, "start_time")
+        done, t_scroll = timed(shown.scroll, len(ix)//2)
+        payload = max(payload, len(shown.grid._df_json))
+
+        tracemalloc.start()
+        held = kind(table, ix)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print("%-6s %10.3f %10.3f %12.3f %14.1f %12.1f" % (
+            name, t_show, t_sort, t_scroll, payload/1e3, memory/1e6))
+
+
+if __name__=="__main__":
+    main()
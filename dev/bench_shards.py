@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+The grid linkage built one A tile at a time in a process pool
+(linkage.link_sharded) against in one process (link_cells and count_cells,
+as build_grid_table does by default), with 1 to --workers workers. Run
+from the repo root:
+
+    python dev/bench_shards.py --scale 8 --c --workers 8
+
+The granules of the shipped pickle are repeated --scale times, moved a
+little each time; --c adds C cells (6 x 6 to a B cell, cut from its
+corners), which are only counted. Every build must match the one-process
+links and counts. The speedup is against the pool with one worker, and
+can't be more than the number of cores (shown first).
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import shapely
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from linkage import count_cells, get_grid_cells, get_grid_features,\
+    get_shards, link_cells, link_sharded
+
+
+def get_child_features(features, n=6):
+    """n x n C cells in each B cell, interpolated between its corners."""
+    children = []
+    for feature in features:
+        prop = feature["properties"]
+        if prop["grid_level"]!="B":
+            continue
+        p = np.array(feature["geometry"]["coordinates"][0][:4])
+        for i in range(n):
+            for j in range(n):
+                uv = np.array([[i, j], [i+1, j], [i+1, j+1], [i, j+1], [i, j]])/n
+                u, v = uv[:, :1], uv[:, 1:]
+                ring = (1-u)*(1-v)*p[0]+u*(1-v)*p[1]+u*v*p[2]+(1-u)*v*p[3]
+                children.append({"type": "Feature", "properties": {
+                    **prop, "grid_level": "C", "ch": i, "cv": j,
+                    "grid_id": "%sh%03dv%03d" % (prop["grid_id"].replace(
+                        "B", "C"), i, j)}, "geometry": {
+                    "type": "Polygon", "coordinates": [ring.tolist()]}})
+    return(children)
+
+
+def get_scaled(granules, scale, seed=0):
+    """The granule boxes repeated scale times, each copy moved up to 1 degree."""
+    rng = np.random.default_rng(seed)
+    columns = ["minlon", "minlat", "maxlon", "maxlat"]
+    bounds = shapely.bounds(granules["bounds_shapely"].values)
+    copies = [bounds]+[bounds+np.repeat(rng.uniform(-1, 1, (len(bounds), 2)), 2,
+                                        axis=1)[:, [0, 2, 1, 3]]
+                       for i in range(scale-1)]
+    return(pd.DataFrame(np.concatenate(copies), columns=columns))
+
+
+def link_serial(cell_geoms, linked, table):
+    """The links and counts as build_grid_table makes them in one process."""
+    links = link_cells(cell_geoms[linked], table)
+    counts = np.zeros(len(cell_geoms), dtype=np.int64)
+    counts[linked] = [len(ix) for ix in links]
+    counts[~linked] = count_cells(cell_geoms[~linked], table)
+    return(links, counts)
+
+
+def timed(function, *args):
+    """ """
+    t0 = time.perf_counter()
+    result = function(*args)
+    return(result, time.perf_counter()-t0)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", type=int, default=8)
+    parser.add_argument("--c", action="store_true", help="add C cells")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    data = os.path.join(repo, "data")
+    granules = pd.read_pickle(os.path.join(data, "above_granules_table.pkl"))
+    features = get_grid_features(
+        pd.read_pickle(os.path.join(data, "above_grid_table_ab.pkl")))
+    if args.c:
+        features = features+get_child_features(features)
+
+    grid_table = get_grid_cells(features, ("A", "B", "C"))
+    cell_geoms = grid_table["bounds_shapely"].values
+    linked = (grid_table["grid_level"]!="C").values
+    shards = get_shards(grid_table)
+    table = get_scaled(granules, args.scale)
+
+    print("%d cores; %d granules, %d cells (%d linked) in %d shards\n" % (
+        os.cpu_count(), len(table), len(cell_geoms), linked.sum(), len(shards)))
+    (links, counts), t_serial = timed(link_serial, cell_geoms, linked, table)
+    print("one process: %.2f s, %d links\n" % (t_serial, counts[linked].sum()))
+
+    print("%8s %10s %10s %14s" % ("workers", "time (s)", "speedup", "vs one process"))
+    t_one = None
+    workers = 1
+    while True:
+        (sharded, sharded_counts), seconds = timed(
+            link_sharded, cell_geoms, shards, linked, table, workers)
+        assert np.array_equal(sharded_counts, counts)
+        assert [sharded[i].tolist() for i in np.flatnonzero(linked)]==links
+        t_one = t_one or seconds
+        print("%8d %10.2f %10.2f %14.2f" % (
+            workers, seconds, t_one/seconds, t_serial/seconds))
+        if workers >= args.workers:
+            break
+        workers = min(workers*2, args.workers)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Compare load time and peak memory of the pickled tables and the columnar
+.npz tables (store.py). Run from the repo root after `python store.py`:
+
+    python dev/bench_store.py --repeat 5
+
+Each load runs in a fresh interpreter, like a new kernel would. Peak RSS is
+reported on top of a baseline interpreter that only imports the libraries.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+loader = """
+import sys, time, json, resource, warnings
+warnings.simplefilter("ignore")
+sys.path.insert(0, %r)
+import numpy, pandas, shapely
+from store import load_pickle, load_columns
+t0 = time.perf_counter()
+tables = [%s(%r+name) for name in %r]
+t1 = time.perf_counter()
+print(json.dumps({"seconds": t1-t0,
+                  "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+tables = ("above_dataset_table", "above_granules_table", "above_grid_table_ab")
+
+
+def run(function, extension):
+    """Loads the tables with function in a new interpreter."""
+    data = os.path.join(repo, "data")+os.sep
+    names = [name+"."+extension for name in tables] if extension else []
+    code = loader % (repo, function, data, names)
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            stdout=subprocess.PIPE).stdout
+    return(json.loads(output))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = min(run("load_pickle", "")["maxrss"] for i in range(args.repeat))
+
+    print("%-8s %12s %14s %12s" % ("format", "load (s)", "+peak RSS (MB)", "bytes"))
+    for function, extension in [("load_pickle", "pkl"), ("load_columns", "npz")]:
+        runs = [run(function, extension) for i in range(args.repeat)]
+        seconds = min(r["seconds"] for r in runs)
+        rss = min(r["maxrss"] for r in runs)-baseline
+        size = sum(os.path.getsize(os.path.join(repo, "data", name+"."+extension))
+                   for name in tables)
+        print("%-8s %12.3f %14.1f %12d" % (extension, seconds, rss/1024, size))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Text searches over the datasets: indexes.TextIndex against a str.contains
+scan of each dataset's title, short name and keywords (one word at a time,
+every word must match), alone and within the datasets of some grid cells.
+The dataset table is repeated --scale times to stand in for every ORNL
+DAAC collection (some 2,000 at --scale 26). Run from the repo root:
+
+    python dev/bench_text.py --scale 26
+
+The scan matches the words anywhere, the index at the start of a word, so
+their counts can differ ("ice" is in "service"); both are shown.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+from indexes import TextIndex, get_dataset_documents, get_words
+
+queries = ["permafrost", "perma", "snow cover", "carbon flux", "lidar",
+           "burn severity", "ice", "vegetation greenness ndvi"]
+
+
+def scan(text, query, ix=None):
+    """The rows (of ix) whose text contains every word of query."""
+    if ix is not None:
+        text = text.iloc[ix]
+    match = np.ones(len(text), dtype=bool)
+    for word in get_words(query):
+        match &= text.str.contains(word, case=False, regex=False).values
+    rows = np.flatnonzero(match)
+    return(rows if ix is None else ix[rows])
+
+
+def timed(function, *args, repeat=20):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", type=int, default=26)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    documents = list(get_dataset_documents(catalog.datasets))*args.scale
+    text = pd.Series([" ".join(d) for d in documents])
+    n = len(catalog.dataset_table)
+
+    index, seconds = timed(TextIndex, documents, repeat=1)
+    print("%d datasets; index of %d words built in %.1f ms\n" % (
+        len(documents), len(index.vocab), seconds*1e3))
+
+    # the datasets of some cells, in every copy of the table
+    cells = catalog.grid_table["grid_id"].values[100:130]
+    tile_ix = catalog.get_query_ix("datasets", tiles=cells)
+    tile_ix = (tile_ix[None, :]+n*np.arange(args.scale)[:, None]).ravel()
+
+    print("%-28s %7s %7s %10s %10s %10s %10s" % (
+        "query", "scan", "index", "scan (ms)", "index (ms)",
+        "in cells", "(ms scan/index)"))
+    for query in queries:
+        scanned, t_scan = timed(scan, text, query)
+        found, t_index = timed(index.get_rows, query)
+        scanned_in, t_scan_in = timed(scan, text, query, tile_ix)
+        found_in, t_index_in = timed(lambda: np.intersect1d(
+            tile_ix, index.get_rows(query), assume_unique=True))
+        print("%-28s %7d %7d %10.3f %10.3f %10d %8.3f/%.3f" % (
+            query, len(scanned), len(found), t_scan*1e3, t_index*1e3,
+            len(found_in), t_scan_in*1e3, t_index_in*1e3))
+
+
+if __name__=="__main__":
+    main()
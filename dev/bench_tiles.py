@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of tile lookups: the old get_by_tiles (a dfsel scan of the
+grid table per tile, then a set of the concatenated index lists) against the
+Catalog's grid_id index and CSR gather. Run from the repo root:
+
+    python dev/bench_tiles.py --repeat 20
+
+N grows from 1 tile to every cell in the grid table.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog, dfsel
+
+
+def get_by_tiles_scan(catalog, tile_list, search):
+    """The index lookup of the original ABoVE.get_by_tiles."""
+    ixcolumn = "dataset_locator_ix" if search=="datasets" else "granule_locator_ix"
+    lists = catalog.grid.ragged[ixcolumn]
+
+    ix_with_duplicates = []
+    for tile in tile_list:
+        tilerow = dfsel(catalog.grid_table, "grid_id", tile)
+        for row in tilerow.index:
+            ix_with_duplicates.extend(lists[row].tolist())
+
+    return(list(set(ix_with_duplicates)))
+
+
+def best(function, repeat, *args):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    tiles = catalog.grid_table["grid_id"].values
+    catalog.tile_index                                  # build it up front
+    rng = np.random.default_rng(0)
+
+    print("%-9s %6s %9s %12s %12s %9s" % (
+        "search", "tiles", "results", "scan (ms)", "index (ms)", "speedup"))
+    for search in ["datasets", "granules"]:
+        for n in [1, 10, 100, 300, len(tiles)]:
+            tile_list = rng.choice(tiles, n, replace=False).tolist()
+            old, t_old = best(
+                get_by_tiles_scan, max(1, args.repeat//10), catalog, tile_list, search)
+            new, t_new = best(catalog.get_tile_ix, args.repeat, tile_list, search)
+            assert sorted(old)==new.tolist()
+            print("%-9s %6d %9d %12.3f %12.3f %8.0fx" % (
+                search, n, len(new), t_old*1e3, t_new*1e3, t_old/t_new))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Time-window searches over the granules: parsing the ISO start/end strings
+per query (the only way to filter the tables before the TimeIndex) against
+the epoch arrays and interval index the Catalog parses once. Run from the
+repo root:
+
+    python dev/bench_time.py --repeat 20
+
+"cells" are granules in 20 B cells during summer 2017: a mask over the
+spatial candidates. "window" is a time window alone: the interval index.
+Rows tested counts the rows whose times are compared.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+from indexes import TimeIndex, get_time_ms
+
+
+def parse_window(table, ix, start, end):
+    """Parses the rows' times for each query; returns the rows in the window."""
+    rows = table.iloc[ix]
+    starts = pd.to_datetime(rows["start_time"], utc=True)
+    ends = pd.to_datetime(rows["end_time"], utc=True)
+    keep = (ends >= pd.Timestamp(start, tz="UTC")) & \
+        (starts <= pd.Timestamp(end, tz="UTC"))
+    return(np.asarray(ix)[keep.values])
+
+
+def count_tested(index, start, end):
+    """The rows TimeIndex.get_rows finds with its binary searches."""
+    a, b = get_time_ms(start, None), get_time_ms(end, None)
+    tested = len(index.open)
+    for lo, hi, longest in index.classes:
+        starts = index.starts[lo:hi]
+        tested += np.searchsorted(starts, b, "right") - \
+            np.searchsorted(starts, max(a-longest, starts[0]), "left")
+    return(int(tested))
+
+
+def check_open(windows):
+    """
+    get_rows against get_mask over every row, for a table with rows that
+    have no start or no end (ongoing), before, in and after each window.
+    """
+    table = pd.DataFrame({
+        "start_time": ["2020-01-01", "2010-01-01", None, "2015-06-01",
+                       "2001-01-01", None],
+        "end_time": [None, "2011-01-01", "2016-01-01", None, "2002-01-01",
+                     None]})
+    index = TimeIndex(table)
+    everything = np.arange(len(table))
+    for start, end in windows+[("2015-01-01", "2016-01-01"), (None, "2005-01-01"),
+                               ("2021-01-01", None)]:
+        assert index.get_rows(start, end).tolist()==np.flatnonzero(
+            index.get_mask(everything, start, end)).tolist(), (start, end)
+
+
+def best(function, repeat, *args):
+    """ """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter()-t0)
+    return(result, min(times))
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    table = catalog.granule_locator_table
+    grid = catalog.grid_table
+    tiles = grid.loc[grid["grid_level"]=="B", "grid_id"].sample(
+        20, random_state=0).tolist()
+
+    t0 = time.perf_counter()
+    index = catalog.get_time_index("granules")
+    print("time index built once in %.1f ms\n" % ((time.perf_counter()-t0)*1e3))
+
+    windows = [("2017-06-01", "2017-08-31T23:59:59.999"),
+               ("2017-07-13", "2017-07-13T23:59:59.999"),
+               ("2000-01-01", "2009-12-31T23:59:59.999")]
+    check_open(windows)
+    print("get_rows matches get_mask for rows without a start or an end\n")
+
+    print("%-7s %-24s %8s %12s %12s %11s %12s" % (
+        "search", "window", "results", "tested", "parse (ms)", "tested",
+        "index (ms)"))
+    for start, end in windows:
+        window = start+" .. "+end[:10]
+
+        # granules in 20 cells during the window
+        ix = catalog.get_tile_ix(tiles, "granules")
+        old, t_old = best(parse_window, args.repeat, table, ix, start, end)
+        new, t_new = best(
+            catalog.get_query_ix, args.repeat, "granules", None, None, tiles,
+            start, end)
+        assert old.tolist()==new.tolist()
+        print("%-7s %-24s %8d %12d %12.3f %11d %12.3f" % (
+            "cells", window, len(new), len(ix), t_old*1e3, len(ix), t_new*1e3))
+
+        # the window alone
+        everything = np.arange(len(table))
+        old, t_old = best(parse_window, args.repeat, table, everything, start, end)
+        new, t_new = best(index.get_rows, args.repeat, start, end)
+        assert old.tolist()==new.tolist()
+        tested = count_tested(index, start, end)
+        print("%-7s %-24s %8d %12d %12.3f %11d %12.3f" % (
+            "window", window, len(new), len(table), t_old*1e3,
+            tested, t_new*1e3))
+
+
+if __name__=="__main__":
+    main()
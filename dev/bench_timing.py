@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+The cost of timing.py: a catalog search that hits the results cache (a
+few microseconds, the cheapest timed call) without the decorator, timed but
+disabled, and recording; and timings.stage() off and on. Then a summary
+of the recorded calls. Run from the repo root:
+
+    python dev/bench_timing.py --calls 100000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+from catalog import Catalog
+from timing import timings
+
+
+def per_call(function, calls):
+    """Microseconds per call of function(), the best of 5 runs."""
+    times = []
+    for run in range(5):
+        t0 = time.perf_counter()
+        for i in range(calls):
+            function()
+        times.append(time.perf_counter()-t0)
+    return(min(times)/calls*1e6)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    tiles = catalog.grid_table["grid_id"].values[100:104].tolist()
+    catalog.get_tiles_ix(tiles, "granules")
+    plain = Catalog.get_tiles_ix.__wrapped__
+
+    timings.disable()
+    rows = [("get_tiles_ix, no decorator",
+             per_call(lambda: plain(catalog, tiles, "granules"), args.calls)),
+            ("get_tiles_ix, disabled",
+             per_call(lambda: catalog.get_tiles_ix(tiles, "granules"), args.calls)),
+            ("stage(), disabled",
+             per_call(lambda: timings.stage("x"), args.calls))]
+
+    timings.enable(size=10000)
+    rows.append(("get_tiles_ix, enabled",
+                 per_call(lambda: catalog.get_tiles_ix(tiles, "granules"), args.calls)))
+    record = timings.start("outer")
+    rows.append(("stage(), enabled",
+                 per_call(lambda: timings.stage("x"), args.calls)))
+    record["stages"] = []
+    timings.finish(record)
+    timings.disable()
+
+    for name, us in rows:
+        print("%-30s %8.3f us" % (name, us))
+    print("\n%d records kept of %d calls" % (
+        len(timings.records), 5*args.calls))
+    print(timings.summary("Catalog.get_tiles_ix").round(4).to_string(index=False))
+
+
+if __name__=="__main__":
+    main()
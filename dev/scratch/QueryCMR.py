@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from shapely.geometry import box
+from shapely.geometry import box, MultiPolygon
 from CMR import CollectionQuery, GranuleQuery
 
 collections = CollectionQuery()
@@ -30,11 +31,51 @@ def CMR_box_to_Shapely_box(cmr_box, id=0):
     """ """
 
     extent = cmr_box.split(" ")
+    west, east = float(extent[1]), float(extent[3])
+
+    # across the antimeridian (e.g. 172 to -170): a part on each side
+    if west-east > 180:
+        return(MultiPolygon([
+            box(west, float(extent[0]), 180., float(extent[2])),
+            box(-180., float(extent[0]), east, float(extent[2]))]))
 
     shapely_box = box(
-        float(extent[1]), 
+        west, 
         float(extent[0]), 
-        float(extent[3]), 
+        east, 
         float(extent[2]))
 
-    return(shapely_box)
\ No newline at end of file
+    return(shapely_box)
+
+
+def CMR_boxes_to_array(cmr_boxes):
+    """
+    Parses every CMR box string ("S W N E") of a column of box lists (one
+    list per collection) at once. Returns the boxes as a float array of
+    (minx, miny, maxx, maxy) rows, and the row of the collection each box
+    belongs to; collections can have any number of boxes, or none. Boxes
+    across the antimeridian (west more than 180 degrees east of east) are
+    split into a part on each side; in the rest, west and east (and south
+    and north) are put in order, as in linkage.split_bounds.
+    """
+
+    counts = np.array([
+        len(b) if isinstance(b, list) else 0 for b in cmr_boxes], dtype=int)
+    strings = [s for b in cmr_boxes if isinstance(b, list) for s in b]
+
+    extents = np.array(" ".join(strings).split(), dtype=float).reshape(-1, 4)
+    s, w, n, e = extents.T
+    owner = np.repeat(np.arange(len(counts)), counts)
+
+    crosses = (w-e) > 180
+    bounds = np.column_stack([np.minimum(w, e), np.minimum(s, n),
+                              np.maximum(w, e), np.maximum(s, n)])
+    bounds[crosses, 0] = w[crosses]
+    bounds[crosses, 2] = 180.
+    east = bounds[crosses].copy()
+    east[:, 0] = -180.
+    east[:, 2] = e[crosses]
+    bounds = np.concatenate([bounds, east])
+    owner = np.concatenate([owner, owner[crosses]])
+
+    return(bounds, owner)
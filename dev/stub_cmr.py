@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+A local stand-in for the CMR search API that serves recorded UMM-JSON pages,
+for running the harvester in cmr.py without the network. Run from the repo
+root:
+
+    python dev/stub_cmr.py record CORPUS C1234-ORNL_DAAC ...   # live CMR
+    python dev/stub_cmr.py synthesize CORPUS                   # from pickles
+    python dev/stub_cmr.py serve CORPUS --port 8089 --fail-every 7 --latency 0.1
+
+then point the harvester at it with cmr="http://localhost:8089/search/".
+
+A corpus is a folder with one <collection concept-id>.json file of UMM-JSON
+granule items per collection. The server pages through them with page_size
+and the CMR-Search-After header, and can fail every Nth request with a 503
+to exercise the retries. A response from CMR takes a round trip and a
+search on its side, which the stub doesn't; --latency seconds of waiting
+before each response stand in for them.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import threading
+
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo)
+
+
+"""
+------------------------------------------------------------------------------
+Corpus
+------------------------------------------------------------------------------
+"""
+
+
+def record(corpus, conceptids, cmr):
+    """Saves every granule of each collection from a live CMR to corpus."""
+    from cmr import get_session, cmr_pages
+
+    session = get_session()
+    for conceptid in conceptids:
+        params = dict(collection_concept_id=conceptid, page_size="2000")
+        items = []
+        for page in cmr_pages("granules.umm_json_v1_4", params, session, cmr):
+            items.extend(page["items"])
+        with open(os.path.join(corpus, conceptid+".json"), "w") as f:
+            json.dump(items, f)
+        print(conceptid, len(items))
+
+
+def get_file_size(granule):
+    """
+    The Size and SizeUnit of a granule's file: its granule_size (MB), or
+    if it has none (the shipped pickles don't) a made-up size, in KB, MB or
+    GB by the granule's crc32 so that each unit is in the corpus.
+    """
+    if pd.notna(granule["granule_size"]):
+        return(granule["granule_size"], "MB")
+    crc = zlib.crc32(granule["granuleid"].encode())
+    unit, scale = [("KB", 2**10), ("MB", 2**20), ("GB", 2**30)][crc % 3]
+    return((1024+crc % (256 << 20))/scale, unit)
+
+
+def get_umm_item(granule, collection_conceptid):
+    """Makes a UMM-JSON (1.4) granule item from a row of the granules pickle."""
+
+    # the shipped pickle's bbox columns are out of order (see get_granules_table)
+    west, south, east, north = (
+        granule["minlon"], granule["maxlon"], granule["maxlat"], granule["minlat"])
+
+    size, unit = get_file_size(granule)
+
+    return({
+        "meta": {
+            "provider-id": granule["archive"],
+            "concept-id": granule["conceptid"],
+            "native-id": granule["granuleid"],
+            "collection-concept-id": collection_conceptid},
+        "umm": {
+            "Projects": [{"ShortName": "ABoVE"}],
+            "CollectionReference": {
+                "ShortName": granule["collection_short_name"]},
+            "DataGranule": {"ArchiveAndDistributionInformation": [
+                {"Name": granule["granuleid"], "Size": size, "SizeUnit": unit}]},
+            "MeasuredParameters": [
+                {"ParameterName": p} for p in granule["granule_params"] or []],
+            "TemporalExtent": {"RangeDateTime": {
+                "BeginningDateTime": granule["start_time"],
+                "EndingDateTime": granule["end_time"]}},
+            "RelatedUrls": [{"URL": granule["url_datapool"], "Type": "GET DATA"}],
+            "SpatialExtent": {"HorizontalSpatialDomain": {"Geometry": {
+                "BoundingRectangles": [{
+                    "WestBoundingCoordinate": west,
+                    "NorthBoundingCoordinate": north,
+                    "EastBoundingCoordinate": east,
+                    "SouthBoundingCoordinate": south}]}}}}})
+
+
+def synthesize(corpus):
+    """Writes a corpus made from the shipped dataset and granule pickles."""
+
+    data = os.path.join(repo, "data")
+    datasets = pd.read_pickle(os.path.join(data, "above_dataset_table.pkl"))
+    granules = pd.read_pickle(os.path.join(data, "above_granules_table.pkl"))
+    conceptids = dict(zip(datasets["short_name"], datasets["conceptid"]))
+
+    groups = granules.groupby("collection_short_name", sort=False)
+    for short_name, group in groups:
+        conceptid = conceptids[short_name]
+        items = [get_umm_item(g, conceptid) for i, g in group.iterrows()]
+        with open(os.path.join(corpus, conceptid+".json"), "w") as f:
+            json.dump(items, f)
+
+    print("%d collections, %d granules" % (len(groups), len(granules)))
+
+
+"""
+------------------------------------------------------------------------------
+Server
+------------------------------------------------------------------------------
+"""
+
+
+class StubCMR(BaseHTTPRequestHandler):
+    """Serves /search/granules.umm_json_v1_4 from the corpus."""
+
+    corpus = None
+    fail_every = 0
+    latency = 0
+    requests = 0
+    lock = threading.Lock()
+    items = None
+
+    def get_items(self, conceptid):
+        """A collection's items, read from the corpus the first time."""
+        with self.lock:
+            if conceptid not in self.items:
+                path = os.path.join(self.corpus, conceptid+".json")
+                items = []
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        items = json.load(f)
+                self.items[conceptid] = items
+            return(self.items[conceptid])
+
+    def do_GET(self):
+        """ """
+        with self.lock:
+            StubCMR.requests += 1
+            fail = self.fail_every and StubCMR.requests % self.fail_every==0
+
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        if fail or not url.path.endswith("granules.umm_json_v1_4"):
+            self.send_response(503 if fail else 404)
+            self.end_headers()
+            return
+
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        items = self.get_items(params.get("collection_concept_id", ""))
+        page_size = int(params.get("page_size", 10))
+        start = int(self.headers.get("CMR-Search-After", "0"))
+        page = items[start:start+page_size]
+
+        body = json.dumps({
+            "hits": len(items), "took": 1, "items": page}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.nasa.cmr.umm_results+json")
+        self.send_header("CMR-Hits", str(len(items)))
+        if page:
+            self.send_header("CMR-Search-After", str(start+len(page)))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """ """
+        pass
+
+
+def serve(corpus, port=8089, fail_every=0, latency=0):
+    """Starts the stub in a background thread and returns the server."""
+    handler = type("Handler", (StubCMR, ), dict(
+        corpus=corpus, fail_every=fail_every, latency=latency, items={}))
+    server = ThreadingHTTPServer(("localhost", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return(server)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("command", choices=["record", "synthesize", "serve"])
+    parser.add_argument("corpus")
+    parser.add_argument("conceptids", nargs="*")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds to wait before each response")
+    parser.add_argument("--cmr", default="https://cmr.earthdata.nasa.gov/search/")
+    args = parser.parse_args()
+
+    os.makedirs(args.corpus, exist_ok=True)
+    if args.command=="record":
+        record(args.corpus, args.conceptids, args.cmr)
+    elif args.command=="synthesize":
+        synthesize(args.corpus)
+    else:
+        server = serve(args.corpus, args.port, args.fail_every, args.latency)
+        print("serving %s on http://localhost:%d/search/" % (
+            args.corpus, args.port))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+A local stand-in for the DAAC data pool that serves the files in a folder,
+for running download.py without the network. Run from the repo root:
+
+    python dev/stub_files.py FOLDER --port 8090 --fail-every 7 --cut-every 3
+
+then download from http://localhost:8090/<path under FOLDER>.
+
+It answers Range requests (206, or 416 past the end) and HEAD, keeps
+connections alive, and can: fail every Nth request with a 503, cut every
+Nth response off halfway through the body, and limit each response to a
+rate in bytes per second, to stand in for a slow server.
+"""
+
+import os
+import time
+import argparse
+import threading
+
+from urllib.parse import urlparse, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubFiles(BaseHTTPRequestHandler):
+    """Serves GET and HEAD of the files under folder."""
+
+    protocol_version = "HTTP/1.1"
+    folder = None
+    fail_every = 0
+    cut_every = 0
+    rate = 0
+    chunk_size = 1<<16
+    requests = 0
+    lock = threading.Lock()
+
+    def get_range(self, size):
+        """(start, end) of the Range header, end inclusive; None for all."""
+        header = self.headers.get("Range")
+        if not header or not header.startswith("bytes="):
+            return(None)
+        start, end = header[6:].split(",")[0].split("-")
+        if not start:
+            return(max(size-int(end), 0), size-1)      # the last end bytes
+        end = int(end) if end else size-1
+        return(int(start), min(end, size-1))
+
+    def send_empty(self, status, headers=()):
+        """ """
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def respond(self, body=True):
+        """ """
+        with self.lock:
+            StubFiles.requests += 1
+            count = StubFiles.requests
+        fail = self.fail_every and count % self.fail_every==0
+        cut = body and self.cut_every and count % self.cut_every==0
+
+        path = os.path.join(self.folder, unquote(urlparse(self.path).path).lstrip("/"))
+        if fail:
+            return(self.send_empty(503))
+        if not os.path.isfile(path):
+            return(self.send_empty(404))
+
+        size = os.path.getsize(path)
+        byte_range = self.get_range(size)
+        if byte_range is None:
+            start, end, status = 0, size-1, 200
+        elif byte_range[0]>=size:
+            return(self.send_empty(416, [("Content-Range", "bytes */%d" % size)]))
+        else:
+            start, end, status = byte_range[0], byte_range[1], 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end-start+1))
+        if status==206:
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+        self.end_headers()
+        if not body:
+            return
+
+        stop = start+(end-start+1)//2 if cut else end+1
+        t0 = time.perf_counter()
+        sent = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            while start+sent<stop:
+                chunk = f.read(min(self.chunk_size, stop-start-sent))
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if self.rate:
+                    wait = sent/self.rate-(time.perf_counter()-t0)
+                    if wait>0:
+                        time.sleep(wait)
+        if cut:
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+
+    def do_GET(self):
+        """ """
+        self.respond()
+
+    def do_HEAD(self):
+        """ """
+        self.respond(body=False)
+
+    def log_message(self, *args):
+        """ """
+        pass
+
+
+def serve(folder, port=8090, fail_every=0, cut_every=0, rate=0):
+    """Starts the stub in a background thread and returns the server."""
+    handler = type("Handler", (StubFiles, ), dict(
+        folder=folder, fail_every=fail_every, cut_every=cut_every, rate=rate))
+    server = ThreadingHTTPServer(("localhost", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return(server)
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("folder")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--cut-every", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0,
+                        help="bytes per second per response (0: no limit)")
+    args = parser.parse_args()
+
+    server = serve(args.folder, args.port, args.fail_every, args.cut_every,
+                   args.rate)
+    print("serving %s on http://localhost:%d/" % (args.folder, args.port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,562 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Download ABoVE granules: concurrent, resumable transfers of url_datapool
+
+##############################################################################
+
+Takes a selection of granules (rows of the granule table or the granule
+locator table, e.g. Catalog.query results) and downloads each url_datapool
+into a folder, one subfolder per dataset, with up to workers files at once
+over one pooled session (see cmr.get_session). From the command line, the
+selection is query.py's output:
+
+    python query.py --tiles Bh006v018 | python download.py granules/ --dry-run
+    python query.py --tiles Bh006v018 | python download.py granules/
+
+A transfer is written to <file>.part and renamed when it's complete, so an
+interrupted download resumes from the end of the .part file (with a Range
+request) on the next try or the next run. Each file's size is checked
+against the server's and, for a granule of one file, against granule_size,
+and its checksum against the checksums given, if any; the checksum of
+every file is written to <folder>/checksums.<algorithm> (md5sum -c can
+read it).
+
+The DAAC data pool asks for an Earthdata Login; requests reads it from
+~/.netrc (machine urs.earthdata.nasa.gov login ... password ...).
+
+"""
+
+import io
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+import requests
+import numpy as np
+import pandas as pd
+
+from urllib.parse import urlparse, unquote
+from concurrent.futures import ThreadPoolExecutor
+
+from cmr import get_session, size_unit
+
+
+"""
+------------------------------------------------------------------------------
+Planning transfers
+------------------------------------------------------------------------------
+"""
+
+
+class Transfer(object):
+    """One file to download, and how its download went."""
+
+    def __init__(self, url, path, size=None, checksum=None):
+        self.url = url
+        self.path = path
+        self.size = size                    # bytes, from granule_size
+        self.checksum = checksum            # expected hex digest
+        self.status = "pending"
+        self.nbytes = 0                     # bytes in the file when done
+        self.fetched = 0                    # bytes downloaded this run
+        self.resumed = 0                    # bytes of .part from before
+        self.seconds = 0.
+        self.digest = None
+        self.error = None
+
+    @property
+    def part(self):
+        """ """
+        return(self.path+".part")
+
+    def as_dict(self):
+        """ """
+        return(dict(url=self.url, path=self.path, status=self.status,
+                    size=self.size, nbytes=self.nbytes, fetched=self.fetched,
+                    seconds=self.seconds, digest=self.digest,
+                    error=None if self.error is None else str(self.error)))
+
+
+def get_file_name(url):
+    """The last part of a url's path."""
+    return(unquote(os.path.basename(urlparse(url).path)))
+
+
+def get_transfers(granules, folder, checksums=None):
+    """
+    Makes a Transfer for each distinct url_datapool of granules, to
+    folder/<collection_short_name>/<file name>. checksums maps urls, paths
+    relative to folder, or file names to hex digests. Only a granule of one
+    file (granule_files) gives its Transfer a size, since granule_size is
+    the size of all of them.
+    """
+
+    checksums = checksums or {}
+    granules = granules.loc[granules["url_datapool"].notna()]
+    granules = granules.drop_duplicates("url_datapool")
+
+    urls = granules["url_datapool"].values
+    if "collection_short_name" in granules:
+        subfolders = granules["collection_short_name"].fillna("").values
+    else:
+        subfolders = [""]*len(granules)
+    sizes = np.full(len(granules), np.nan)
+    if "granule_size" in granules and "granule_files" in granules:
+        single = granules["granule_files"].values.astype(float)==1
+        sizes[single] = granules["granule_size"].values[single].astype(float)*size_unit
+
+    transfers = []
+    for url, subfolder, size in zip(urls, subfolders, sizes):
+        name = get_file_name(url)
+        relative = os.path.join(subfolder, name)
+        checksum = checksums.get(url, checksums.get(relative, checksums.get(name)))
+        transfers.append(Transfer(
+            url, os.path.join(folder, relative),
+            None if np.isnan(size) else int(round(size)), checksum))
+
+    return(transfers)
+
+
+def get_sizes(granules, catalog):
+    """
+    Adds the granule_size and granule_files columns to a selection of
+    granules that doesn't have them (the locator table leaves them out),
+    from the catalog's granule table by granuleid.
+    """
+    if "granule_size" in granules and "granule_files" in granules:
+        return(granules)
+    table = catalog.granule_table.set_index("granuleid")
+    ids = granules["granuleid"]
+    return(granules.assign(
+        granule_size=ids.map(table["granule_size"]).values,
+        granule_files=ids.map(table["granule_files"]).values
+        if "granule_files" in table else np.nan))
+
+
+def read_checksums(path):
+    """
+    Reads md5sum-style lines (<hex digest>  <file name>) into a dict, keyed
+    by the names as they are given (e.g. paths relative to the folder, as
+    write_checksums gives them).
+    """
+    checksums = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                digest, name = line.strip().split(None, 1)
+                checksums[os.path.normpath(name.lstrip("*"))] = digest.lower()
+    return(checksums)
+
+
+def is_close(nbytes, size):
+    """
+    True if a file of nbytes matches a granule_size of size bytes, which was
+    rounded in the SizeUnit CMR gave it in: to within 1% or half a kB.
+    """
+    return(size is None or abs(nbytes-size) <= max(0.01*size, 512))
+
+
+"""
+------------------------------------------------------------------------------
+Progress
+------------------------------------------------------------------------------
+"""
+
+
+class Progress(object):
+    """
+    Counts files and bytes as the transfers go, from any thread. report()
+    gives the files done, the bytes so far (of those expected, if every
+    size is known), the throughput and the time left at that rate.
+    """
+
+    def __init__(self, transfers):
+        self.lock = threading.Lock()
+        self.files = len(transfers)
+        self.done = 0
+        self.failed = 0
+        self.fetched = 0
+        self.resumed = 0
+        sizes = [t.size for t in transfers]
+        self.expected = None if None in sizes else sum(sizes)
+        self.started = time.perf_counter()
+
+    def add(self, nbytes):
+        """ """
+        with self.lock:
+            self.fetched += nbytes
+
+    def finish(self, transfer):
+        """ """
+        with self.lock:
+            if transfer.status in ("done", "exists"):
+                self.done += 1
+            else:
+                self.failed += 1
+
+    @property
+    def rate(self):
+        """Bytes per second downloaded so far."""
+        return(self.fetched/max(time.perf_counter()-self.started, 1e-9))
+
+    def report(self):
+        """ """
+        mb = 1e6
+        text = "%d/%d files, %.1f" % (self.done, self.files,
+                                      (self.fetched+self.resumed)/mb)
+        if self.expected:
+            text += " of %.1f" % (self.expected/mb)
+        text += " MB, %.2f MB/s" % (self.rate/mb)
+        if self.expected and self.rate>0:
+            left = self.expected-self.fetched-self.resumed
+            text += ", %d s left" % max(left/self.rate, 0)
+        if self.failed:
+            text += ", %d failed" % self.failed
+        return(text)
+
+
+def print_progress(progress, end=False):
+    """Rewrites a line on stderr with the progress report."""
+    sys.stderr.write("\r"+progress.report()+("\n" if end else ""))
+    sys.stderr.flush()
+
+
+"""
+------------------------------------------------------------------------------
+Transfers
+------------------------------------------------------------------------------
+"""
+
+
+class VerifyError(Exception):
+    """A downloaded file isn't the size or checksum it should be."""
+    pass
+
+
+def get_total(response, start):
+    """
+    The full size of the file from a response to a request from byte start:
+    the total in Content-Range or start plus Content-Length; None if the
+    server doesn't say.
+    """
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("*"):
+        return(int(content_range.rsplit("/", 1)[1]))
+    length = response.headers.get("Content-Length")
+    if length is None:
+        return(None)
+    return(start+int(length))
+
+
+def hash_file(path, algorithm, chunk_size=1<<20):
+    """A new hashlib object updated with the contents of path."""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return(digest)
+
+
+def verify(transfer, nbytes, total, digest):
+    """Raises VerifyError if the .part file isn't the file expected."""
+    if total is not None and nbytes!=total:
+        raise VerifyError("got %d of %d bytes" % (nbytes, total))
+    if transfer.checksum is not None and digest!=transfer.checksum.lower():
+        raise VerifyError("checksum %s, expected %s" % (
+            digest, transfer.checksum))
+
+
+def fetch(session, transfer, progress, algorithm="md5", attempts=5,
+          backoff=0.5, chunk_size=1<<20, timeout=60):
+    """
+    Downloads one transfer to its .part file and renames it when it's
+    verified. A dropped connection or a bad checksum is tried again, up to
+    attempts times: a dropped connection resumes where the .part file ends,
+    a bad checksum starts over. A file that is the server's size but not
+    granule_size (see get_transfers) fails without trying again, and its
+    .part file is kept.
+    """
+
+    os.makedirs(os.path.dirname(transfer.path) or ".", exist_ok=True)
+    started = time.perf_counter()
+
+    for attempt in range(attempts):
+        start = os.path.getsize(transfer.part) if os.path.exists(
+            transfer.part) else 0
+        headers = {"Range": "bytes=%d-" % start} if start else {}
+
+        try:
+            with session.get(transfer.url, headers=headers, stream=True,
+                             timeout=timeout) as response:
+
+                if response.status_code==416:
+                    # the .part file is already whole, or longer than the file
+                    total = get_total(response, start)
+                    if total!=start:
+                        os.remove(transfer.part)
+                        continue
+                    digest = hash_file(transfer.part, algorithm)
+                    nbytes = start
+
+                else:
+                    response.raise_for_status()
+                    if response.status_code!=206:
+                        start = 0                # the server sent it all
+                    total = get_total(response, start)
+
+                    if start:
+                        digest = hash_file(transfer.part, algorithm)
+                        before = start-transfer.fetched-transfer.resumed
+                        if before>0:
+                            transfer.resumed += before
+                            with progress.lock:
+                                progress.resumed += before
+                    else:
+                        digest = hashlib.new(algorithm)
+
+                    nbytes = start
+                    with open(transfer.part, "ab" if start else "wb") as f:
+                        for chunk in response.iter_content(chunk_size):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            nbytes += len(chunk)
+                            transfer.fetched += len(chunk)
+                            progress.add(len(chunk))
+
+            digest = digest.hexdigest()
+            verify(transfer, nbytes, total, digest)
+
+        except VerifyError as error:
+            transfer.error = error
+            if total is not None and nbytes<total:
+                continue                         # cut short; resume
+            os.remove(transfer.part)
+            continue
+
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as error:
+            transfer.error = error
+            time.sleep(backoff*2**attempt)
+            continue
+
+        except requests.HTTPError as error:
+            transfer.error = error
+            transfer.status = "failed"
+            break
+
+        transfer.nbytes = nbytes
+        transfer.digest = digest
+        if not is_close(nbytes, transfer.size):
+            transfer.error = VerifyError("%d bytes, granule_size is %d" % (
+                nbytes, transfer.size))
+            transfer.status = "failed"
+            break
+
+        os.replace(transfer.part, transfer.path)
+        transfer.status = "done"
+        transfer.error = None
+        break
+
+    else:
+        transfer.status = "failed"
+
+    transfer.seconds = time.perf_counter()-started
+    return(transfer)
+
+
+def skip_existing(transfer, algorithm="md5"):
+    """
+    Marks a transfer whose file is already in the folder as done ("exists"),
+    unless it's the wrong size or checksum.
+    """
+    if not os.path.exists(transfer.path):
+        return(False)
+    nbytes = os.path.getsize(transfer.path)
+    if not is_close(nbytes, transfer.size):
+        return(False)
+    digest = hash_file(transfer.path, algorithm).hexdigest()
+    if transfer.checksum is not None and digest!=transfer.checksum.lower():
+        return(False)
+    transfer.nbytes = nbytes
+    transfer.digest = digest
+    transfer.status = "exists"
+    return(True)
+
+
+def write_checksums(transfers, folder, algorithm="md5"):
+    """Adds the downloaded files' digests to folder/checksums.<algorithm>."""
+    path = os.path.join(folder, "checksums."+algorithm)
+    listed = read_checksums(path) if os.path.exists(path) else {}
+    with open(path, "a") as f:
+        for transfer in transfers:
+            name = os.path.relpath(transfer.path, folder)
+            if transfer.digest and os.path.normpath(name) not in listed:
+                f.write("%s  %s\n" % (transfer.digest, name))
+    return(path)
+
+
+"""
+------------------------------------------------------------------------------
+Downloading a selection
+------------------------------------------------------------------------------
+"""
+
+
+def estimate(transfers, session=None, head=False, workers=4):
+    """
+    A dry run: the files and bytes a download would fetch, without fetching.
+    Files already in the folder and the bytes of .part files (which would
+    be resumed) are left out. With head, sizes that granule_size doesn't
+    give are asked of the server with HEAD requests.
+    """
+
+    if head:
+        unknown = [t for t in transfers if t.size is None]
+        session = get_session(workers) if session is None else session
+        def ask(transfer):
+            try:
+                response = session.head(transfer.url, allow_redirects=True,
+                                        timeout=60)
+                length = response.headers.get("Content-Length")
+                if response.ok and length is not None:
+                    transfer.size = int(length)
+            except requests.RequestException:
+                pass
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(ask, unknown))
+
+    files, nbytes, unknown, exists, partial = 0, 0, 0, 0, 0
+    for transfer in transfers:
+        if os.path.exists(transfer.path):
+            exists += 1
+            continue
+        files += 1
+        if transfer.size is None:
+            unknown += 1
+            continue
+        part = os.path.getsize(transfer.part) if os.path.exists(
+            transfer.part) else 0
+        partial += part
+        nbytes += max(transfer.size-part, 0)
+
+    return(dict(files=files, bytes=nbytes, unknown_size=unknown,
+                exists=exists, resumed_bytes=partial))
+
+
+def download(granules, folder, workers=4, session=None, checksums=None,
+             algorithm="md5", dry_run=False, progress=print_progress,
+             interval=1., **kwargs):
+    """
+    Downloads the url_datapool files of granules (a selection of the granule
+    table or locator table) to folder, workers at a time. Returns a table
+    with a row per file: its status (done, exists or failed), bytes, time,
+    checksum and error; or with dry_run, the estimate without downloading.
+
+    progress(Progress, end) is called every interval seconds and at the end
+    (None for no reports). Other keyword arguments go to fetch.
+    """
+
+    transfers = get_transfers(granules, folder, checksums)
+    if dry_run:
+        return(estimate(transfers, session, workers=workers))
+
+    session = get_session(workers) if session is None else session
+    tracker = Progress(transfers)
+    stop = threading.Event()
+
+    def run(transfer):
+        if not skip_existing(transfer, algorithm):
+            fetch(session, transfer, tracker, algorithm, **kwargs)
+        tracker.finish(transfer)
+        return(transfer)
+
+    def report():
+        while not stop.wait(interval):
+            progress(tracker)
+
+    if progress is not None:
+        threading.Thread(target=report, daemon=True).start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, transfers))
+    finally:
+        stop.set()
+        if progress is not None:
+            progress(tracker, end=True)
+        if transfers:
+            os.makedirs(folder, exist_ok=True)
+            write_checksums(transfers, folder, algorithm)
+
+    return(pd.DataFrame([t.as_dict() for t in transfers], columns=[
+        "url", "path", "status", "size", "nbytes", "fetched", "seconds",
+        "digest", "error"]))
+
+
+"""
+------------------------------------------------------------------------------
+Command line
+------------------------------------------------------------------------------
+"""
+
+
+def main(argv=None):
+    """ """
+    parser = argparse.ArgumentParser(
+        description="Download the granules in query.py's output.")
+    parser.add_argument("folder")
+    parser.add_argument("--input", default="-",
+                        help="query.py NDJSON or CSV ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checksums", metavar="FILE",
+                        help="md5sum-style file of expected digests")
+    parser.add_argument("--algorithm", default="md5")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--head", action="store_true",
+                        help="with --dry-run, ask the server for unknown sizes")
+    parser.add_argument("--data", help="folder with the .npz tables")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input=="-" else open(args.input)
+    with source:
+        text = source.read()
+    if not text.strip():
+        return(0)
+    if text.lstrip().startswith("{"):
+        granules = pd.read_json(io.StringIO(text), lines=True, dtype=False)
+    else:
+        granules = pd.read_csv(io.StringIO(text), dtype=str)
+    if "aoi" in granules:
+        granules = granules.drop(columns="aoi")
+
+    if "granule_size" not in granules or "granule_files" not in granules:
+        from catalog import Catalog
+        catalog = Catalog() if args.data is None else Catalog(args.data)
+        granules = get_sizes(granules, catalog)
+
+    checksums = None if args.checksums is None else read_checksums(args.checksums)
+
+    if args.dry_run:
+        transfers = get_transfers(granules, args.folder, checksums)
+        plan = estimate(transfers, head=args.head, workers=args.workers)
+        print("%d files to download, %.1f MB%s; %d already here, %.1f MB to "
+              "resume" % (
+                  plan["files"], plan["bytes"]/1e6,
+                  " (and %d of unknown size)" % plan["unknown_size"]
+                  if plan["unknown_size"] else "",
+                  plan["exists"], plan["resumed_bytes"]/1e6))
+        return(0)
+
+    results = download(granules, args.folder, args.workers,
+                       checksums=checksums, algorithm=args.algorithm)
+    for row in results.loc[results["status"]=="failed"].itertuples():
+        print("failed: %s (%s)" % (row.url, row.error), file=sys.stderr)
+    return(int((results["status"]=="failed").any()))
+
+
+if __name__=="__main__":
+    sys.exit(main())
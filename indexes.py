@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Indexes over the ABoVE tables, built once when a Catalog first needs them
+
+##############################################################################
+"""
+
+import re
+import numpy as np
+import pandas as pd
+import shapely
+
+from shapely import STRtree
+
+from linkage import get_parent_rows
+from store import CSR
+
+
+"""
+------------------------------------------------------------------------------
+Grid cells -> datasets and granules
+------------------------------------------------------------------------------
+"""
+
+
+class TileIndex(object):
+    """
+    Looks up grid table rows by grid_id with a hash index, and gathers the
+    datasets or granules linked to many rows at once from the grid's CSR
+    index arrays.
+
+    C cells aren't linked in the grid table (see linkage.build_grid_table).
+    Their datasets or granules come from get_tree(search), an STR-tree over
+    the boxes of the locator table, which is only asked for when a search
+    includes C cells.
+    """
+
+    def __init__(self, grid, get_tree=None):
+        self.grid = grid
+        self.get_tree = get_tree
+        self.rows = pd.Index(grid.frame["grid_id"])
+        self.unlinked = grid.frame["grid_level"].values=="C"
+        self.ix = {
+            "datasets": grid.ragged["dataset_locator_ix"],
+            "granules": grid.ragged["granule_locator_ix"]}
+        self.size = {search: int(csr.values.max(initial=-1))+1
+                     for search, csr in self.ix.items()}
+
+    def get_rows(self, tile_list):
+        """Returns the grid table rows of the tiles; unknown ids are skipped."""
+        rows = self.rows.get_indexer(list(tile_list))
+        return(rows[rows >= 0])
+
+    def get_ix(self, rows, search):
+        """Returns the sorted, unique locator indices linked to the rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        unlinked = rows[self.unlinked[rows]]
+        ix = self.ix[search].take(rows)
+
+        if len(unlinked)>0:
+            tree = self.get_tree(search)
+            shapes = self.grid.get_shapes("geometry", unlinked)
+            ix = np.concatenate(
+                [ix, tree.query(shapes, predicate="intersects")[1]])
+
+        # marking a mask is np.unique without the sort
+        size = max(self.size[search], int(ix.max(initial=-1))+1)
+        linked = np.zeros(size, dtype=bool)
+        linked[ix] = True
+        return(np.flatnonzero(linked))
+
+
+"""
+------------------------------------------------------------------------------
+Geometries -> grid cells
+------------------------------------------------------------------------------
+"""
+
+
+class CellIndex(object):
+    """
+    An STR-tree over the cells of one level of the grid. The tree narrows a
+    query geometry down to the cells whose envelopes it overlaps; the exact
+    intersects test runs against the prepared query geometry only for those.
+    """
+
+    def __init__(self, grid, level):
+        self.level = level
+        self.rows = np.flatnonzero(grid.frame["grid_level"].values==level)
+        self.shapes = grid.get_shapes("geometry", self.rows)
+        self.tree = STRtree(self.shapes)
+
+    def __len__(self):
+        return(len(self.rows))
+
+    def query(self, geometry):
+        """Returns the grid table rows of the cells that intersect geometry."""
+        shapely.prepare(geometry)
+        hits = self.tree.query(geometry, predicate="intersects")
+        return(self.rows[np.sort(hits)])
+
+
+class GridTree(object):
+    """
+    The A > B > C hierarchy of the grid, for queries that start from the A
+    cells and only test the children of the cells that matched the level
+    above, so a query for C cells tests a small share of the tens of thousands.
+
+    Cells poke out of their parents a little in lon/lat, so the levels above
+    the one asked for are tested with family boxes, each around a cell and
+    all of its descendants; only the cells of the level asked for get the
+    exact test.
+    """
+
+    def __init__(self, grid):
+        frame = grid.frame
+        self.level = frame["grid_level"].values
+        self.levels = [level for level in "ABC" if (self.level==level).any()]
+        self.shapes = grid.get_shapes("geometry")
+
+        # children of each row, and the cells whose parent isn't in the table
+        parent = get_parent_rows(frame)
+        children = np.flatnonzero(parent >= 0)
+        children = children[np.argsort(parent[children], kind="stable")]
+        self.children = CSR(np.searchsorted(
+            parent[children], np.arange(len(frame)+1)), children)
+        self.orphans = {level: np.flatnonzero((self.level==level) & (parent<0))
+                        for level in self.levels}
+
+        # family boxes, grown from the bottom level up
+        family = shapely.bounds(self.shapes)
+        for level in self.levels[:0:-1]:
+            rows = np.flatnonzero((self.level==level) & (parent >= 0))
+            for k, grow in enumerate(
+                    [np.minimum, np.minimum, np.maximum, np.maximum]):
+                grow.at(family[:, k], parent[rows], family[rows, k])
+        self.family = shapely.box(*family.T)
+
+    def __len__(self):
+        return(len(self.level))
+
+    def query(self, geometry, level="B"):
+        """Returns the grid table rows of level's cells that meet geometry."""
+        if level not in self.levels:
+            return(np.empty(0, dtype=np.int64))
+
+        shapely.prepare(geometry)
+
+        rows = np.empty(0, dtype=np.int64)
+        for above in self.levels[:self.levels.index(level)]:
+            rows = np.concatenate([rows, self.orphans[above]])
+            rows = rows[shapely.intersects(geometry, self.family[rows])]
+            rows = self.children.take(rows)
+
+        rows = np.concatenate([rows, self.orphans[level]])
+        rows = rows[shapely.intersects(geometry, self.shapes[rows])]
+        return(np.sort(rows))
+
+
+"""
+------------------------------------------------------------------------------
+Collections
+------------------------------------------------------------------------------
+"""
+
+
+def get_key_index(values):
+    """A hash index from values to the row where each first appears."""
+    values = pd.Index(values)
+    first = ~values.duplicated()
+    return(pd.Series(np.flatnonzero(first), index=values[first]))
+
+
+def get_key_rows(index, keys):
+    """Looks up keys in a get_key_index; unknown keys are skipped."""
+    found = index.index.get_indexer(list(keys))
+    return(index.values[found[found >= 0]])
+
+
+class CollectionIndex(object):
+    """
+    Finds a collection's granules without a scan over the granule table.
+    The granule rows are sorted by collection (rows keeps them as a CSR,
+    a range per collection), and each dataset's short_name, conceptid and
+    title map to its dataset row with a hash index.
+    """
+
+    def __init__(self, datasets, granules):
+        self.codes, names = pd.factorize(granules["collection_short_name"])
+        self.names = pd.Index(names)
+        order = np.argsort(self.codes, kind="stable")
+        offsets = np.searchsorted(self.codes[order], np.arange(len(names)+1))
+        self.rows = CSR(offsets, order)
+
+        self.datasets = {column: get_key_index(datasets[column]) for column in
+                         ["short_name", "conceptid", "title"]}
+        self.short_names = datasets["short_name"].values
+
+    def get_codes(self, short_names):
+        """Returns the codes of the collections; unknown names are skipped."""
+        codes = self.names.get_indexer(list(short_names))
+        return(codes[codes >= 0])
+
+    def get_rows(self, short_names):
+        """Returns the sorted granule rows of the collections."""
+        codes = self.get_codes(short_names)
+        if len(codes)==1:
+            return(self.rows[codes[0]])
+        return(np.sort(self.rows.take(codes)))
+
+    def get_mask(self, ix, short_names):
+        """For each granule row in ix: is it in one of the collections?"""
+        return(np.isin(self.codes[ix], self.get_codes(short_names)))
+
+    def get_dataset_rows(self, keys, column="short_name"):
+        """
+        Returns the dataset rows whose short_name, conceptid or title
+        (column) is one of keys.
+        """
+        return(get_key_rows(self.datasets[column], keys))
+
+
+"""
+------------------------------------------------------------------------------
+Time ranges
+------------------------------------------------------------------------------
+"""
+
+
+def get_epoch_ms(times):
+    """
+    Parses ISO 8601 times (strings, datetimes or Timestamps; naive ones are
+    UTC) to int64 milliseconds since 1970. Returns (ms, missing), where
+    missing marks the times that were empty or couldn't be read.
+    """
+    times = pd.to_datetime(pd.Series(times, dtype=object), utc=True,
+                           errors="coerce")
+    missing = times.isna().values
+    ms = times.values.astype("datetime64[ms]").astype(np.int64)
+    return(np.where(missing, 0, ms), missing)
+
+
+def get_time_ms(time, default):
+    """One time (see get_epoch_ms) in milliseconds; None is default."""
+    if time is None:
+        return(default)
+    time = pd.Timestamp(time)
+    if time is pd.NaT:
+        raise ValueError("a time window's ends can't be empty")
+    if time.tzinfo is None:
+        time = time.tz_localize("UTC")
+    return(int(time.value//10**6))
+
+
+class TimeIndex(object):
+    """
+    The start_time and end_time of a locator table as int64 epoch
+    milliseconds, parsed once, and an interval index over them.
+
+    The rows are split into classes by duration (powers of two), and sorted
+    by start within each class. A row in a class whose longest row lasts d
+    can only overlap [a, b] if it starts in [a-d, b], so a window search is
+    a binary search per class; only the rows it finds get the exact test.
+    Rows with a missing time are always tested.
+    """
+
+    def __init__(self, table):
+        start, start_missing = get_epoch_ms(table["start_time"].values)
+        end, end_missing = get_epoch_ms(table["end_time"].values)
+        self.start = np.where(start_missing, np.iinfo(np.int64).min, start)
+        self.end = np.where(end_missing, np.iinfo(np.int64).max, end)
+
+        missing = start_missing | end_missing
+        self.open = np.flatnonzero(missing)
+
+        rows = np.flatnonzero(~missing)
+        duration = np.maximum(end[rows]-start[rows], 0)
+        classes = np.floor(np.log2(duration+1)).astype(np.int64)
+        order = np.lexsort((start[rows], classes))
+        self.rows = rows[order]
+        self.starts = start[self.rows]
+
+        classes = classes[order]
+        self.classes = []
+        for k in np.unique(classes):
+            lo, hi = np.searchsorted(classes, [k, k+1])
+            self.classes.append((lo, hi, int(duration[order][lo:hi].max())))
+
+    def get_mask(self, ix, start=None, end=None):
+        """For each row in ix: does its time range overlap [start, end]?"""
+        a = get_time_ms(start, np.iinfo(np.int64).min)
+        b = get_time_ms(end, np.iinfo(np.int64).max)
+        return((self.end[ix] >= a) & (self.start[ix] <= b))
+
+    def get_rows(self, start=None, end=None):
+        """Returns the sorted rows whose time range overlaps [start, end]."""
+        a = get_time_ms(start, np.iinfo(np.int64).min)
+        b = get_time_ms(end, np.iinfo(np.int64).max)
+
+        found = [self.open]
+        for lo, hi, longest in self.classes:
+            starts = self.starts[lo:hi]
+            first = np.searchsorted(starts, max(a-longest, starts[0]), "left")
+            last = np.searchsorted(starts, b, "right")
+            found.append(self.rows[lo+first:lo+last])
+
+        # the open rows weren't searched by start, so every row gets the
+        #   whole overlap test
+        rows = np.concatenate(found)
+        rows = rows[(self.end[rows] >= a) & (self.start[rows] <= b)]
+        return(np.sort(rows))
+
+
+"""
+------------------------------------------------------------------------------
+Facets
+------------------------------------------------------------------------------
+"""
+
+# numpy 2 counts bits natively; before that, a table of each byte's count
+try:
+    bitwise_count = np.bitwise_count
+except AttributeError:
+    byte_counts = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+    def bitwise_count(words):
+        """The number of bits set in each of an array of uint64 words."""
+        counts = byte_counts[words.view(np.uint8)]
+        return(counts.reshape(words.shape+(8, )).sum(axis=-1))
+
+
+def get_bitmap(rows, size):
+    """A bitmap (uint64 words) with the bits of rows set, of size bits."""
+    mask = np.zeros(-(-size//64)*64, dtype=bool)
+    mask[rows] = True
+    return(np.packbits(mask, bitorder="little").view(np.uint64))
+
+
+class FacetIndex(object):
+    """
+    A bitmap over the rows for each value of a list column (the granules'
+    parameters, as codes into its vocabulary): bit i of a value's bitmap is
+    set if row i has the value. The rows with any of some values are their
+    bitmaps OR'd together, and the count of every value in a selection is
+    the popcount of each bitmap AND the selection's, all at once.
+    """
+
+    def __init__(self, csr, vocab):
+        self.names = pd.Index([v.upper() for v in vocab])
+        self.vocab = list(vocab)
+        self.size = len(csr)
+
+        # bit r of byte r>>3, as packbits(bitorder="little") makes them
+        rows = np.repeat(np.arange(len(csr)), csr.lengths())
+        bitmaps = np.zeros((len(vocab), -(-self.size//64)*8), dtype=np.uint8)
+        np.bitwise_or.at(bitmaps, (csr.values, rows >> 3),
+                         np.left_shift(1, rows & 7).astype(np.uint8))
+        self.bitmaps = bitmaps.view(np.uint64)
+
+    def __len__(self):
+        return(self.size)
+
+    def get_codes(self, names):
+        """Returns the codes of the values (any case); unknown ones skipped."""
+        codes = self.names.get_indexer([n.upper() for n in names])
+        return(codes[codes >= 0])
+
+    def get_union(self, names):
+        """The bitmap of the rows with any of the values, as bytes."""
+        codes = self.get_codes(names)
+        if len(codes)==0:
+            return(np.zeros(self.bitmaps.shape[1]*8, dtype=np.uint8))
+        return(np.bitwise_or.reduce(self.bitmaps[codes], axis=0).view(np.uint8))
+
+    def get_mask(self, ix, names):
+        """For each row in ix: does it have any of the values?"""
+        ix = np.asarray(ix, dtype=np.int64)
+        return(((self.get_union(names)[ix >> 3] >> (ix & 7)) & 1).astype(bool))
+
+    def get_rows(self, names):
+        """Returns the sorted rows with any of the values."""
+        bits = np.unpackbits(self.get_union(names), bitorder="little")
+        return(np.flatnonzero(bits[:self.size]))
+
+    def get_counts(self, ix):
+        """
+        Returns the number of rows of ix with each value, as a Series from
+        the values (most common first) that any of them have.
+        """
+        selection = get_bitmap(ix, self.size)
+        counts = bitwise_count(self.bitmaps & selection).sum(axis=1)
+        counts = pd.Series(counts.astype(np.int64), index=self.vocab)
+        return(counts[counts>0].sort_values(ascending=False, kind="stable"))
+
+
+"""
+------------------------------------------------------------------------------
+Text
+------------------------------------------------------------------------------
+"""
+
+word_pattern = re.compile(r"[a-z0-9]+")
+
+
+def get_words(text):
+    """The lowercase words (runs of letters and digits) in text."""
+    return(word_pattern.findall(text.lower()))
+
+
+def get_dataset_documents(datasets):
+    """
+    The text of each dataset (store.Columns) for a TextIndex: its title,
+    short_name and science keywords. The keywords are codes into a small
+    vocabulary, so each keyword is split into words once.
+    """
+    frame = datasets.frame
+    keywords = datasets.ragged["science_keywords"]
+    vocab = [" ".join(get_words(v or "")) for v in datasets.vocab["science_keywords"]]
+
+    for i, (title, short_name) in enumerate(zip(frame["title"], frame["short_name"])):
+        yield([title or "", short_name or ""]+[vocab[v] for v in keywords[i]])
+
+
+class TextIndex(object):
+    """
+    An inverted index from the words in each row's text to the rows. The
+    vocabulary is sorted, so the words that start with a prefix are one
+    range of it, found by binary search, and each word's rows are a range
+    of a CSR. A search is the rows with a word that starts with each word
+    searched for (all of them), so "perma" finds PERMAFROST.
+    """
+
+    def __init__(self, documents):
+        words, rows = [], []
+        size = 0
+        for row, strings in enumerate(documents):
+            found = set(w for string in strings for w in get_words(string))
+            words.extend(found)
+            rows.extend([row]*len(found))
+            size = row+1
+
+        codes, vocab = pd.factorize(np.array(words, dtype=object), sort=True)
+        order = np.lexsort((rows, codes))
+        offsets = np.searchsorted(codes[order], np.arange(len(vocab)+1))
+
+        self.size = size
+        self.vocab = np.array(vocab, dtype=str)
+        self.rows = CSR(offsets, np.asarray(rows, dtype=np.int64)[order])
+
+    def __len__(self):
+        return(self.size)
+
+    def get_prefix_rows(self, prefix):
+        """Returns the sorted rows with a word that starts with prefix."""
+        # words are [a-z0-9], all before "{", so prefix+"{" ends the range
+        lo, hi = np.searchsorted(self.vocab, [prefix, prefix+"{"])
+        if hi-lo==1:
+            return(self.rows[lo])
+
+        found = np.zeros(self.size, dtype=bool)
+        found[self.rows.take(np.arange(lo, hi))] = True
+        return(np.flatnonzero(found))
+
+    def get_rows(self, text):
+        """
+        Returns the sorted rows that have every word of text (as a prefix
+        of one of theirs); all of the rows if text has no words.
+        """
+        rows = None
+        for word in sorted(set(get_words(text)), key=len, reverse=True):
+            hits = self.get_prefix_rows(word)
+            rows = hits if rows is None else np.intersect1d(
+                rows, hits, assume_unique=True)
+            if len(rows)==0:
+                break
+
+        return(np.arange(self.size) if rows is None else rows)
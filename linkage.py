@@ -0,0 +1,676 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Link CMR datasets and granules to ABoVE grid cells
+
+##############################################################################
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import shapely
+
+from shapely import STRtree
+from shapely.geometry import shape
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:                        # python 3.7
+    shared_memory = None
+
+# column order of the above_grid_table pickle
+grid_table_columns = [
+    "geometry",
+    "bounds_shapely",
+    "properties",
+    "grid_level",
+    "grid_id",
+    "spatial_re",
+    "ah",
+    "av",
+    "bh",
+    "bv",
+    "ch",
+    "cv",
+    "dataset_count",
+    "dataset_locator_ix",
+    "dataset_conceptid",
+    "granule_count",
+    "granule_locator_ix",
+]
+
+
+"""
+------------------------------------------------------------------------------
+Grid cells
+------------------------------------------------------------------------------
+"""
+
+
+def get_grid_cells(features, enabled_levels=("A", "B")):
+    """
+    Returns a table of the ABoVE grid features in the enabled levels. The
+    table has every above_grid_table column except the linkage columns.
+    """
+
+    rows = []
+    for feature in features:
+        geometry = feature["geometry"]
+        properties = feature["properties"]
+
+        if properties["grid_level"] in enabled_levels:
+            rows.append((
+                geometry,
+                shape(geometry),
+                properties,
+                properties["grid_level"],
+                properties["grid_id"],
+                properties["spatial_re"],
+                properties["ah"],
+                properties["av"],
+                properties["bh"],
+                properties["bv"],
+                properties["ch"],
+                properties["cv"],
+            ))
+
+    return(pd.DataFrame(rows, columns=grid_table_columns[:12]))
+
+
+def get_parent_rows(grid_table):
+    """
+    Returns the row position of each cell's parent: the A cell (ah, av) of a
+    B cell, and the B cell (bh, bv) of a C cell. It's -1 for A cells and for
+    cells whose parent's level isn't in the table.
+    """
+
+    level = grid_table["grid_level"].values
+    parent = np.full(len(grid_table), -1, dtype=np.int64)
+
+    for child_level, parent_level, keys in [("B", "A", ["ah", "av"]),
+                                            ("C", "B", ["bh", "bv"])]:
+        parents = np.flatnonzero(level==parent_level)
+        children = np.flatnonzero(level==child_level)
+        if len(parents)==0 or len(children)==0:
+            continue
+
+        index = pd.MultiIndex.from_frame(grid_table[keys].iloc[parents])
+        found = index.get_indexer(
+            pd.MultiIndex.from_frame(grid_table[keys].iloc[children]))
+        parent[children] = np.where(found >= 0, parents[found], -1)
+
+    return(parent)
+
+
+def get_grid_features(grid_table):
+    """Rebuilds GeoJSON features from a grid table (e.g. the pickle)."""
+    return([{"type": "Feature", "geometry": g, "properties": p} for g, p in
+            zip(grid_table["geometry"], grid_table["properties"])])
+
+
+"""
+------------------------------------------------------------------------------
+Linkage
+------------------------------------------------------------------------------
+"""
+
+
+def split_bounds(bounds):
+    """
+    Splits the boxes (an (N, 4) array of minlon, minlat, maxlon, maxlat)
+    that cross the antimeridian into a part on each side. A box crosses when
+    its west bound is more than 180 degrees east of its east bound (e.g. 172
+    to -170, over the Aleutians); made as it is, its box would go the long
+    way round the globe and intersect nearly every cell. Smaller mix-ups of
+    west and east keep the span between them, like shapely.box.
+
+    Returns the parts, the N boxes first and then the second parts of the
+    crossing ones, and the row of bounds each part belongs to.
+    """
+
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    w, s, e, n = bounds.T
+    crosses = (w-e) > 180
+
+    parts = np.column_stack([np.minimum(w, e), np.minimum(s, n),
+                             np.maximum(w, e), np.maximum(s, n)])
+    parts[crosses, 0] = w[crosses]
+    parts[crosses, 2] = 180.
+    east = parts[crosses].copy()
+    east[:, 0] = -180.
+    east[:, 2] = e[crosses]
+
+    owner = np.concatenate([np.arange(len(bounds)), np.flatnonzero(crosses)])
+    return(np.concatenate([parts, east]), owner)
+
+
+def get_center(bounds):
+    """
+    The (lat, lon) middle of the smallest box that holds all of bounds
+    (see split_bounds), going round the globe the short way: boxes either
+    side of the antimeridian are centred near it, not on the far side.
+    """
+    parts, owner = split_bounds(bounds)
+    order = np.argsort(parts[:, 0])
+    west, east = parts[order, 0], np.maximum.accumulate(parts[order, 2])
+
+    # the widest stretch of longitude no box covers; the rest holds them all
+    gaps = np.append(west[1:]-east[:-1], west[0]+360-east[-1])
+    i = int(np.argmax(gaps))
+    start = west[(i+1) % len(west)]
+    end = east[i] if i<len(west)-1 else east[-1]
+    if end<start:
+        end += 360
+    lon = (start+end)/2
+    lat = (parts[:, 1].min()+parts[:, 3].max())/2
+    return(float(lat), float((lon+180) % 360-180))
+
+
+def get_envelopes(bounds):
+    """
+    Shapely boxes for bounds; a MultiPolygon of the two parts for the boxes
+    that cross the antimeridian (see split_bounds).
+    """
+    parts, owner = split_bounds(bounds)
+    boxes = shapely.box(*parts.T)
+    n = int(owner.max(initial=-1))+1
+    if len(parts)>n:
+        crossing = owner[n:]
+        boxes[crossing] = shapely.multipolygons(
+            np.stack([boxes[crossing], boxes[n:]], axis=1))
+    return(boxes[:n])
+
+
+def get_shape_bounds(shapes):
+    """
+    The (N, 4) minlon, minlat, maxlon, maxlat of boxes from
+    cmr.get_bounds_shapely. Shapely's bounds of a box in two parts across
+    the antimeridian are -180 to 180, so those get the west bound of the
+    part that ends at 180 and the east bound of the part from -180, for
+    split_bounds to split again.
+    """
+    shapes = np.asarray(shapes, dtype=object)
+    bounds = shapely.bounds(shapes)
+    parts, owner = shapely.get_parts(shapes, return_index=True)
+    part_bounds = shapely.bounds(parts)
+    crossing = np.flatnonzero((bounds[:, 0]==-180) & (bounds[:, 2]==180) &
+                              (np.bincount(owner, minlength=len(shapes))>1))
+    for i in crossing:
+        mine = part_bounds[owner==i]
+        west = mine[(mine[:, 2]==180) & (mine[:, 0]>-180), 0]
+        east = mine[(mine[:, 0]==-180) & (mine[:, 2]<180), 2]
+        if len(west) and len(east):
+            bounds[i, 0], bounds[i, 2] = west.min(), east.max()
+    return(bounds)
+
+
+def get_bounds(locator_table):
+    """
+    The (N, 4) minlon, minlat, maxlon, maxlat of a locator table's rows,
+    from the bbox columns (put in order by store.fix_granule_bounds), which
+    keep west and east as CMR gives them; the rows without a bbox take the
+    bounds of their bounds_shapely (see get_shape_bounds) if they have one.
+    """
+    from store import fix_granule_bounds
+
+    columns = ["minlon", "minlat", "maxlon", "maxlat"]
+    bounds = fix_granule_bounds(locator_table[columns]).values.astype(float)
+    if "bounds_shapely" in locator_table:
+        given = locator_table["bounds_shapely"].values
+        missing = ~np.isfinite(bounds).all(axis=1) & pd.notna(given)
+        if missing.any():
+            bounds[missing] = get_shape_bounds(given[missing])
+    return(bounds)
+
+
+class BoxTree(object):
+    """
+    An STR-tree over bounding boxes, with the boxes that cross the
+    antimeridian split in two (see split_bounds). query is STRtree.query,
+    but gives rows of the bounds, each once per query geometry.
+    """
+
+    def __init__(self, bounds):
+        parts, self.owner = split_bounds(bounds)
+        self.size = int(self.owner.max(initial=-1))+1
+        self.split = len(parts)>self.size
+        self.crosses = np.zeros(len(parts), dtype=bool)
+        self.crosses[self.owner[self.size:]] = True
+        self.tree = STRtree(shapely.box(*parts.T))
+
+    def __len__(self):
+        return(self.size)
+
+    def query(self, geometry, predicate=None):
+        """ """
+        hits = self.tree.query(geometry, predicate=predicate)
+        if hits.ndim==1:
+            rows = self.owner[hits]
+            return(np.unique(rows) if self.split else rows)
+
+        query_ix, rows = hits[0], self.owner[hits[1]]
+        second = hits[1] >= self.size
+        if second.any():
+            # drop second parts that hit a geometry the first part hit too
+            first = self.crosses[hits[1]] & ~second
+            pairs = query_ix*self.size+rows
+            keep = np.ones(len(rows), dtype=bool)
+            keep[second] = ~np.isin(pairs[second], pairs[first])
+            query_ix, rows = query_ix[keep], rows[keep]
+        return(np.vstack([query_ix, rows]))
+
+
+def link_cells(cell_geoms, locator_table):
+    """
+    Returns a list of the locator_table indices that intersect each cell.
+
+    An STR-tree over the locator table's bounding boxes (BoxTree, so boxes
+    across the antimeridian are two parts) prefilters the pairs on their
+    envelopes; the exact intersects test only runs for those.
+    """
+
+    cell_geoms = np.asarray(cell_geoms, dtype=object)
+    if len(cell_geoms)==0:
+        return([])
+
+    tree = BoxTree(get_bounds(locator_table))
+    cell_ix, row_ix = tree.query(cell_geoms, predicate="intersects")
+
+    # sort pairs by cell then by row so each list keeps table order
+    order = np.lexsort((row_ix, cell_ix))
+    cell_ix, row_ix = cell_ix[order], row_ix[order]
+
+    labels = locator_table.index.values[row_ix]
+    splits = np.searchsorted(cell_ix, np.arange(1, len(cell_geoms)))
+
+    return([part.tolist() for part in np.split(labels, splits)])
+
+
+def count_cells(cell_geoms, locator_table, chunk=4096):
+    """
+    Returns the number of locator_table rows that intersect each cell, like
+    the lengths of link_cells's lists, without making the lists.
+    """
+
+    cell_geoms = np.asarray(cell_geoms, dtype=object)
+    counts = np.zeros(len(cell_geoms), dtype=np.int64)
+    if len(cell_geoms)==0 or len(locator_table)==0:
+        return(counts)
+
+    tree = BoxTree(get_bounds(locator_table))
+    for start in range(0, len(cell_geoms), chunk):
+        cell_ix, row_ix = tree.query(
+            cell_geoms[start:start+chunk], predicate="intersects")
+        counts[start:start+chunk] += np.bincount(
+            cell_ix, minlength=len(cell_geoms[start:start+chunk]))
+
+    return(counts)
+
+
+"""
+------------------------------------------------------------------------------
+Sharded linkage
+------------------------------------------------------------------------------
+"""
+
+
+class SharedArray(object):
+    """
+    A copy of an array in shared memory, which worker processes attach to
+    by its handle instead of being sent a pickled copy. Python 3.7 has no
+    multiprocessing.shared_memory; there it's a memory-mapped temporary file.
+    """
+
+    def __init__(self, array, memory, handle):
+        self.array = array
+        self.memory = memory
+        self.handle = handle
+
+    @classmethod
+    def create(cls, array):
+        """Copies array into a new block of shared memory."""
+        import tempfile
+
+        array = np.ascontiguousarray(array)
+        if shared_memory is None:
+            fd, name = tempfile.mkstemp(suffix=".npy")
+            os.close(fd)
+            memory = np.lib.format.open_memmap(
+                name, "w+", array.dtype, array.shape)
+        else:
+            memory = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1))
+            name = memory.name
+        shared = cls(None, memory, (name, array.shape, array.dtype.str))
+        shared.array = shared.view()
+        shared.array[...] = array
+        return(shared)
+
+    @classmethod
+    def attach(cls, handle):
+        """The array of handle, in a worker."""
+        if shared_memory is None:
+            memory = np.load(handle[0], mmap_mode="r")
+        else:
+            memory = shared_memory.SharedMemory(name=handle[0])
+        shared = cls(None, memory, handle)
+        shared.array = shared.view()
+        return(shared)
+
+    def view(self):
+        """ """
+        name, shape, dtype = self.handle
+        if shared_memory is None:
+            return(self.memory)
+        return(np.ndarray(shape, dtype=dtype, buffer=self.memory.buf))
+
+    def close(self, unlink=False):
+        """Detaches; unlink (in the process that made it) frees the memory."""
+        self.array = None
+        if shared_memory is None:
+            self.memory = None
+            if unlink:
+                os.remove(self.handle[0])
+        else:
+            self.memory.close()
+            if unlink:
+                self.memory.unlink()
+
+
+def get_shards(grid_table):
+    """The row positions of the grid table's cells in each A tile (ah, av)."""
+    codes, tiles = pd.factorize(pd.MultiIndex.from_frame(grid_table[["ah", "av"]]))
+    order = np.argsort(codes, kind="stable")
+    return(np.split(order, np.searchsorted(codes[order], np.arange(1, len(tiles)))))
+
+
+def link_shard(task):
+    """
+    Links the cells of a shard to the boxes in its range of the shared parts
+    (see link_sharded), in a worker process. Returns the (cell, locator row)
+    pairs of the linked cells and the counts of the others.
+    """
+
+    handles, lo, hi, cells, linked = task
+    parts, owner = [SharedArray.attach(handle) for handle in handles]
+    try:
+        tree = STRtree(shapely.box(*parts.array[lo:hi].T))
+        rows = owner.array[lo:hi].copy()
+    finally:
+        parts.close()
+        owner.close()
+
+    cell_ix, part_ix = tree.query(shapely.from_wkb(cells), predicate="intersects")
+    row_ix = rows[part_ix]
+
+    # both parts of a box across the antimeridian can hit a cell
+    if len(np.unique(rows))<len(rows):
+        size = int(rows.max())+1
+        pairs = np.unique(cell_ix*size+row_ix)
+        cell_ix, row_ix = pairs//size, pairs % size
+
+    keep = linked[cell_ix]
+    counts = np.bincount(cell_ix[~keep], minlength=len(linked))[~linked]
+    return((cell_ix[keep].astype(np.int32), row_ix[keep], counts))
+
+
+def link_sharded(cell_geoms, shards, linked, locator_table, workers=None):
+    """
+    Like link_cells for the cells where linked is True and count_cells for
+    the rest, with the cells split into shards (arrays of positions in
+    cell_geoms, e.g. get_shards) that go to a pool of worker processes
+    (os.cpu_count() if None; 1 runs them here).
+
+    The boxes of locator_table (split at the antimeridian) are put in
+    shared memory once, grouped by the shards whose envelope they overlap,
+    so a worker gets only the range of boxes for its shard. Shards go out
+    largest first. Returns a store.CSR of locator_table index labels per
+    cell (empty if it isn't linked) and the number of rows per cell.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from store import CSR
+
+    cell_geoms = np.asarray(cell_geoms, dtype=object)
+    linked = np.asarray(linked, dtype=bool)
+    workers = os.cpu_count() if workers is None else workers
+
+    parts, owner = split_bounds(get_bounds(locator_table))
+    cell_bounds = shapely.bounds(cell_geoms)
+    envelopes = np.array([np.concatenate([cell_bounds[shard, :2].min(axis=0),
+                                          cell_bounds[shard, 2:].max(axis=0)])
+                          for shard in shards]).reshape(-1, 4)
+    shard_ix, part_ix = STRtree(shapely.box(*parts.T)).query(
+        shapely.box(*envelopes.T), predicate="intersects")
+    order = np.lexsort((part_ix, shard_ix))
+    shard_ix, part_ix = shard_ix[order], part_ix[order]
+    offsets = np.searchsorted(shard_ix, np.arange(len(shards)+1))
+
+    shared = [SharedArray.create(parts[part_ix]),
+              SharedArray.create(owner[part_ix])]
+    try:
+        handles = [s.handle for s in shared]
+        cost = np.array([len(shard)*(offsets[i+1]-offsets[i])
+                         for i, shard in enumerate(shards)])
+        sequence = np.argsort(-cost, kind="stable")
+        tasks = [(handles, offsets[i], offsets[i+1],
+                  shapely.to_wkb(cell_geoms[shards[i]]), linked[shards[i]])
+                 for i in sequence]
+        if workers==1:
+            results = [link_shard(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(link_shard, tasks))
+    finally:
+        for s in shared:
+            s.close(unlink=True)
+
+    # merge the shards' pairs into one CSR over the cells
+    counts = np.zeros(len(cell_geoms), dtype=np.int64)
+    cell_ix, row_ix = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for i, (cells, rows, unlinked) in zip(sequence, results):
+        shard = shards[i]
+        cell_ix.append(shard[cells])
+        row_ix.append(rows)
+        counts[shard[~linked[shard]]] = unlinked
+    cell_ix, row_ix = np.concatenate(cell_ix), np.concatenate(row_ix)
+
+    order = np.lexsort((row_ix, cell_ix))
+    links = CSR(np.searchsorted(cell_ix[order], np.arange(len(cell_geoms)+1)),
+                locator_table.index.values[row_ix[order]])
+    counts[linked] = links.lengths()[linked]
+    return((links, counts))
+
+
+def build_grid_table(features,
+                     dataset_locator_table,
+                     granule_locator_table,
+                     enabled_levels=("A", "B"),
+                     workers=1):
+    """
+    Makes the above_grid_table that links the dataset and granule locator
+    tables to the enabled levels of the ABoVE grid.
+
+    A and B cells are linked directly. There are 36 C cells to a B cell and
+    their lists would hold about 30 times the granule links of A and B, so
+    C cells keep empty lists and only their counts; their datasets and
+    granules are found when they're searched (see indexes.TileIndex).
+
+    With workers other than 1 (None for all of the cores), the cells are
+    linked an A tile at a time in a process pool (see link_sharded).
+    """
+
+    grid_table = get_grid_cells(features, enabled_levels)
+    cell_geoms = grid_table["bounds_shapely"].values
+    linked = (grid_table["grid_level"]!="C").values
+
+    def get_lists(locator_table):
+        if workers!=1:
+            links, counts = link_sharded(cell_geoms, get_shards(grid_table),
+                                         linked, locator_table, workers)
+            return(links.tolist(), counts)
+
+        ix_lists = [[] for i in range(len(grid_table))]
+        for row, ix in zip(np.flatnonzero(linked),
+                           link_cells(cell_geoms[linked], locator_table)):
+            ix_lists[row] = ix
+        counts = np.array([len(ix) for ix in ix_lists])
+        counts[~linked] = count_cells(cell_geoms[~linked], locator_table)
+        return(ix_lists, counts)
+
+    # DATASETS SELECTION
+    dataset_ix, dataset_count = get_lists(dataset_locator_table)
+    conceptids = dataset_locator_table["conceptid"]
+    grid_table["dataset_count"] = dataset_count
+    grid_table["dataset_locator_ix"] = dataset_ix
+    grid_table["dataset_conceptid"] = [
+        conceptids.loc[ix].tolist() for ix in dataset_ix]
+
+    # GRANULES SELECTION
+    granule_ix, granule_count = get_lists(granule_locator_table)
+    grid_table["granule_count"] = granule_count
+    grid_table["granule_locator_ix"] = granule_ix
+
+    return(grid_table[grid_table_columns])
+
+
+"""
+------------------------------------------------------------------------------
+Incremental updates
+------------------------------------------------------------------------------
+"""
+
+
+def get_removed_rows(table, conceptids):
+    """Returns the row positions of table whose conceptid is in conceptids."""
+    return(np.flatnonzero(table["conceptid"].isin(list(conceptids)).values))
+
+
+def remap_locator_ix(ix_lists, n_rows, drop):
+    """
+    Removes the dropped row positions from each list of locator indices and
+    renumbers the rest to match the table once those rows are deleted.
+    """
+
+    if len(drop)==0:
+        return(list(ix_lists))
+
+    remap = np.arange(n_rows)
+    remap[drop] = -1
+    keep = remap >= 0
+    remap[keep] = np.arange(keep.sum())
+
+    lengths = [len(ix) for ix in ix_lists]
+    flat = remap[np.fromiter((i for ix in ix_lists for i in ix), dtype=int,
+                             count=sum(lengths))]
+    parts = np.split(flat, np.cumsum(lengths)[:-1])
+
+    return([part[part >= 0].tolist() for part in parts])
+
+
+def append_rows(table, added, drop):
+    """Deletes the dropped rows from table and appends the added rows."""
+    table = table.drop(table.index[drop])
+    if added is not None and len(added)>0:
+        table = pd.concat([table, added.reindex(columns=table.columns)])
+    return(table.reset_index(drop=True))
+
+
+def extend_locator_ix(ix_lists, cell_geoms, table, start, linked):
+    """
+    Links the rows of table from position start onward to the cells where
+    linked is True (the A and B cells; see build_grid_table).
+    """
+
+    if start==len(table):
+        return(ix_lists)
+
+    ix_lists = list(ix_lists)
+    added = link_cells(cell_geoms[linked], table.iloc[start:])
+    for row, new in zip(np.flatnonzero(linked), added):
+        if new:
+            ix_lists[row] = ix_lists[row]+new
+    return(ix_lists)
+
+
+def update_grid_table(grid_table,
+                      dataset_table,
+                      granules_table,
+                      added_datasets=None,
+                      removed_datasets=(),
+                      added_granules=None,
+                      removed_granules=()):
+    """
+    Applies a delta from CMR to the three tables without rebuilding the grid
+    linkage. added_* are tables of new rows (e.g. from get_granules_table);
+    removed_* are concept-ids. A concept-id that is added again replaces its
+    old row, and removing a dataset also removes its granules.
+
+    Only cells that intersect an added row are tested for intersection; the
+    rest of the table is renumbered to match the new row positions. C cells
+    have no lists (see build_grid_table), so their counts are adjusted by
+    the removed and added rows. Returns new (grid_table, dataset_table,
+    granules_table); the inputs are left as they are.
+    """
+
+    grid_table = grid_table.copy()
+    cell_geoms = grid_table["bounds_shapely"].values
+    linked = (grid_table["grid_level"]!="C").values
+
+    removed_datasets = set(removed_datasets)
+    removed_granules = set(removed_granules)
+    if added_datasets is not None:
+        removed_datasets.update(added_datasets["conceptid"])
+    if added_granules is not None:
+        removed_granules.update(added_granules["conceptid"])
+
+    # the granules of removed datasets go too, unless they are being re-added
+    gone = dataset_table.loc[
+        dataset_table["conceptid"].isin(list(removed_datasets)), "short_name"]
+    if added_datasets is not None:
+        gone = gone[~gone.isin(added_datasets["short_name"])]
+    removed_granules.update(granules_table.loc[
+        granules_table["collection_short_name"].isin(gone), "conceptid"])
+
+    def get_counts(counts, ix_lists, removed, added):
+        # A and B count their lists; C loses the removed rows, gains the added
+        counts = np.array(counts)
+        counts[linked] = [len(ix) for ix, l in zip(ix_lists, linked) if l]
+        counts[~linked] -= count_cells(cell_geoms[~linked], removed)
+        if added is not None:
+            counts[~linked] += count_cells(cell_geoms[~linked], added)
+        return(counts)
+
+    # DATASETS
+    drop = get_removed_rows(dataset_table, removed_datasets)
+    dataset_ix = remap_locator_ix(
+        grid_table["dataset_locator_ix"], len(dataset_table), drop)
+    removed = dataset_table.iloc[drop]
+    dataset_table = append_rows(dataset_table, added_datasets, drop)
+    dataset_ix = extend_locator_ix(
+        dataset_ix, cell_geoms, dataset_table, len(dataset_table)-(
+            0 if added_datasets is None else len(added_datasets)), linked)
+    grid_table["dataset_count"] = get_counts(
+        grid_table["dataset_count"], dataset_ix, removed, added_datasets)
+
+    conceptids = dataset_table["conceptid"].values
+    grid_table["dataset_locator_ix"] = dataset_ix
+    grid_table["dataset_conceptid"] = [conceptids[ix].tolist() for ix in
+                                       dataset_ix]
+
+    # GRANULES
+    drop = get_removed_rows(granules_table, removed_granules)
+    granule_ix = remap_locator_ix(
+        grid_table["granule_locator_ix"], len(granules_table), drop)
+    removed = granules_table.iloc[drop]
+    granules_table = append_rows(granules_table, added_granules, drop)
+    granule_ix = extend_locator_ix(
+        granule_ix, cell_geoms, granules_table, len(granules_table)-(
+            0 if added_granules is None else len(added_granules)), linked)
+    grid_table["granule_count"] = get_counts(
+        grid_table["granule_count"], granule_ix, removed, added_granules)
+    grid_table["granule_locator_ix"] = granule_ix
+
+    return((grid_table, dataset_table, granules_table))
+
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Simplified geometry for the map, at a level of detail for each zoom
+
+##############################################################################
+
+Leaflet draws every vertex it's given at every zoom, and every vertex goes
+over the widget comm as JSON first. The study domain has 46,000 vertices
+(2.1 MB of GeoJSON), far more than a screen can show below zoom 9 or so.
+This makes simplified versions of polygons at the tolerances of a few zooms
+and keeps them in an .npz file; the map draws the one for its zoom:
+
+    python lod.py    # data/ABoVE_Study_Domain/*.json -> data/above_domain_lod.npz
+                     # data/above_grid_table_*.npz -> data/above_grid_lod.npz
+
+The grid's A and B cells are quadrilaterals, so they have no vertices to
+lose; their levels only round the corners to fewer decimals, but they come
+from the same arcs, so neighbouring cells still meet.
+
+Simplifying each polygon on its own would open gaps and overlaps between
+neighbours, e.g. between the core and extended regions. So the rings are cut
+into arcs where polygons meet, each arc is simplified once, and every ring
+is put back together from the same simplified arcs (as in TopoJSON).
+"""
+
+import json
+import numpy as np
+import shapely
+
+# the zooms up to which each level of detail is drawn; above the last, the
+#   map gets the geometry as it was
+default_zooms = (3, 5, 7, 9)
+
+
+def get_tolerance(zoom, pixels=0.5):
+    """The degrees of longitude covered by some pixels at a Leaflet zoom."""
+    return(pixels*360./(256*2**zoom))
+
+
+def get_decimals(tolerance):
+    """Decimal places that keep coordinates to a tenth of the tolerance."""
+    return(max(0, int(np.ceil(-np.log10(tolerance/10.)))))
+
+
+def round_coordinates(coordinates, decimals):
+    """Rounds the (nested) coordinates of a GeoJSON geometry."""
+    if isinstance(coordinates[0], (int, float)):
+        return([round(c, decimals) for c in coordinates])
+    return([round_coordinates(c, decimals) for c in coordinates])
+
+
+"""
+------------------------------------------------------------------------------
+Arcs
+------------------------------------------------------------------------------
+"""
+
+
+def to_multipolygons(geometries):
+    """Takes Polygons or MultiPolygons; returns an array of MultiPolygons."""
+    multipolygons = np.empty(len(geometries), dtype=object)
+    multipolygons[:] = [
+        shapely.multipolygons(shapely.get_parts(g)) for g in geometries]
+    return(multipolygons)
+
+
+def snap_neighbours(geometries, tolerance=1e-6):
+    """
+    Snaps each geometry to those it touches, so that a border drawn with
+    different vertices on its two sides gets the same vertices on both.
+    """
+    snapped = geometries.copy()
+    tree = shapely.STRtree(geometries)
+    for i, j in zip(*tree.query(
+            geometries, predicate="dwithin", distance=tolerance)):
+        if i!=j:
+            snapped[i] = shapely.snap(snapped[i], snapped[j], tolerance)
+    # snapping a MultiPolygon of one part gives back a Polygon
+    return(to_multipolygons(snapped))
+
+
+def get_rings(geometries):
+    """
+    Takes an array of (Multi)Polygons; returns the unique points, the point
+    ids of each ring (not closed), and the ragged offsets of shapely's
+    to_ragged_array: rings per polygon and polygons per geometry.
+    """
+    kind, coords, (rings, polygons, parts) = shapely.to_ragged_array(
+        to_multipolygons(geometries))
+
+    points, ids = np.unique(coords, axis=0, return_inverse=True)
+    ids = ids.ravel()
+    ring_ids = [ids[a:b-1] for a, b in zip(rings[:-1], rings[1:])]
+
+    return(points, ring_ids, polygons, parts)
+
+
+def get_junctions(points, ring_ids):
+    """
+    Marks the points where rings meet: those that have different neighbours
+    in different rings (or in different places in one ring).
+    """
+    ids = np.concatenate(ring_ids)
+    before = np.concatenate([np.roll(r, 1) for r in ring_ids])
+    after = np.concatenate([np.roll(r, -1) for r in ring_ids])
+    pairs = np.unique(np.stack([
+        ids, np.minimum(before, after), np.maximum(before, after)], axis=1),
+        axis=0)
+    return(np.bincount(pairs[:, 0], minlength=len(points)) > 1)
+
+
+def get_arcs(ring_ids, junctions, max_points=256):
+    """
+    Cuts the rings into arcs at the junctions, and every max_points along
+    the way, so an arc that has to be simplified less (see Topology) is a
+    short one. Returns the arcs (point ids, each once however many rings
+    it's on) and, for each ring, a list of (arc, reversed) to put it back
+    together.
+    """
+    arcs, keys, rings = [], {}, []
+
+    def add(arc):
+        forward, backward = tuple(arc), tuple(arc[::-1])
+        key = min(forward, backward)
+        if key not in keys:
+            cuts = list(range(0, len(key)-1, max_points-1))+[len(key)-1]
+            keys[key] = list(range(len(arcs), len(arcs)+len(cuts)-1))
+            arcs.extend(np.array(key[a:b+1]) for a, b in zip(cuts[:-1], cuts[1:]))
+        if forward==key:
+            return([(arc, False) for arc in keys[key]])
+        return([(arc, True) for arc in keys[key][::-1]])
+
+    for ring in ring_ids:
+        cuts = np.flatnonzero(junctions[ring])
+
+        if len(cuts)==0:
+            # a ring on its own, or the same all the way round as another:
+            #   start it at its lowest point, going the same way every time
+            ring = np.roll(ring, -np.argmin(ring))
+            rings.append(add(np.append(ring, ring[0])))
+            continue
+
+        ring = np.roll(ring, -cuts[0])
+        cuts = np.append(cuts-cuts[0], len(ring))
+        ring = np.append(ring, ring[0])
+        rings.append([piece for a, b in zip(cuts[:-1], cuts[1:])
+                      for piece in add(ring[a:b+1])])
+
+    return(arcs, rings)
+
+
+"""
+------------------------------------------------------------------------------
+Simplifying
+------------------------------------------------------------------------------
+"""
+
+
+class Topology(object):
+    """
+    (Multi)Polygons as shared arcs, which can be simplified to any tolerance
+    without gaps or overlaps where the polygons meet.
+    """
+
+    def __init__(self, geometries):
+        self.geometries = snap_neighbours(to_multipolygons(geometries))
+        self.points, ring_ids, self.polygons, self.parts = get_rings(
+            self.geometries)
+        self.arcs, self.rings = get_arcs(
+            ring_ids, get_junctions(self.points, ring_ids))
+        self.lines = shapely.linestrings(
+            self.points[np.concatenate(self.arcs)],
+            indices=np.repeat(np.arange(len(self.arcs)),
+                              [len(arc) for arc in self.arcs]))
+
+    def get_crossings(self, simple):
+        """
+        Marks the simplified arcs that cross themselves, or meet another arc
+        anywhere that the two didn't meet before (unless they're the same).
+        """
+        bad = ~shapely.is_simple(simple) & (shapely.get_num_points(simple)>3)
+
+        a, b = shapely.STRtree(simple).query(simple, predicate="intersects")
+        a, b = a[a<b], b[a<b]
+        before = shapely.buffer(
+            shapely.intersection(self.lines[a], self.lines[b]), 1e-9)
+        after = shapely.intersection(simple[a], simple[b])
+        # two sides of a border that were drawn with different vertices may
+        #   both simplify to the same line, which is fine
+        crossed = ~shapely.covers(before, after) & \
+            ~shapely.equals(simple[a], simple[b])
+        bad[a[crossed]] = True
+        bad[b[crossed]] = True
+        return(bad)
+
+    def simplify_arcs(self, tolerance, passes=20):
+        """
+        Simplifies every arc to tolerance (Douglas-Peucker, which keeps the
+        ends, so the arcs still meet at the junctions). Arcs that cross
+        another after that are simplified again with a quarter of their
+        tolerance, and so on, until none do.
+        """
+        tolerances = np.full(len(self.arcs), float(tolerance))
+        for i in range(passes):
+            simple = shapely.simplify(
+                self.lines, tolerances, preserve_topology=False)
+            bad = self.get_crossings(simple)
+            if not bad.any():
+                break
+            tolerances[bad] /= 4
+        return(simple)
+
+    def simplify(self, tolerance):
+        """
+        Returns the geometries simplified to tolerance, as MultiPolygons.
+        Rings that collapse or are smaller than a square of the tolerance
+        are dropped, along with the holes of dropped exteriors. Any geometry
+        that's still invalid is simplified on its own instead; returns the
+        number of those too.
+        """
+        simple = [shapely.get_coordinates(l)
+                  for l in self.simplify_arcs(tolerance)]
+
+        rings = []
+        for pieces in self.rings:
+            ring = np.concatenate([
+                (simple[arc][::-1] if backward else simple[arc])[1:]
+                for arc, backward in pieces])
+            ring = np.concatenate([ring[-1:], ring])
+            keep = len(ring) >= 4 and \
+                abs(shapely.area(shapely.polygons(ring))) >= tolerance**2
+            rings.append(ring if keep else None)
+
+        geometries, fixed = [], 0
+        for g in range(len(self.parts)-1):
+            polygons = []
+            for p in range(self.parts[g], self.parts[g+1]):
+                first, last = self.polygons[p], self.polygons[p+1]
+                if rings[first] is None:
+                    continue
+                holes = [shapely.linearrings(r) for r in rings[first+1:last]
+                         if r is not None]
+                polygons.append(shapely.polygons(rings[first], holes or None))
+
+            geometry = shapely.multipolygons(polygons)
+            if not shapely.is_valid(geometry):
+                geometry = shapely.simplify(self.geometries[g], tolerance)
+                fixed += 1
+            geometries.append(geometry)
+
+        return(to_multipolygons(geometries), fixed)
+
+
+"""
+------------------------------------------------------------------------------
+Levels of detail
+------------------------------------------------------------------------------
+"""
+
+
+def encode_level(geometries, decimals):
+    """
+    Returns the arrays of one level: the coordinates, rounded to decimals
+    and stored as integer steps from the one before (which compress well),
+    and to_ragged_array's offsets.
+    """
+    kind, coords, offsets = shapely.to_ragged_array(geometries)
+    coords = np.round(coords*10**decimals).astype(np.int64)
+    return({"coords": np.diff(coords, axis=0, prepend=0),
+            "rings": offsets[0].astype(np.int32),
+            "polygons": offsets[1].astype(np.int32),
+            "parts": offsets[2].astype(np.int32)})
+
+
+def save_lods(path, geometries, properties, zooms=default_zooms,
+              full_decimals=8):
+    """
+    Writes geometries (Polygons or MultiPolygons) to an .npz file at path, as
+    they are and simplified for each of zooms, with a JSON list of their
+    GeoJSON properties.
+    """
+    from store import replace_file
+
+    topology = Topology(geometries)
+    arrays, levels = {}, []
+
+    for zoom in list(zooms)+[None]:
+        if zoom is None:
+            simple, decimals = topology.geometries, full_decimals
+        else:
+            tolerance = get_tolerance(zoom)
+            simple, fixed = topology.simplify(tolerance)
+            decimals = get_decimals(tolerance)
+
+        name = "level%d" % len(levels)
+        for key, array in encode_level(simple, decimals).items():
+            arrays[name+"."+key] = array
+        levels.append({"zoom": zoom, "decimals": decimals})
+
+    meta = json.dumps({"levels": levels, "properties": properties}).encode()
+    arrays["__meta__"] = np.frombuffer(meta, dtype=np.uint8)
+
+    replace_file(path, lambda output: np.savez_compressed(output, **arrays), False)
+
+
+class LevelsOfDetail(object):
+    """
+    Geometries at several levels of detail, read from a file written by
+    save_lods. get_geojson(zoom) returns the FeatureCollection for a zoom;
+    each level's is made the first time it's asked for.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as npz:
+            meta = json.loads(npz["__meta__"].tobytes().decode())
+            self.levels = meta["levels"]
+            self.properties = meta["properties"]
+            self.arrays = [{key: npz["level%d.%s" % (i, key)] for key in
+                            ["coords", "rings", "polygons", "parts"]}
+                           for i in range(len(self.levels))]
+        self.features = {}
+        self.indexes = {}
+
+    def get_level(self, zoom):
+        """The index of the level drawn at zoom."""
+        for i, level in enumerate(self.levels):
+            if level["zoom"] is None or zoom <= level["zoom"]:
+                return(i)
+        return(len(self.levels)-1)
+
+    def get_geometries(self, level):
+        """
+        Returns the GeoJSON geometries of a level: MultiPolygons, or Polygons
+        for those of one part.
+        """
+        arrays, decimals = self.arrays[level], self.levels[level]["decimals"]
+        coords = np.cumsum(arrays["coords"], axis=0)
+        coords = np.round(coords/10.**decimals, decimals).tolist()
+        rings = arrays["rings"].tolist()
+        polygons = arrays["polygons"].tolist()
+        parts = arrays["parts"].tolist()
+
+        rings = [coords[a:b] for a, b in zip(rings[:-1], rings[1:])]
+        polygons = [rings[a:b] for a, b in zip(polygons[:-1], polygons[1:])]
+        return([{"type": "Polygon", "coordinates": polygons[a]} if b-a==1 else
+                {"type": "MultiPolygon", "coordinates": polygons[a:b]}
+                for a, b in zip(parts[:-1], parts[1:])])
+
+    def get_geojson(self, zoom):
+        """Returns the FeatureCollection drawn at zoom."""
+        level = self.get_level(zoom)
+        if level not in self.features:
+            self.features[level] = {
+                "type": "FeatureCollection",
+                "features": [{
+                    "type": "Feature",
+                    "geometry": geometry,
+                    "properties": properties
+                } for geometry, properties in zip(
+                    self.get_geometries(level), self.properties)]}
+        return(self.features[level])
+
+    def get_index(self, zoom, key):
+        """{properties[key]: GeoJSON geometry} of the features drawn at zoom."""
+        level = self.get_level(zoom)
+        if (level, key) not in self.indexes:
+            self.indexes[(level, key)] = {
+                feature["properties"][key]: feature["geometry"]
+                for feature in self.get_geojson(zoom)["features"]}
+        return(self.indexes[(level, key)])
+
+
+def convert_domain(data):
+    """Makes above_domain_lod.npz from the ABoVE_Study_Domain GeoJSON."""
+    from shapely.geometry import shape
+
+    with open(data+"ABoVE_Study_Domain/ABoVE_Study_Domain.json") as f:
+        features = json.load(f)["features"]
+    save_lods(data+"above_domain_lod.npz",
+              [shape(f["geometry"]) for f in features],
+              [f["properties"] for f in features])
+
+
+def convert_grid(data, levels=("A", "B"), full_decimals=5):
+    """
+    Makes above_grid_lod.npz from the grid table's cells of levels, with
+    their grid_id and grid_level; the full level's corners are rounded to
+    full_decimals (about a metre), as the map always got them.
+    """
+    from catalog import Catalog
+
+    grid = Catalog(data).grid
+    rows = np.flatnonzero(np.isin(grid.frame["grid_level"].values, levels))
+    save_lods(data+"above_grid_lod.npz",
+              grid.get_shapes("geometry", rows),
+              [{"grid_id": grid_id, "grid_level": level} for grid_id, level in
+               zip(grid.frame["grid_id"].values[rows],
+                   grid.frame["grid_level"].values[rows])],
+              full_decimals=full_decimals)
+
+
+if __name__=="__main__":
+    convert_domain("data/")
+    convert_grid("data/")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Search the ABoVE catalog from the command line (see Catalog.query)
+
+##############################################################################
+
+Results stream to stdout as NDJSON (default) or CSV, one line per matching
+dataset or granule. With --aoi, every area of interest in a GeoJSON file
+(a FeatureCollection, or one feature or geometry per line) is searched in
+turn and each result line gets the AOI's id:
+
+    python query.py --bbox -150 60 -140 66 --start 2017-06-01 --end 2017-09-01
+    python query.py --aoi sites.geojson --format csv > granules.csv
+    python query.py --datasets --tiles Bh006v018 Bh007v018
+    python query.py --datasets --text permafrost --tiles Bh006v018
+
+"""
+
+import io
+import sys
+import csv
+import json
+import argparse
+
+from itertools import chain
+
+from catalog import Catalog
+from timing import timings
+
+
+"""
+------------------------------------------------------------------------------
+Areas of interest
+------------------------------------------------------------------------------
+"""
+
+
+def get_aoi_id(feature, i):
+    """The feature's id, its properties' id or name, or else its position."""
+    properties = feature.get("properties") or {}
+    for aoi_id in [feature.get("id"), properties.get("id"), properties.get("name")]:
+        if aoi_id is not None:
+            return(aoi_id)
+    return(i)
+
+
+def read_aois(lines):
+    """
+    Yields (aoi_id, GeoJSON geometry) from a GeoJSON FeatureCollection, or
+    from lines that each hold a feature or a geometry. Lines are read as
+    they come, so a long NDJSON file never has to fit in memory.
+    """
+
+    lines = iter(lines)
+    for first in lines:
+        if first.strip():
+            break
+    else:
+        return
+
+    try:
+        document = json.loads(first)
+    except ValueError:
+        # not one JSON object per line; the whole input is one document
+        document = json.loads(first+"".join(lines))
+        lines = iter([])
+
+    if document.get("type")=="FeatureCollection":
+        features = document["features"]
+    else:
+        features = chain([document], (json.loads(l) for l in lines if l.strip()))
+
+    for i, feature in enumerate(features):
+        yield((get_aoi_id(feature, i), feature.get("geometry", feature)))
+
+
+"""
+------------------------------------------------------------------------------
+Output
+------------------------------------------------------------------------------
+"""
+
+
+class Writer(object):
+    """
+    Writes locator table rows as NDJSON or CSV lines. Every result is one of
+    the table's rows, so each row is formatted once up front and the result
+    lines only join those strings, with the AOI's id in front.
+    """
+
+    def __init__(self, table, output, fmt="ndjson"):
+        self.output = output
+        self.fmt = fmt
+        self.header = True
+        self.columns = table.columns.tolist()
+
+        if fmt=="csv":
+            self.rows = [self.get_csv_line(row) for row in
+                         table.astype(object).where(table.notna(), "").values]
+        else:
+            # to_json escapes newlines in strings, so the lines split cleanly
+            self.rows = table.to_json(orient="records", lines=True).splitlines()
+
+    def get_csv_line(self, values):
+        """ """
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="").writerow(values)
+        return(buffer.getvalue())
+
+    def write(self, aoi_id, ix):
+        """Writes the rows ix of the table, for aoi_id (None for no AOI)."""
+        rows = self.rows
+
+        if self.fmt=="csv":
+            if self.header:
+                names = self.columns if aoi_id is None else ["aoi"]+self.columns
+                self.output.write(self.get_csv_line(names)+"\n")
+                self.header = False
+            start = "" if aoi_id is None else self.get_csv_line([aoi_id])+","
+            self.output.write("".join([start+rows[i]+"\n" for i in ix]))
+
+        elif aoi_id is None:
+            self.output.write("".join([rows[i]+"\n" for i in ix]))
+
+        else:
+            start = '{"aoi":'+json.dumps(aoi_id)+","
+            self.output.write("".join([start+rows[i][1:]+"\n" for i in ix]))
+
+        return(len(ix))
+
+
+@timings.timed()
+def write_results(results, table, output, fmt="ndjson"):
+    """
+    Writes (aoi_id, ix) pairs, rows of table, to output as they come; aoi_id
+    None means the results aren't per AOI. Returns the number of results.
+    """
+    writer = Writer(table, output, fmt)
+    return(sum(writer.write(aoi_id, ix) for aoi_id, ix in results))
+
+
+"""
+------------------------------------------------------------------------------
+Command line
+------------------------------------------------------------------------------
+"""
+
+
+def get_parser():
+    """ """
+    parser = argparse.ArgumentParser(
+        description="Search the ABoVE datasets or granules.")
+    parser.add_argument("--datasets", action="store_true",
+                        help="search datasets instead of granules")
+    parser.add_argument("--aoi", metavar="FILE",
+                        help="GeoJSON areas of interest ('-' for stdin)")
+    parser.add_argument("--bbox", nargs=4, type=float,
+                        metavar=("MINLON", "MINLAT", "MAXLON", "MAXLAT"))
+    parser.add_argument("--geometry", metavar="WKT_OR_GEOJSON")
+    parser.add_argument("--tiles", nargs="+", metavar="GRID_ID")
+    parser.add_argument("--start", metavar="TIME", help="ISO 8601")
+    parser.add_argument("--end", metavar="TIME", help="ISO 8601")
+    parser.add_argument("--short-name", nargs="+", dest="short_name")
+    parser.add_argument("--text", metavar="WORDS",
+                        help="words in the dataset titles or keywords")
+    parser.add_argument("--params", nargs="+", metavar="PARAMETER",
+                        help="granule parameters, e.g. PERMAFROST")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--data", help="folder with the .npz tables")
+    parser.add_argument("--timings", metavar="FILE",
+                        help="append the searches' timings to a JSON lines "
+                             "file (see timing.py)")
+    return(parser)
+
+
+def run(catalog, args, output):
+    """Searches the catalog for the query in args; writes the results."""
+    search = "datasets" if args.datasets else "granules"
+    geometry = args.geometry
+    if geometry is not None and geometry.lstrip().startswith("{"):
+        geometry = json.loads(geometry)
+    filters = dict(tiles=args.tiles, start=args.start, end=args.end,
+                   short_name=args.short_name, text=args.text,
+                   params=args.params)
+
+    table = catalog.get_locator_table(search)
+
+    if args.aoi is None:
+        results = [(None, catalog.get_query_ix(
+            search, geometry, args.bbox, **filters))]
+        return(write_results(results, table, output, args.format))
+
+    source = sys.stdin if args.aoi=="-" else open(args.aoi)
+    with source:
+        results = catalog.query_many_ix(read_aois(source), search, **filters)
+        return(write_results(results, table, output, args.format))
+
+
+def main(argv=None, output=sys.stdout):
+    """ """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.aoi is not None and (args.bbox or args.geometry):
+        parser.error("--aoi can't be used with --bbox or --geometry")
+
+    catalog = Catalog() if args.data is None else Catalog(args.data)
+
+    if args.timings is None:
+        return(run(catalog, args, output))
+    timings.enable()
+    try:
+        return(run(catalog, args, output))
+    finally:
+        timings.dump(args.timings)
+
+
+if __name__=="__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # e.g. piped into head
+        sys.stderr.close()
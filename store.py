@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Reading and writing the ABoVE tables
+
+##############################################################################
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import shapely
+
+try:
+    import _pickle as pickle
+except ModuleNotFoundError:
+    import pickle
+
+
+def get_backup_path(path):
+    """data/above_grid_table_ab.pkl -> data/above_grid_table_ab-backup.pkl"""
+    stem, ext = os.path.splitext(path)
+    return(stem+"-backup"+ext)
+
+
+def replace_file(path, write, backup=True):
+    """
+    Calls write(file) on a temporary file next to path, then renames it over
+    path, so readers only ever see the old or the new version. The old
+    version is kept as the -backup file.
+    """
+
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    mode = os.stat(path).st_mode if os.path.exists(path) else 0o644
+    try:
+        os.chmod(tmp, mode & 0o777)
+        with os.fdopen(fd, "wb") as output:
+            write(output)
+            output.flush()
+            os.fsync(output.fileno())
+
+        if backup and os.path.exists(path):
+            fd, tmp_backup = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            os.close(fd)
+            shutil.copy2(path, tmp_backup)
+            os.replace(tmp_backup, get_backup_path(path))
+
+        os.replace(tmp, path)
+
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def dump_pickle(obj, path, backup=True):
+    """Pickles obj to path atomically; see replace_file."""
+    replace_file(path, lambda output: pickle.dump(obj, output, -1), backup)
+
+
+def load_pickle(path):
+    """ """
+    with open(path, 'rb') as input:
+        return(pickle.load(input))
+
+
+"""
+------------------------------------------------------------------------------
+Columnar tables
+
+The pickled tables hold Python objects (Shapely boxes, lists, GeoJSON dicts)
+that are rebuilt one by one every time they're loaded. The .npz tables keep
+every column in flat NumPy arrays instead:
+
+    float, int   one array
+    str          UTF-8 bytes of every value joined, plus offsets
+    strlist      dictionary-encoded: a str vocabulary, plus a CSR of codes
+    intlist      a CSR (offsets and values), e.g. the grid's locator indices
+    wkb          a CSR of WKB bytes, decoded to Shapely only on request
+
+Locator tables don't store their boxes at all; they're made from the bbox
+columns when they're drawn.
+------------------------------------------------------------------------------
+"""
+
+
+class CSR(object):
+    """Row i of a ragged column is values[offsets[i]:offsets[i+1]]."""
+
+    __slots__ = ("offsets", "values")
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_lists(cls, lists, dtype=np.int64):
+        """ """
+        lengths = np.fromiter((len(l) for l in lists), np.int64, len(lists))
+        offsets = np.zeros(len(lists)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.fromiter(
+            (v for l in lists for v in l), dtype=dtype, count=offsets[-1])
+        return(cls(offsets, values))
+
+    def __len__(self):
+        return(len(self.offsets)-1)
+
+    def __getitem__(self, i):
+        return(self.values[self.offsets[i]:self.offsets[i+1]])
+
+    def lengths(self):
+        """ """
+        return(np.diff(self.offsets))
+
+    def take(self, rows):
+        """Returns the values of all of the rows, concatenated."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.offsets[rows], self.offsets[rows+1]
+        lengths = ends-starts
+        shift = np.repeat(starts-np.cumsum(lengths)+lengths, lengths)
+        return(self.values[shift+np.arange(lengths.sum())])
+
+    def tolist(self):
+        """ """
+        return([self[i].tolist() for i in range(len(self))])
+
+
+def encode_strings(values):
+    """Returns UTF-8 data, offsets and a null mask for a list of strings."""
+    null = np.array([v is None for v in values], dtype=bool)
+    encoded = [b"" if v is None else str(v).encode() for v in values]
+    offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return(data, offsets, null)
+
+
+def decode_strings(data, offsets, null):
+    """ """
+    raw = data.tobytes()
+    ends = offsets.tolist()
+    values = [raw[a:b].decode() for a, b in zip(ends[:-1], ends[1:])]
+    for i in np.flatnonzero(null):
+        values[i] = None
+    return(values)
+
+
+def encode_strlists(lists):
+    """Returns the vocabulary and a CSR of codes for lists of strings."""
+    codes = {}
+    coded = [[codes.setdefault(v, len(codes)) for v in l or []] for l in lists]
+    return(list(codes), CSR.from_lists(coded, np.int32))
+
+
+class Columns(object):
+    """
+    A table read from a .npz file. Scalar columns are in the DataFrame
+    frame; list columns are CSRs in ragged (strlists as codes into vocab);
+    geometries stay WKB until get_shape or get_boxes asks for them.
+    """
+
+    def __init__(self, frame, ragged=None, vocab=None, wkb=None):
+        self.frame = frame
+        self.ragged = ragged or {}
+        self.vocab = vocab or {}
+        self.wkb = wkb or {}
+
+    def __len__(self):
+        return(len(self.frame))
+
+    def get_list(self, column, i):
+        """Returns row i of a list column as a Python list."""
+        values = self.ragged[column][i]
+        if column in self.vocab:
+            return([self.vocab[column][v] for v in values])
+        return(values.tolist())
+
+    def get_shape(self, column, i):
+        """Decodes row i of a WKB column to a Shapely geometry."""
+        return(shapely.from_wkb(self.wkb[column][i].tobytes()))
+
+    def get_shapes(self, column, rows=slice(None)):
+        """Decodes the rows of a WKB column to an array of geometries."""
+        csr = self.wkb[column]
+        rows = np.arange(len(csr))[rows]
+        return(shapely.from_wkb([csr[i].tobytes() for i in rows]))
+
+    def get_bounds(self, rows=slice(None)):
+        """Returns the (N, 4) minlon, minlat, maxlon, maxlat of the rows."""
+        return(self.frame[["minlon", "minlat", "maxlon", "maxlat"]].values[rows])
+
+    def get_boxes(self, rows=slice(None)):
+        """
+        Makes Shapely boxes for the rows from the bbox columns, in two parts
+        for boxes across the antimeridian (see linkage.get_envelopes).
+        """
+        from linkage import get_envelopes
+        return(get_envelopes(self.get_bounds(rows)))
+
+
+def save_columns(path, table, kinds):
+    """
+    Writes the columns of table named in kinds ({column: kind}) to an .npz
+    file at path, atomically (see replace_file).
+    """
+
+    arrays = {}
+    for column, kind in kinds.items():
+        values = table[column].tolist()
+
+        if kind in ("float", "int"):
+            dtype = np.float64 if kind=="float" else np.int64
+            arrays[column] = np.array(
+                [np.nan if v is None else v for v in values], dtype=dtype)
+
+        elif kind=="str":
+            data, offsets, null = encode_strings(values)
+            arrays.update({column+".data": data,
+                           column+".offsets": offsets,
+                           column+".null": null})
+
+        elif kind=="strlist":
+            vocab, csr = encode_strlists(values)
+            data, offsets, null = encode_strings(vocab)
+            arrays.update({column+".vocab.data": data,
+                           column+".vocab.offsets": offsets,
+                           column+".offsets": csr.offsets,
+                           column+".values": csr.values})
+
+        elif kind=="intlist":
+            csr = CSR.from_lists(values, np.int32)
+            arrays.update({column+".offsets": csr.offsets,
+                           column+".values": csr.values})
+
+        elif kind=="wkb":
+            wkb = [shapely.to_wkb(g) for g in values]
+            csr = CSR.from_lists(wkb, np.uint8)
+            arrays.update({column+".offsets": csr.offsets,
+                           column+".values": csr.values})
+
+        else:
+            raise ValueError("Unknown column kind: "+kind)
+
+    schema = json.dumps(list(kinds.items())).encode()
+    arrays["__schema__"] = np.frombuffer(schema, dtype=np.uint8)
+
+    replace_file(path, lambda output: np.savez(output, **arrays), False)
+
+
+def load_columns(path):
+    """Reads an .npz file written by save_columns."""
+
+    with np.load(path) as npz:
+        kinds = json.loads(npz["__schema__"].tobytes().decode())
+        scalars, ragged, vocab, wkb = {}, {}, {}, {}
+
+        for column, kind in kinds:
+            if kind in ("float", "int"):
+                scalars[column] = npz[column]
+
+            elif kind=="str":
+                scalars[column] = decode_strings(
+                    npz[column+".data"],
+                    npz[column+".offsets"],
+                    npz[column+".null"])
+
+            else:
+                csr = CSR(npz[column+".offsets"], npz[column+".values"])
+                if kind=="wkb":
+                    wkb[column] = csr
+                else:
+                    ragged[column] = csr
+
+                if kind=="strlist":
+                    vocab[column] = decode_strings(
+                        npz[column+".vocab.data"],
+                        npz[column+".vocab.offsets"],
+                        np.zeros(len(npz[column+".vocab.offsets"])-1, bool))
+
+    return(Columns(pd.DataFrame(scalars), ragged, vocab, wkb))
+
+
+"""
+------------------------------------------------------------------------------
+The ABoVE tables
+------------------------------------------------------------------------------
+"""
+
+dataset_kinds = {
+    "title": "str",
+    "archive": "str",
+    "conceptid": "str",
+    "short_name": "str",
+    "start_time": "str",
+    "end_time": "str",
+    "minlon": "float",
+    "minlat": "float",
+    "maxlon": "float",
+    "maxlat": "float",
+    "progress": "str",
+    "science_keywords": "strlist",
+    "url_landingpage": "str",
+    "url_documentation": "str",
+    "url_datapool": "str",
+    "url_sdat": "str",
+    "url_thredds": "str",
+}
+
+granule_kinds = {
+    "archive": "str",
+    "collection_short_name": "str",
+    "conceptid": "str",
+    "granuleid": "str",
+    "granule_size": "float",
+    "granule_files": "float",
+    "granule_params": "strlist",
+    "start_time": "str",
+    "end_time": "str",
+    "minlon": "float",
+    "minlat": "float",
+    "maxlon": "float",
+    "maxlat": "float",
+    "url_datapool": "str",
+}
+
+# properties is rebuilt from the grid columns; dataset_conceptid from the
+# dataset table's conceptid and dataset_locator_ix
+grid_kinds = {
+    "geometry": "wkb",
+    "grid_level": "str",
+    "grid_id": "str",
+    "spatial_re": "str",
+    "ah": "int",
+    "av": "int",
+    "bh": "int",
+    "bv": "int",
+    "ch": "int",
+    "cv": "int",
+    "dataset_count": "int",
+    "dataset_locator_ix": "intlist",
+    "granule_count": "int",
+    "granule_locator_ix": "intlist",
+}
+
+
+def fix_granule_bounds(table):
+    """
+    Rows made by the original get_granules_table have the granule bbox
+    columns out of order: minlon=west, maxlon=south, minlat=north and
+    maxlat=east. In those, minlat (north) is above maxlat (an ABoVE
+    longitude) or maxlat is no latitude at all, which never happens in a
+    correct row; so tables that mix old rows with rows from cmr.ingest are
+    fixed row by row.
+    """
+
+    swapped = ((table["minlat"] > table["maxlat"]) |
+               (table["maxlat"].abs() > 90)).values
+    if not swapped.any():
+        return(table)
+
+    bounds = table[["minlon", "maxlon", "minlat", "maxlat"]].values.copy()
+    bounds[swapped] = bounds[swapped][:, [0, 3, 1, 2]]
+    return(table.assign(
+        minlon=bounds[:, 0],
+        maxlon=bounds[:, 1],
+        minlat=bounds[:, 2],
+        maxlat=bounds[:, 3]))
+
+
+def save_tables(data, dataset_table, granules_table, grid_table):
+    """Writes the three ABoVE tables to .npz files in the data folder."""
+
+    grid_table = grid_table.assign(geometry=grid_table["bounds_shapely"])
+
+    save_columns(data+"above_dataset_table.npz", dataset_table, dataset_kinds)
+    # tables from before granule_files don't know how many files there are
+    if "granule_files" not in granules_table:
+        granules_table = granules_table.assign(granule_files=np.nan)
+    save_columns(data+"above_granules_table.npz",
+                 fix_granule_bounds(granules_table), granule_kinds)
+    # named for its levels, e.g. above_grid_table_ab.npz
+    levels = "".join(sorted(set(grid_table["grid_level"]))).lower()
+    save_columns(data+"above_grid_table_%s.npz" % levels, grid_table, grid_kinds)
+
+
+def convert_pickles(data):
+    """Makes the .npz tables from the pickles in the data folder."""
+    save_tables(
+        data,
+        load_pickle(data+"above_dataset_table.pkl"),
+        load_pickle(data+"above_granules_table.pkl"),
+        load_pickle(data+"above_grid_table_ab.pkl"))
+
+
+if __name__=="__main__":
+    convert_pickles("data/")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+##############################################################################
+
+Latency of the app's callbacks and the catalog's searches, when asked for
+
+##############################################################################
+
+When a click feels slow, this says where the time went. It's off until
+enabled, and then each timed call (a map or table callback, a catalog
+search) keeps a record in a ring buffer: its total time, the time of each
+stage it marks (e.g. the search, the results table, the map layers, which
+is mostly sending them to the browser) and the sizes of the results:
+
+    from timing import timings
+    timings.enable()
+    ...                          # click around the app
+    timings.summary()            # p50/p95/p99 per call and stage, in ms
+    timings.dump("timings.jsonl")
+
+A dump has one record per line, for reading back with get_summary or
+pandas.read_json(path, lines=True). Calls made inside another timed call
+(e.g. get_tiles_ix in update_cell_clicked) get a record of their own, with
+the outer call as parent; its stages include their time.
+
+Disabled, a timed function costs one more Python call and an attribute
+lookup, and stage() returns straight away.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+from collections import deque
+from functools import wraps
+
+
+def get_size(result):
+    """
+    The number of rows in a result: its len, or a list of the lens of a
+    tuple's items; None when it has none.
+    """
+    if isinstance(result, tuple):
+        return([get_size(item) for item in result])
+    try:
+        return(len(result))
+    except TypeError:
+        return(None)
+
+
+class Timings(object):
+    """
+    The records of the last size timed calls, in a ring buffer. See timed
+    and stage; enable turns the recording on.
+    """
+
+    def __init__(self, size=10000, enabled=False):
+        self.enabled = enabled
+        self.records = deque(maxlen=size)
+        self.local = threading.local()
+
+    def enable(self, size=None):
+        """Starts recording, into a buffer of size records if given."""
+        if size is not None and size!=self.records.maxlen:
+            self.records = deque(self.records, maxlen=size)
+        self.enabled = True
+
+    def disable(self):
+        """ """
+        self.enabled = False
+
+    def clear(self):
+        """ """
+        self.records.clear()
+
+    def get_stack(self):
+        """The records of the calls running in this thread, innermost last."""
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return(stack)
+
+    def timed(self, name=None):
+        """
+        Decorates a function so that, while enabled, each call is recorded
+        under name (the function's qualified name if None), with the size
+        of its result (see get_size).
+        """
+
+        def decorate(function):
+            label = name or function.__qualname__
+
+            @wraps(function)
+            def call(*args, **kwargs):
+                if not self.enabled:
+                    return(function(*args, **kwargs))
+                record = self.start(label)
+                try:
+                    result = function(*args, **kwargs)
+                except BaseException as error:
+                    self.finish(record, error=type(error).__name__)
+                    raise
+                self.finish(record, get_size(result))
+                return(result)
+
+            return(call)
+        return(decorate)
+
+    def start(self, name):
+        """ """
+        stack = self.get_stack()
+        now = time.perf_counter()
+        record = {"call": name,
+                  "parent": stack[-1]["call"] if stack else None,
+                  "time": time.time(), "ms": None, "size": None,
+                  "error": None, "stages": [], "t0": now, "last": now}
+        stack.append(record)
+        return(record)
+
+    def finish(self, record, size=None, error=None):
+        """ """
+        now = time.perf_counter()
+        stack = self.get_stack()
+        if stack and stack[-1] is record:
+            stack.pop()
+        if record["stages"] and now>record["last"]:
+            record["stages"].append(["rest", (now-record["last"])*1e3, None])
+        record["ms"] = (now-record.pop("t0"))*1e3
+        record.pop("last")
+        record["size"], record["error"] = size, error
+        self.records.append(record)
+
+    def stage(self, name, size=None):
+        """
+        Marks the end of a stage of the innermost timed call: the time
+        since its last stage (or its start), and the size of the stage's
+        result if given.
+        """
+        if not self.enabled:
+            return
+        stack = self.get_stack()
+        if stack:
+            record = stack[-1]
+            now = time.perf_counter()
+            record["stages"].append([name, (now-record["last"])*1e3, size])
+            record["last"] = now
+
+    def get_records(self, name=None):
+        """The records (of the calls to name), oldest first."""
+        return([r for r in list(self.records) if name is None or r["call"]==name])
+
+    def summary(self, name=None):
+        """See get_summary."""
+        return(get_summary(self.get_records(name)))
+
+    def dump(self, path, clear=False):
+        """
+        Appends the records to a JSON lines file at path ("-" for stdout),
+        and forgets them if clear.
+        """
+        records = list(self.records)
+        output = sys.stdout if path=="-" else open(path, "a")
+        try:
+            for record in records:
+                output.write(json.dumps(record)+"\n")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if clear:
+            for i in range(len(records)):
+                self.records.popleft()
+        return(len(records))
+
+
+def get_summary(records):
+    """
+    A table of the count and the 50th, 95th and 99th percentile and
+    largest times (ms) of each call, in its "total" row, and of each of its
+    stages, with the median size of their results (of a tuple, its largest
+    item's). records are dicts (see Timings) or the lines of a dump.
+    """
+    import numpy as np
+    import pandas as pd
+
+    times, sizes = {}, {}
+    for record in records:
+        if isinstance(record, str):
+            record = json.loads(record)
+        rows = [("total", record["ms"], record["size"])]+[
+            tuple(stage) for stage in record["stages"]]
+        for stage, ms, size in rows:
+            key = (record["call"], stage)
+            times.setdefault(key, []).append(ms)
+            if isinstance(size, list):
+                size = max([s for s in size if s is not None], default=None)
+            if size is not None:
+                sizes.setdefault(key, []).append(size)
+
+    columns = ["call", "stage", "count", "p50", "p95", "p99", "max", "size"]
+    rows = []
+    for (call, stage), ms in times.items():
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        size = np.median(sizes[(call, stage)]) if (call, stage) in sizes else None
+        rows.append((call, stage, len(ms), p50, p95, p99, max(ms), size))
+    return(pd.DataFrame(rows, columns=columns))
+
+
+# the timings of the app and catalog; ABOVE_TIMINGS=1 enables them at import
+timings = Timings(enabled=os.environ.get("ABOVE_TIMINGS", "")=="1")